@@ -0,0 +1,154 @@
+# Admission control - per-session token buckets and a concurrency cap on
+# expensive (report/export) requests, rejecting fast with 429 + Retry-After
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+
+from metrics import metrics, route_template
+
+# The dashboard runs the same aggregations as the reports
+EXPENSIVE_PREFIXES = ("/api/reports", "/api/dashboard", "/api/export")
+
+# (refill per minute, burst) per route class
+RATE_LIMITS = {
+    "expensive": (
+        float(os.getenv("RATE_LIMIT_EXPENSIVE_PER_MINUTE", "20")),
+        float(os.getenv("RATE_LIMIT_EXPENSIVE_BURST", "5")),
+    ),
+    "write": (
+        float(os.getenv("RATE_LIMIT_WRITE_PER_MINUTE", "120")),
+        float(os.getenv("RATE_LIMIT_WRITE_BURST", "30")),
+    ),
+    "read": (
+        float(os.getenv("RATE_LIMIT_READ_PER_MINUTE", "300")),
+        float(os.getenv("RATE_LIMIT_READ_BURST", "60")),
+    ),
+}
+
+MAX_CONCURRENT_EXPENSIVE = int(os.getenv("MAX_CONCURRENT_EXPENSIVE", "2"))
+EXPENSIVE_QUEUE_SIZE = int(os.getenv("EXPENSIVE_QUEUE_SIZE", "8"))
+EXPENSIVE_QUEUE_TIMEOUT = float(os.getenv("EXPENSIVE_QUEUE_TIMEOUT", "2.0"))
+
+# Least recently used buckets are evicted beyond this many
+MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "10000"))
+
+
+def classify(method, path):
+    if path.startswith(EXPENSIVE_PREFIXES):
+        return "expensive"
+    if method not in ("GET", "HEAD", "OPTIONS"):
+        return "write"
+    return "read"
+
+
+def session_key(request):
+    session_token = request.cookies.get("session_token")
+    if not session_token:
+        auth_header = request.headers.get("Authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            session_token = auth_header.replace("Bearer ", "")
+    if session_token:
+        return f"session:{session_token}"
+    # Unauthenticated calls (login, health checks) are limited per client address
+    return f"client:{request.client.host if request.client else 'unknown'}"
+
+
+class TokenBucket:
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        # Returns 0 when admitted, otherwise seconds until a token is available
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        if self.rate <= 0:
+            return 60
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    def __init__(self):
+        # (session key, route class) -> bucket, least recently used first
+        self.buckets = OrderedDict()
+        self.expensive_slots = asyncio.Semaphore(MAX_CONCURRENT_EXPENSIVE)
+        self.expensive_waiting = 0
+
+    def check_rate(self, key, route_class):
+        now = time.monotonic()
+        bucket = self.buckets.get((key, route_class))
+        if bucket is None:
+            bucket = TokenBucket(*RATE_LIMITS[route_class])
+            self.buckets[(key, route_class)] = bucket
+            while len(self.buckets) > MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end((key, route_class))
+        return bucket.take(now)
+
+    async def acquire_expensive(self):
+        # Returns None when a slot was acquired, otherwise the rejection reason
+        if self.expensive_waiting >= EXPENSIVE_QUEUE_SIZE and self.expensive_slots.locked():
+            return "queue_full"
+        self.expensive_waiting += 1
+        try:
+            await asyncio.wait_for(self.expensive_slots.acquire(), EXPENSIVE_QUEUE_TIMEOUT)
+            return None
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        finally:
+            self.expensive_waiting -= 1
+
+    def release_expensive(self):
+        self.expensive_slots.release()
+
+
+def reject(reason, retry_after):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests, please retry shortly", "reason": reason},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class AdmissionMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, controller=None):
+        super().__init__(app)
+        self.controller = controller or AdmissionController()
+
+    async def dispatch(self, request, call_next):
+        if request.method == "OPTIONS" or not request.url.path.startswith("/api"):
+            return await call_next(request)
+
+        route_class = classify(request.method, request.url.path)
+        route = route_template(request.app, request.scope)
+
+        retry_after = self.controller.check_rate(session_key(request), route_class)
+        if retry_after:
+            metrics.inc("admission_rejections", route=route, route_class=route_class, reason="rate_limit")
+            return reject("rate_limit", retry_after)
+
+        if route_class != "expensive":
+            return await call_next(request)
+
+        reason = await self.controller.acquire_expensive()
+        if reason:
+            metrics.inc("admission_rejections", route=route, route_class=route_class, reason=reason)
+            return reject(reason, EXPENSIVE_QUEUE_TIMEOUT)
+        try:
+            return await call_next(request)
+        finally:
+            self.controller.release_expensive()
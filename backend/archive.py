@@ -0,0 +1,368 @@
+# Cold-data archive - closed financial years of sales, expenses and partner
+# payments move out of the hot collections into Arrow IPC files on local disk.
+# Reports read archived years through memory-mapped, zero-copy tables and merge
+# them with live data; restore moves a year back for corrections.
+#
+#   python archive.py list
+#   python archive.py archive --fiscal-year 2023    # FY2023-24
+#   python archive.py restore --fiscal-year 2023
+#
+# Set STUDIO to work on another studio's data; its files go under
+# ARCHIVE_DIR/studios/<studio>.
+#
+# Needs pyarrow, which is in requirements.txt. An install without it still runs
+# as long as nothing has been archived, and refuses to read archived years.
+#
+# The `archives` collection lists what is archived. Archiving first marks the
+# year "archiving", which stops servers writing to it, and snapshots it once they
+# have picked that up, so no write can land after the snapshot. It then writes the
+# files, marks them complete and deletes the hot documents only after servers
+# have switched to the files, so a report never counts a year twice or not at all.
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timezone
+
+from dotenv import load_dotenv
+from pymongo import InsertOne
+
+from storage import open_storage, studio_directory
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+FISCAL_YEAR_START_MONTH = int(os.getenv("FISCAL_YEAR_START_MONTH", "4"))
+MANIFEST_COLLECTION = "archives"
+# Servers reload the manifest this often; archive/restore wait longer than this
+# before touching hot data the manifest no longer or newly covers
+MANIFEST_TTL_SECONDS = 5
+SETTLE_SECONDS = float(os.getenv("ARCHIVE_SETTLE_SECONDS", "10"))
+BATCH_SIZE = 1000
+
+
+def _columns():
+    string, number, integer = pa.string(), pa.float64(), pa.int64()
+    timestamp = pa.timestamp("ms", tz="UTC")
+    common_tail = [("created_at", timestamp), ("updated_at", timestamp), ("extra", string)]
+    return {
+        "sales": [
+            ("id", string), ("shoot_id", integer), ("date", string), ("date_at", timestamp),
+            ("shoot_type", string), ("total_time_hrs", number), ("total_amount_inr", number),
+            ("received_by", string), ("payment_mode", string), ("cameraman", string),
+            ("cameraman_mobile", string), ("customer_name", string), ("city", string),
+        ] + common_tail,
+        "expenses": [
+            ("id", string), ("date", string), ("date_at", timestamp), ("expense_type", string),
+            ("amount_inr", number), ("description", string), ("paid_by", string), ("payment_mode", string),
+        ] + common_tail,
+        "partner_payments": [
+            ("id", string), ("date", string), ("date_at", timestamp), ("partner_id", string),
+            ("partner_name", string), ("amount_inr", number), ("month_year", string),
+            ("payment_mode", string), ("description", string),
+        ] + common_tail,
+    }
+
+
+ARCHIVED_COLLECTIONS = ("sales", "expenses", "partner_payments")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Archived data needs pyarrow - pip install pyarrow")
+
+
+def fiscal_year_bounds(fiscal_year):
+    # "YYYY-MM-DD" strings, end exclusive
+    start = date(fiscal_year, FISCAL_YEAR_START_MONTH, 1)
+    end = date(fiscal_year + 1, FISCAL_YEAR_START_MONTH, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def to_table(collection, documents):
+    columns = _columns()[collection]
+    names = [name for name, _ in columns if name != "extra"]
+    arrays = {name: [] for name, _ in columns}
+    for doc in documents:
+        for name in names:
+            arrays[name].append(doc.get(name))
+        # Anything outside the schema survives a round trip as JSON
+        extra = {key: value for key, value in doc.items() if key not in arrays and key not in ("_id", "deleted")}
+        arrays["extra"].append(json.dumps(extra, default=str) if extra else None)
+    return pa.table({name: pa.array(arrays[name], type=kind) for name, kind in columns})
+
+
+def from_table(table):
+    for row in table.to_pylist():
+        extra = row.pop("extra", None)
+        if extra:
+            row.update(json.loads(extra))
+        yield row
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Archive:
+    def __init__(self, storage, directory=None):
+        self.storage = storage
+        self.directory = directory or studio_directory(ARCHIVE_DIR, storage.studio)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._loaded_at = 0.0
+        self._tables = {}
+
+    def _manifest(self):
+        # Every entry, "archiving" ones included
+        with self._lock:
+            if self._entries is None or time.monotonic() - self._loaded_at > MANIFEST_TTL_SECONDS:
+                self._entries = list(self.storage.collection(MANIFEST_COLLECTION).find(
+                    {"status": {"$in": ["archiving", "complete"]}}
+                ))
+                self._loaded_at = time.monotonic()
+                # Drop mappings of years that were restored
+                paths = {entry["path"] for entry in self._entries if entry["status"] == "complete"}
+                self._tables = {path: table for path, table in self._tables.items() if path in paths}
+            return self._entries
+
+    def entries(self, collection=None):
+        # Archived years whose data has moved to the files
+        entries = [entry for entry in self._manifest() if entry["status"] == "complete"]
+        if entries:
+            require_pyarrow()
+        return [entry for entry in entries if collection is None or entry["collection"] == collection]
+
+    def fiscal_years(self, collection):
+        # Archived years missing from the hot collection, without touching the files
+        return sorted({
+            entry["fiscal_year"] for entry in self._manifest()
+            if entry["collection"] == collection and entry["status"] == "complete"
+        })
+
+    def locked(self, collection):
+        # (start, end) of years being or already archived - read-only
+        return [(entry["start"], entry["end"]) for entry in self._manifest() if entry["collection"] == collection]
+
+    def table(self, entry):
+        # Uncompressed IPC files map straight into memory; columns are views on the mapping
+        path = entry["path"]
+        with self._lock:
+            if path not in self._tables:
+                self._tables[path] = pa.ipc.open_file(pa.memory_map(os.path.join(self.directory, path), "r")).read_all()
+            return self._tables[path]
+
+    def covers(self, collection, day):
+        # Whether "YYYY-MM-DD" is in a year being or already archived
+        return any(start <= day < end for start, end in self.locked(collection))
+
+    def split(self, collection, start, end):
+        # Splits [start, end) into hot datetime segments and the archived entries overlapping it
+        start_key, end_key = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+        covered = sorted(
+            (entry for entry in self.entries(collection) if entry["start"] < end_key and entry["end"] > start_key),
+            key=lambda entry: entry["start"]
+        )
+        hot = []
+        cursor = start
+        for entry in covered:
+            entry_start = datetime.fromisoformat(entry["start"]).replace(tzinfo=timezone.utc)
+            entry_end = datetime.fromisoformat(entry["end"]).replace(tzinfo=timezone.utc)
+            if entry_start > cursor:
+                hot.append((cursor, entry_start))
+            cursor = max(cursor, entry_end)
+        if cursor < end:
+            hot.append((cursor, end))
+        return hot, covered
+
+    def _rows(self, entry, start, end):
+        table = self.table(entry)
+        dates = table.column("date")
+        return table.filter(pc.and_(
+            pc.greater_equal(dates, start.strftime("%Y-%m-%d")),
+            pc.less(dates, end.strftime("%Y-%m-%d"))
+        ))
+
+    def period_totals(self, entries, amount_field, start, end, key_length):
+        # {period key: (total, count)} grouped by the first key_length characters of date
+        totals = {}
+        for entry in entries:
+            rows = self._rows(entry, start, end)
+            if rows.num_rows == 0:
+                continue
+            keyed = pa.table({"period": pc.utf8_slice_codeunits(rows.column("date"), 0, key_length), "amount": rows.column(amount_field)})
+            grouped = keyed.group_by("period").aggregate([("amount", "sum"), ("amount", "count")])
+            for period, total, count in zip(*(grouped.column(name).to_pylist() for name in ("period", "amount_sum", "amount_count"))):
+                current_total, current_count = totals.get(period, (0, 0))
+                totals[period] = (current_total + (total or 0), current_count + count)
+        return totals
+
+    def partner_totals(self, entries, start, end):
+        totals = {}
+        for entry in entries:
+            rows = self._rows(entry, start, end)
+            if rows.num_rows == 0:
+                continue
+            grouped = rows.group_by("partner_id").aggregate([("amount_inr", "sum")])
+            for partner_id, total in zip(grouped.column("partner_id").to_pylist(), grouped.column("amount_inr_sum").to_pylist()):
+                totals[partner_id] = totals.get(partner_id, 0) + (total or 0)
+        return totals
+
+    def documents(self, collection):
+        for entry in self.entries(collection):
+            yield from from_table(self.table(entry))
+
+
+def _bump(storage, *names):
+    now = datetime.now(timezone.utc)
+    for name in names:
+        storage.collection("collection_versions").update_one(
+            {"_id": name}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True
+        )
+
+
+def archive_year(storage, fiscal_year, directory=None, settle=SETTLE_SECONDS):
+    directory = directory or studio_directory(ARCHIVE_DIR, storage.studio)
+    require_pyarrow()
+    start, end = fiscal_year_bounds(fiscal_year)
+    if end > date.today().isoformat():
+        raise ValueError(f"FY{fiscal_year} is not closed yet")
+    manifest = storage.collection(MANIFEST_COLLECTION)
+    if manifest.find_one({"fiscal_year": fiscal_year}):
+        raise ValueError(f"FY{fiscal_year} is already archived")
+
+    # Servers stop writing to the year before it is read
+    for collection in ARCHIVED_COLLECTIONS:
+        manifest.insert_one({
+            "_id": f"{collection}:{fiscal_year}", "collection": collection, "fiscal_year": fiscal_year,
+            "start": start, "end": end, "path": os.path.join(collection, f"FY{fiscal_year}.arrow"),
+            "status": "archiving", "locked_at": datetime.now(timezone.utc),
+        })
+    _bump(storage, MANIFEST_COLLECTION)
+    time.sleep(settle)
+    try:
+        archived = _write_files(storage, directory, fiscal_year, start, end)
+    except BaseException:
+        # Nothing hot was deleted - unlock the year
+        manifest.delete_many({"fiscal_year": fiscal_year, "status": "archiving"})
+        _bump(storage, MANIFEST_COLLECTION)
+        raise
+    _bump(storage, MANIFEST_COLLECTION)
+
+    # Servers switch to the files before the hot copies go away
+    time.sleep(settle)
+    for collection, ids in archived.items():
+        for offset in range(0, len(ids), BATCH_SIZE):
+            storage.collection(collection).delete_many({"id": {"$in": ids[offset:offset + BATCH_SIZE]}})
+    _bump(storage, *ARCHIVED_COLLECTIONS)
+    return {collection: len(ids) for collection, ids in archived.items()}
+
+
+def _write_files(storage, directory, fiscal_year, start, end):
+    manifest = storage.collection(MANIFEST_COLLECTION)
+    archived = {}
+    for collection in ARCHIVED_COLLECTIONS:
+        # Tombstones stay hot so sync clients still see deletions
+        documents = list(storage.collection(collection).find(
+            {"date": {"$gte": start, "$lt": end}, "deleted": {"$ne": True}}
+        ))
+        path = os.path.join(collection, f"FY{fiscal_year}.arrow")
+        full_path = os.path.join(directory, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        table = to_table(collection, documents)
+        with pa.OSFile(full_path + ".tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(full_path + ".tmp", full_path)
+
+        # Read it back before anything is deleted
+        if pa.ipc.open_file(pa.memory_map(full_path, "r")).read_all().num_rows != len(documents):
+            raise RuntimeError(f"Archive file {path} does not match {collection}")
+
+        manifest.update_one(
+            {"_id": f"{collection}:{fiscal_year}"},
+            {"$set": {
+                "rows": len(documents), "bytes": os.path.getsize(full_path),
+                "sha256": file_sha256(full_path), "status": "complete",
+                "archived_at": datetime.now(timezone.utc),
+            }}
+        )
+        archived[collection] = [doc["id"] for doc in documents]
+    return archived
+
+
+def restore_year(storage, fiscal_year, directory=None, settle=SETTLE_SECONDS):
+    directory = directory or studio_directory(ARCHIVE_DIR, storage.studio)
+    require_pyarrow()
+    manifest = storage.collection(MANIFEST_COLLECTION)
+    entries = list(manifest.find({"fiscal_year": fiscal_year}))
+    if not entries:
+        raise ValueError(f"FY{fiscal_year} is not archived")
+
+    restored = {}
+    for entry in entries:
+        if entry["status"] != "complete":
+            # An interrupted archive run never deleted hot data
+            continue
+        full_path = os.path.join(directory, entry["path"])
+        if file_sha256(full_path) != entry["sha256"]:
+            raise RuntimeError(f"Checksum mismatch for {entry['path']}")
+        collection = storage.collection(entry["collection"])
+        documents = list(from_table(pa.ipc.open_file(pa.memory_map(full_path, "r")).read_all()))
+
+        # Skip anything a previous, interrupted restore already put back
+        present = set()
+        ids = [doc["id"] for doc in documents]
+        for offset in range(0, len(ids), BATCH_SIZE):
+            present.update(doc["id"] for doc in collection.find({"id": {"$in": ids[offset:offset + BATCH_SIZE]}}, {"id": 1}))
+        missing = [InsertOne(doc) for doc in documents if doc["id"] not in present]
+        for offset in range(0, len(missing), BATCH_SIZE):
+            collection.bulk_write(missing[offset:offset + BATCH_SIZE], ordered=False)
+        restored[entry["collection"]] = len(missing)
+    _bump(storage, *ARCHIVED_COLLECTIONS)
+
+    # Hot data is complete again; drop the manifest, then the files once servers have let go
+    manifest.delete_many({"fiscal_year": fiscal_year})
+    _bump(storage, MANIFEST_COLLECTION)
+    time.sleep(settle)
+    for entry in entries:
+        if os.path.exists(os.path.join(directory, entry["path"])):
+            os.remove(os.path.join(directory, entry["path"]))
+    return restored
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Archive closed financial years to Arrow files")
+    parser.add_argument("command", choices=["list", "archive", "restore"])
+    parser.add_argument("--fiscal-year", type=int, help="first calendar year of the financial year")
+    args = parser.parse_args()
+
+    storage = open_storage()
+    if args.command == "list":
+        for entry in storage.collection(MANIFEST_COLLECTION).find().sort([("fiscal_year", 1), ("collection", 1)]):
+            if entry["status"] == "complete":
+                print(f"FY{entry['fiscal_year']} {entry['collection']:17} {entry['rows']:8} rows {entry['bytes']:>12} bytes  {entry['path']}")
+            else:
+                print(f"FY{entry['fiscal_year']} {entry['collection']:17} {entry['status']} since {entry['locked_at']:%Y-%m-%d %H:%M} - restore to unlock")
+    elif args.fiscal_year is None:
+        parser.error("--fiscal-year is required")
+    elif args.command == "archive":
+        counts = archive_year(storage, args.fiscal_year)
+        print(f"✅ Archived FY{args.fiscal_year}: {counts}")
+    else:
+        counts = restore_year(storage, args.fiscal_year)
+        print(f"✅ Restored FY{args.fiscal_year}: {counts}")
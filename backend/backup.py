@@ -0,0 +1,268 @@
+# Backup and restore of every collection in the database, without mongodump:
+#   python backup.py backup                  # full backup
+#   python backup.py backup --incremental    # changes since the latest backup
+#   python backup.py list
+#   python backup.py restore backups/incremental-20251014T020000Z
+#
+# Each backup is a directory under BACKUP_DIR. Collections are dumped in parallel,
+# streamed in batches to gzipped extended-JSON files, one document per line, and
+# manifest.json (written last) lists every file with its document count and
+# SHA-256 plus the index definitions of each collection.
+#
+# Incremental backups only read documents whose timestamp field moved past the
+# start of the previous backup; small collections without one are copied whole.
+# Soft deletes show up as updates, but documents removed outright (sessions
+# logged out, years moved out by archive.py) stay in a restore until the next
+# full backup.
+#
+# Set STUDIO to back up another studio's database into BACKUP_DIR/studios/<studio>.
+# Users and sessions of every studio are part of the default studio's backups.
+#
+# The slow-query log is left out of backups and restores.
+#
+# Restore replays the chain back to its full backup. Collections are emptied and
+# their indexes dropped, batches go in with unordered bulk inserts, later layers
+# replace changed documents, and indexes are built once everything is loaded.
+# Collection versions are then moved past every value served before the restore,
+# so ETags and cached reports from before it never match the restored data.
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson import json_util
+from dotenv import load_dotenv
+
+from storage import open_storage, studio_directory
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "backups"))
+BATCH_SIZE = 1000
+WORKERS = 4
+FORMAT_VERSION = 1
+JSON_OPTIONS = json_util.JSONOptions(json_mode=json_util.JSONMode.RELAXED, tz_aware=True, tzinfo=timezone.utc)
+
+# Field an incremental backup selects changed documents by. Ledger writes and
+# soft deletes always set updated_at; sessions are never edited
+TIMESTAMP_FIELDS = {
+    "sales": "updated_at",
+    "expenses": "updated_at",
+    "partner_payments": "updated_at",
+    "investments": "updated_at",
+    "utilization_rollups": "updated_at",
+    "cash_rollups": "updated_at",
+    "collection_versions": "updated_at",
+    "user_sessions": "created_at",
+}
+# Clock skew between app servers and the backup host
+SINCE_OVERLAP = timedelta(minutes=5)
+# Diagnostics, not data: the slow-query log is capped on MongoDB and a restore
+# would recreate it as an ordinary, unbounded collection
+SKIPPED_COLLECTIONS = {"slow_queries"}
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def list_backups(directory=BACKUP_DIR):
+    # Complete backups (those with a manifest), oldest first
+    backups = []
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        path = os.path.join(directory, name, "manifest.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                backups.append({"name": name, **json.load(f)})
+    return sorted(backups, key=lambda backup: backup["started_at"])
+
+
+def read_manifest(path):
+    with open(os.path.join(path, "manifest.json")) as f:
+        return json.load(f)
+
+
+# Backup
+
+def dump_collection(storage, name, target, since=None):
+    collection = storage.collection(name)
+    field = TIMESTAMP_FIELDS.get(name) if since else None
+    query = {field: {"$gte": since}} if field else {}
+    os.makedirs(os.path.join(target, name), exist_ok=True)
+
+    files = []
+    batch = []
+
+    def flush():
+        data = gzip.compress("".join(json_util.dumps(doc, json_options=JSON_OPTIONS) + "\n" for doc in batch).encode())
+        file = f"{name}/{len(files) + 1:05d}.jsonl.gz"
+        with open(os.path.join(target, file), "wb") as f:
+            f.write(data)
+        files.append({"file": file, "documents": len(batch), "bytes": len(data), "sha256": sha256(data)})
+        batch.clear()
+
+    for doc in collection.find(query).batch_size(BATCH_SIZE):
+        batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+    return {
+        "complete": field is None,
+        "documents": sum(file["documents"] for file in files),
+        "files": files,
+        "indexes": [
+            {"name": index_name, "key": [list(part) for part in info["key"]], "unique": bool(info.get("unique"))}
+            for index_name, info in collection.index_information().items()
+            if index_name != "_id_"
+        ],
+    }
+
+
+def backup(storage, directory=None, incremental=False, workers=WORKERS):
+    directory = directory or studio_directory(BACKUP_DIR, storage.studio)
+    started_at = datetime.now(timezone.utc)
+    base = None
+    since = None
+    if incremental:
+        previous = list_backups(directory)
+        if not previous:
+            raise RuntimeError(f"No backup in {directory} to take an incremental backup from")
+        base = previous[-1]
+        since = datetime.fromisoformat(base["started_at"]) - SINCE_OVERLAP
+
+    name = f"{'incremental' if incremental else 'full'}-{started_at.strftime('%Y%m%dT%H%M%SZ')}"
+    target = os.path.join(directory, name)
+    os.makedirs(target)
+
+    names = [name for name in storage.collection_names() if name not in SKIPPED_COLLECTIONS]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        dumped = pool.map(lambda collection: dump_collection(storage, collection, target, since), names)
+        collections = dict(zip(names, dumped))
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "mode": "incremental" if incremental else "full",
+        "storage": storage.name,
+        "started_at": started_at.isoformat(),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "base": base["name"] if base else None,
+        "since": since.isoformat() if since else None,
+        "collections": collections,
+    }
+    # The manifest marks the backup complete, so it is written last
+    with open(os.path.join(target, "manifest.json.tmp"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(target, "manifest.json.tmp"), os.path.join(target, "manifest.json"))
+    return target, manifest
+
+
+# Restore
+
+def backup_chain(path):
+    # [(path, manifest)] from the full backup up to the one given
+    chain = []
+    while True:
+        manifest = read_manifest(path)
+        chain.append((path, manifest))
+        if manifest["mode"] == "full":
+            return chain[::-1]
+        path = os.path.join(os.path.dirname(path), manifest["base"])
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            raise RuntimeError(f"Base backup {manifest['base']} is missing")
+
+
+def read_batch(path, file):
+    with open(os.path.join(path, file["file"]), "rb") as f:
+        data = f.read()
+    if sha256(data) != file["sha256"]:
+        raise RuntimeError(f"Checksum mismatch for {file['file']}")
+    return [json_util.loads(line, json_options=JSON_OPTIONS) for line in gzip.decompress(data).decode().splitlines()]
+
+
+def verify(path):
+    for layer_path, manifest in backup_chain(path):
+        for info in manifest["collections"].values():
+            for file in info["files"]:
+                read_batch(layer_path, file)
+
+
+def load_collection(storage, name, layers):
+    # layers: [(path, collection entry)] oldest first
+    collection = storage.collection(name)
+    collection.drop()
+    for index, (path, info) in enumerate(layers):
+        replace = index > 0
+        if replace and info["complete"]:
+            # Copied whole again - the newer copy replaces the collection
+            collection.delete_many({})
+            replace = False
+        for file in info["files"]:
+            documents = read_batch(path, file)
+            if replace:
+                collection.delete_many({"_id": {"$in": [doc["_id"] for doc in documents]}})
+            collection.insert_many(documents, ordered=False)
+
+    for index in layers[-1][1]["indexes"]:
+        collection.create_index([tuple(part) for part in index["key"]], unique=index["unique"], name=index["name"])
+    return collection.count_documents({})
+
+
+def restore(storage, path, workers=WORKERS):
+    chain = backup_chain(path)
+    # Check every file first so a damaged backup leaves the database untouched
+    verify(path)
+
+    # Backups taken before SKIPPED_COLLECTIONS existed may still hold them
+    names = [name for name in chain[-1][1]["collections"] if name not in SKIPPED_COLLECTIONS]
+    layers = {
+        name: [(layer_path, manifest["collections"][name]) for layer_path, manifest in chain if name in manifest["collections"]]
+        for name in names
+    }
+    versions = storage.collection("collection_versions")
+    served = {doc["_id"]: doc.get("version", 0) for doc in versions.find()}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        counts = dict(zip(names, pool.map(lambda name: load_collection(storage, name, layers[name]), names)))
+
+    restored = {doc["_id"]: doc.get("version", 0) for doc in versions.find()}
+    now = datetime.now(timezone.utc)
+    for name in sorted(set(served) | set(restored)):
+        versions.update_one(
+            {"_id": name},
+            {"$set": {"version": max(served.get(name, 0), restored.get(name, 0)) + 1, "updated_at": now}},
+            upsert=True
+        )
+    return counts
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Back up and restore every collection")
+    parser.add_argument("command", choices=["backup", "restore", "verify", "list"])
+    parser.add_argument("path", nargs="?", help="backup directory to restore or verify")
+    parser.add_argument("--incremental", action="store_true", help="only documents changed since the latest backup")
+    parser.add_argument("--dir", help="where backups are kept (default BACKUP_DIR, per studio)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="collections dumped or loaded at once")
+    args = parser.parse_args()
+
+    storage = open_storage()
+    directory = args.dir or studio_directory(BACKUP_DIR, storage.studio)
+    if args.command == "list":
+        for entry in list_backups(directory):
+            documents = sum(info["documents"] for info in entry["collections"].values())
+            print(f"{entry['name']:36} {entry['mode']:11} {documents:9} documents  base={entry['base'] or '-'}")
+    elif args.command == "backup":
+        target, manifest = backup(storage, directory, args.incremental, args.workers)
+        documents = sum(info["documents"] for info in manifest["collections"].values())
+        print(f"✅ {manifest['mode'].capitalize()} backup of {documents} documents in {target}")
+    elif args.path is None:
+        parser.error(f"{args.command} needs a backup directory")
+    elif args.command == "verify":
+        verify(args.path)
+        print(f"✅ Every file in {args.path} and its base backups matches its checksum")
+    else:
+        counts = restore(storage, args.path, args.workers)
+        print(f"✅ Restored {sum(counts.values())} documents into {len(counts)} collections")
@@ -0,0 +1,81 @@
+# Range-query benchmark: "YYYY-MM-DD" string bounds vs the native date_at field.
+#
+# Runs the monthly revenue query the reports use both ways against the
+# configured database and prints timings and index usage:
+#   python bench_date_range.py --runs 50
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+
+def month_ranges(collection):
+    # Every month that has data, so the benchmark covers the real distribution
+    months = collection.distinct("date_at")
+    return sorted({(d.year, d.month) for d in months if d is not None})
+
+
+def string_query(year, month):
+    start = f"{year}-{str(month).zfill(2)}-01"
+    end = f"{year + 1}-01-01" if month == 12 else f"{year}-{str(month + 1).zfill(2)}-01"
+    return {"date": {"$gte": start, "$lt": end}}
+
+
+def native_query(year, month):
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + 1, 1, 1, tzinfo=timezone.utc) if month == 12 else datetime(year, month + 1, 1, tzinfo=timezone.utc)
+    return {"date_at": {"$gte": start, "$lt": end}}
+
+
+def time_query(collection, queries, runs):
+    samples = []
+    for _ in range(runs):
+        for query in queries:
+            started = time.perf_counter()
+            list(collection.aggregate([
+                {"$match": query},
+                {"$group": {"_id": None, "total": {"$sum": "$total_amount_inr"}}}
+            ]))
+            samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+    }
+
+
+def plan_summary(collection, query):
+    explain = collection.database.command("explain", {"find": collection.name, "filter": query}, verbosity="executionStats")
+    stats = explain["executionStats"]
+    return {
+        "keys_examined": stats["totalKeysExamined"],
+        "docs_examined": stats["totalDocsExamined"],
+        "returned": stats["nReturned"],
+        "collscan": "COLLSCAN" in str(explain["queryPlanner"]["winningPlan"]),
+    }
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Benchmark date range queries")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URL", "mongodb://localhost:27017/"))
+    sales = client[os.getenv("DATABASE_NAME", "finance_tracker")]["sales"]
+
+    months = month_ranges(sales)
+    if not months:
+        raise SystemExit("No sales with date_at - run migrate_dates.py first")
+
+    print(f"📊 {sales.estimated_document_count()} sales across {len(months)} months, {args.runs} runs each")
+    for label, build in [("before (date string)", string_query), ("after (date_at)", native_query)]:
+        queries = [build(year, month) for year, month in months]
+        print(f"{label}: {time_query(sales, queries, args.runs)}")
+        print(f"    plan for {months[-1][0]}-{str(months[-1][1]).zfill(2)}: {plan_summary(sales, queries[-1])}")
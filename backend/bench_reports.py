@@ -0,0 +1,199 @@
+# Report and list endpoint micro-benchmarks over deterministic synthetic data.
+#
+#   python bench_reports.py --engine sqlite --sizes 1:5,3:5,5:7 --output bench/latest.json
+#   python bench_reports.py --engine sqlite --compare bench/baseline.json
+#
+# Sizes are YEARS:PARTNERS. Results are written as JSON so runs can be compared;
+# --compare flags any route whose p50 got slower than --threshold and exits 1.
+#
+# --studios N loads the same data into N studios and rotates requests between
+# their users, so per-studio routing and cold per-studio caches are measured:
+#   python bench_reports.py --engine sqlite --sizes 3:5 --studios 4
+#
+# The report cache is off so reports are computed on every request, as in the
+# baselines; --report-cache measures cached responses instead.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BENCH_DATABASE = "finance_tracker_bench"
+
+
+def routes(year):
+    last_month = f"{year}-06"
+    return [
+        f"/api/dashboard/stats?month={last_month}",
+        f"/api/reports/monthly?month={last_month}",
+        f"/api/reports/yearly?year={year}",
+        f"/api/reports/yearly?year={year}&month=6",
+        f"/api/reports/range?from={year}-01-01&to={year}-12-31&granularity=quarter",
+        f"/api/reports/range?from={year}-01-01&to={year}-12-31&granularity=week",
+        "/api/sales",
+        "/api/expenses",
+        "/api/partner-payments",
+        "/api/investments",
+        "/api/partners",
+    ]
+
+
+def configure(engine, report_cache=False):
+    # server.py reads these at import time
+    os.environ["STORAGE_BACKEND"] = engine
+    os.environ["DATABASE_NAME"] = BENCH_DATABASE
+    os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+    for route_class in ("EXPENSIVE", "WRITE", "READ"):
+        os.environ[f"RATE_LIMIT_{route_class}_BURST"] = "1000000"
+    os.environ["MAX_CONCURRENT_EXPENSIVE"] = "1000"
+    if not report_cache:
+        os.environ["REPORT_CACHE_SIZE"] = "0"
+
+
+def time_route(client, studio_headers, route, runs):
+    for headers in studio_headers:
+        client.get(route, headers=headers).raise_for_status()
+    samples = []
+    for run in range(runs):
+        headers = studio_headers[run % len(studio_headers)]
+        started = time.perf_counter()
+        client.get(route, headers=headers).raise_for_status()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)], 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+        "min_ms": round(samples[0], 3),
+    }
+
+
+def bench_user(server, studio):
+    user_id = f"bench-user-{studio}"
+    server.users_collection.delete_many({"id": user_id})
+    server.users_collection.insert_one({"id": user_id, "email": f"bench@{studio}.example.com", "name": "Bench", "role": "OWNER", "studio_id": studio, "created_at": datetime.now(timezone.utc)})
+    server.sessions_collection.insert_one({"user_id": user_id, "session_token": f"bench-token-{studio}", "expires_at": datetime.now(timezone.utc) + timedelta(days=1)})
+    return {"Authorization": f"Bearer bench-token-{studio}"}
+
+
+def run(engine, sizes, sales_per_month, runs, seed, studio_count=1, report_cache=False):
+    configure(engine, report_cache)
+    import server
+    import synthetic_data
+    from fastapi.testclient import TestClient
+    from tenancy import use_studio
+
+    studios = [server.DEFAULT_STUDIO] + [f"bench-{number}" for number in range(2, studio_count + 1)]
+    studio_headers = [bench_user(server, studio) for studio in studios]
+    client = TestClient(server.app)
+    year = datetime.now().year
+
+    results = {}
+    for years, partners in sizes:
+        dataset = synthetic_data.generate(years=years, partners=partners, sales_per_month=sales_per_month, end_year=year, seed=seed)
+        for studio in studios:
+            with use_studio(studio):
+                server.storage.activate(studio)
+                synthetic_data.load(server.storage, dataset)
+        server._date_migration.clear()
+
+        size_key = f"{years}y-{partners}p" + (f"-{studio_count}s" if studio_count > 1 else "")
+        print(f"⏱️  {size_key}: {synthetic_data.summary(dataset)}", file=sys.stderr)
+        results[size_key] = {
+            "dataset": synthetic_data.summary(dataset),
+            "routes": {route: time_route(client, studio_headers, route, runs) for route in routes(year)},
+        }
+
+    if engine == "mongo":
+        for studio in studios:
+            server.storage.shared.client.drop_database(server.storage.for_studio(studio).db.name)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(baseline, current, threshold, min_delta_ms):
+    regressions = []
+    for size_key, size in current["results"].items():
+        base_size = baseline["results"].get(size_key)
+        if not base_size:
+            continue
+        for route, timing in size["routes"].items():
+            base = base_size["routes"].get(route)
+            if not base:
+                continue
+            ratio = timing["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+            delta = timing["p50_ms"] - base["p50_ms"]
+            flagged = ratio > 1 + threshold and delta > min_delta_ms
+            marker = "❌" if flagged else ("✅" if ratio < 1 - threshold else "  ")
+            print(f"{marker} {size_key:8} {route:45} {base['p50_ms']:9.2f} -> {timing['p50_ms']:9.2f} ms ({ratio:5.2f}x)")
+            if flagged:
+                regressions.append({"size": size_key, "route": route, "baseline_ms": base["p50_ms"], "current_ms": timing["p50_ms"]})
+    return regressions
+
+
+def parse_sizes(value):
+    return [tuple(int(part) for part in size.split(":")) for size in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark report and list endpoints")
+    parser.add_argument("--engine", choices=["mongo", "sqlite"], default=os.getenv("STORAGE_BACKEND", "mongo"))
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("1:5,3:5,5:7"), help="YEARS:PARTNERS,...")
+    parser.add_argument("--sales-per-month", type=int, default=40)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--studios", type=int, default=1, help="studios to spread the same data and requests over")
+    parser.add_argument("--report-cache", action="store_true", help="serve reports from the report cache")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 slowdown ratio that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    current = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "engine": args.engine,
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "sales_per_month": args.sales_per_month,
+            "runs": args.runs,
+            "seed": args.seed,
+            "studios": args.studios,
+            "report_cache": args.report_cache,
+        },
+        "results": run(args.engine, args.sizes, args.sales_per_month, args.runs, args.seed, args.studios, args.report_cache),
+    }
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"📄 Results saved to: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("engine") != args.engine or baseline["meta"].get("sales_per_month") != args.sales_per_month:
+            print("⚠️  Baseline was recorded with a different engine or data size - comparison is indicative only")
+        regressions = compare(baseline, current, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+    else:
+        for size_key, size in current["results"].items():
+            print(f"\n{size_key} {size['dataset']}")
+            for route, timing in size["routes"].items():
+                print(f"  {route:45} p50 {timing['p50_ms']:8.2f} ms   p95 {timing['p95_ms']:8.2f} ms")
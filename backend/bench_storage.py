@@ -0,0 +1,57 @@
+# Report latency benchmark: SQLite vs MongoDB storage backends.
+#
+# Loads the same synthetic ledger into each backend and times the report
+# endpoints in-process:
+#   python bench_storage.py --years 2 --sales-per-month 400 --runs 20
+#
+# Each engine runs in its own subprocess because server.py picks its storage
+# backend at import time. MongoDB is skipped when MONGO_URL is unreachable.
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import bench_reports
+
+REPORT_ROUTES = ("/api/dashboard", "/api/reports")
+
+
+def mongo_available():
+    from pymongo import MongoClient
+    try:
+        MongoClient(os.getenv("MONGO_URL", "mongodb://localhost:27017/"), serverSelectionTimeoutMS=1000).admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark report latency per storage backend")
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--partners", type=int, default=5)
+    parser.add_argument("--sales-per-month", type=int, default=400)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--worker", choices=["sqlite", "mongo"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        results = bench_reports.run(args.worker, [(args.years, args.partners)], args.sales_per_month, args.runs, seed=42)
+        print(json.dumps(next(iter(results.values()))))
+        sys.exit(0)
+
+    engines = ["sqlite"] + (["mongo"] if mongo_available() else [])
+    timings = {}
+    for engine in engines:
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", engine, "--years", str(args.years), "--partners", str(args.partners),
+             "--sales-per-month", str(args.sales_per_month), "--runs", str(args.runs)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        timings[engine] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"📊 {timings['sqlite']['dataset']}, {args.runs} runs per route")
+    print(f"{'route':45} " + " ".join(f"{engine + ' p50':>14}" for engine in engines))
+    for route, timing in timings["sqlite"]["routes"].items():
+        if route.startswith(REPORT_ROUTES):
+            print(f"{route:45} " + " ".join(f"{timings[engine]['routes'][route]['p50_ms']:11.2f} ms" for engine in engines))
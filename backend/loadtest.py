@@ -0,0 +1,387 @@
+# End-to-end load test: N concurrent staff logging in, recording sales and
+# expenses, and reading reports and ledgers.
+#
+#   python loadtest.py --engine sqlite --users 50 --duration 60
+#   python loadtest.py --engine mongo --mode uvicorn --users 50 --duration 60 --output load.json
+#
+# --mode inprocess drives the app through httpx's ASGI transport, so the
+# event-loop lag it samples is the app's own loop. --mode uvicorn starts a
+# local uvicorn process and drives it over HTTP, and takes the server's loop lag
+# from its watchdog in /api/metrics. Either way the Emergent session lookup is
+# served by a local stub, and the loadtest database is dropped afterwards.
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+LOADTEST_DATABASE = "finance_tracker_loadtest"
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (action, weight)
+ACTION_MIX = [
+    ("dashboard", 15),
+    ("monthly_report", 10),
+    ("yearly_report", 10),
+    ("list_sales", 15),
+    ("list_expenses", 10),
+    ("create_sale", 20),
+    ("create_expense", 15),
+    ("login", 5),
+]
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return None
+    index = max(0, min(len(sorted_samples) - 1, int(round(fraction * len(sorted_samples))) - 1))
+    return round(sorted_samples[index], 2)
+
+
+class Recorder:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.timeline = defaultdict(lambda: {"requests": 0, "errors": 0, "rejected": 0, "lag_ms": []})
+        # The server's watchdog snapshot when it runs in another process
+        self.app_loop = None
+
+    def second(self):
+        return int(time.monotonic() - self.started)
+
+    def record(self, route, status, elapsed_ms):
+        self.latencies[route].append(elapsed_ms)
+        self.statuses[route][str(status)] += 1
+        bucket = self.timeline[self.second()]
+        bucket["requests"] += 1
+        if status == 429:
+            bucket["rejected"] += 1
+        elif status == "error" or status >= 500:
+            bucket["errors"] += 1
+
+    def record_lag(self, lag_ms):
+        self.timeline[self.second()]["lag_ms"].append(lag_ms)
+
+    def report(self, duration):
+        routes = {}
+        total = 0
+        for route, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            statuses = dict(self.statuses[route])
+            errors = sum(count for status, count in statuses.items() if status == "error" or int(status) >= 500)
+            total += len(samples)
+            routes[route] = {
+                "requests": len(samples),
+                "throughput_rps": round(len(samples) / duration, 2),
+                "p50_ms": percentile(samples, 0.50),
+                "p95_ms": percentile(samples, 0.95),
+                "p99_ms": percentile(samples, 0.99),
+                "error_rate": round(errors / len(samples), 4),
+                "rejected_rate": round(statuses.get("429", 0) / len(samples), 4),
+                "statuses": statuses,
+            }
+
+        timeline = []
+        for second in sorted(self.timeline):
+            bucket = self.timeline[second]
+            lags = sorted(bucket["lag_ms"])
+            timeline.append({
+                "second": second,
+                "requests": bucket["requests"],
+                "errors": bucket["errors"],
+                "rejected": bucket["rejected"],
+                "loop_lag_p50_ms": percentile(lags, 0.50),
+                "loop_lag_max_ms": round(lags[-1], 2) if lags else None,
+            })
+
+        all_lags = sorted(lag for bucket in self.timeline.values() for lag in bucket["lag_ms"])
+        report = {
+            "duration_s": round(duration, 2),
+            "requests": total,
+            "throughput_rps": round(total / duration, 2),
+            "loop_lag_p99_ms": percentile(all_lags, 0.99),
+            "loop_lag_max_ms": round(all_lags[-1], 2) if all_lags else None,
+            "routes": routes,
+            "timeline": timeline,
+        }
+        if self.app_loop is not None:
+            report.update(loop_lag_max_ms=self.app_loop["max_lag_ms"], app_loop=self.app_loop)
+        return report
+
+
+async def lag_monitor(recorder, interval, stop):
+    # A sleep that overshoots means something blocked the loop
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        recorder.record_lag(max(0.0, (time.perf_counter() - started - interval) * 1000))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_auth_stub(port):
+    # Stands in for Emergent's session-data endpoint
+    import uvicorn
+    from fastapi import FastAPI, Header
+
+    stub = FastAPI()
+
+    @stub.get("/session-data")
+    async def session_data(session_id: str = Header(..., alias="X-Session-ID")):
+        return {
+            "email": f"{session_id}@loadtest.local",
+            "name": f"Load {session_id}",
+            "picture": None,
+            "session_token": f"{session_id}-{uuid.uuid4().hex}",
+        }
+
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+class Staff:
+    def __init__(self, index, client, recorder, rng):
+        self.session_id = f"staff-{index}"
+        self.client = client
+        self.recorder = recorder
+        self.rng = rng
+        self.headers = {}
+        self.year = datetime.now().year
+
+    async def call(self, route, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers={**self.headers, **kwargs.pop("headers", {})}, **kwargs)
+            status = response.status_code
+        except Exception:
+            response = None
+            status = "error"
+        self.recorder.record(route, status, (time.perf_counter() - started) * 1000)
+        return response
+
+    def random_date(self):
+        month = self.rng.randint(1, datetime.now().month)
+        return f"{self.year}-{str(month).zfill(2)}-{str(self.rng.randint(1, 28)).zfill(2)}"
+
+    async def login(self):
+        response = await self.call("POST /api/auth/session", "POST", "/api/auth/session", headers={"X-Session-ID": self.session_id})
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.cookies.get('session_token')}"}
+
+    async def dashboard(self):
+        await self.call("GET /api/dashboard/stats", "GET", "/api/dashboard/stats")
+
+    async def monthly_report(self):
+        await self.call("GET /api/reports/monthly", "GET", f"/api/reports/monthly?month={self.random_date()[:7]}")
+
+    async def yearly_report(self):
+        await self.call("GET /api/reports/yearly", "GET", f"/api/reports/yearly?year={self.year}")
+
+    async def list_sales(self):
+        await self.call("GET /api/sales", "GET", "/api/sales")
+
+    async def list_expenses(self):
+        await self.call("GET /api/expenses", "GET", "/api/expenses")
+
+    async def create_sale(self):
+        hours = self.rng.choice([1, 2, 3, 4])
+        await self.call("POST /api/sales", "POST", "/api/sales", json={
+            "date": self.random_date(), "shoot_type": "Family", "total_time_hrs": hours,
+            "total_amount_inr": hours * self.rng.randrange(2000, 6000), "received_by": "Om",
+            "payment_mode": "UPI", "cameraman": "Ravi", "city": "Hyderabad",
+        })
+
+    async def create_expense(self):
+        await self.call("POST /api/expenses", "POST", "/api/expenses", json={
+            "date": self.random_date(), "expense_type": "FOOD", "amount_inr": self.rng.randrange(200, 5000),
+            "paid_by": "Om", "payment_mode": "Cash",
+        })
+
+    async def run(self, deadline, think_time):
+        await self.login()
+        actions, weights = zip(*ACTION_MIX)
+        while time.monotonic() < deadline:
+            await getattr(self, self.rng.choices(actions, weights)[0])()
+            if think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / think_time))
+
+
+async def drive(client, recorder, users, duration, ramp_up, think_time, seed, sample_lag=True):
+    # Sampling this loop only measures the app when the app runs on it
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(lag_monitor(recorder, 0.05, stop)) if sample_lag else None
+    deadline = time.monotonic() + duration
+
+    async def start(index):
+        await asyncio.sleep(ramp_up * index / users)
+        await Staff(index, client, recorder, random.Random(seed + index)).run(deadline, think_time)
+
+    started = time.monotonic()
+    await asyncio.gather(*(start(index) for index in range(users)))
+    elapsed = time.monotonic() - started
+    stop.set()
+    if monitor:
+        await monitor
+    return elapsed
+
+
+async def app_loop(client):
+    # The server's own watchdog: worst heartbeat lag and the stalls past its threshold
+    # Logged in with its own recorder so the lookup is not part of the results
+    staff = Staff("metrics", client, Recorder(), random.Random())
+    await staff.login()
+    response = await client.get("/api/metrics", headers=staff.headers)
+    response.raise_for_status()
+    event_loop = response.json()["event_loop"]
+    return {
+        "max_lag_ms": event_loop["max_lag_ms"],
+        "stall_threshold_ms": event_loop["stall_threshold_ms"],
+        "stalls": sum(row["value"] for row in response.json()["counters"].get("loop_stalls", [])),
+    }
+
+
+def configure(args, auth_port):
+    os.environ["STORAGE_BACKEND"] = args.engine
+    os.environ["DATABASE_NAME"] = LOADTEST_DATABASE
+    # Only a SQLite file created here is removed afterwards
+    args.sqlite_dir = None
+    if "SQLITE_PATH" not in os.environ:
+        args.sqlite_dir = tempfile.mkdtemp()
+        os.environ["SQLITE_PATH"] = os.path.join(args.sqlite_dir, "loadtest.sqlite3")
+    os.environ["EMERGENT_SESSION_URL"] = f"http://127.0.0.1:{auth_port}/session-data"
+    if args.no_rate_limits:
+        for route_class in ("EXPENSIVE", "WRITE", "READ"):
+            os.environ[f"RATE_LIMIT_{route_class}_BURST"] = "1000000"
+
+
+def drop_data(args):
+    # So repeated runs start from the same data instead of piling up
+    if args.engine == "mongo":
+        from storage import open_storage
+
+        storage = open_storage()
+        storage.client.drop_database(storage.db.name)
+    elif args.sqlite_dir:
+        shutil.rmtree(args.sqlite_dir, ignore_errors=True)
+
+
+def seed_data(storage, years, seed):
+    if years:
+        import synthetic_data
+        synthetic_data.load(storage, synthetic_data.generate(years=years, end_year=datetime.now().year, seed=seed))
+
+
+async def run_inprocess(args, recorder):
+    import server
+
+    seed_data(server.storage, args.years, args.seed)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest.local", timeout=60) as client:
+        return await drive(client, recorder, args.users, args.duration, args.ramp_up, args.think_time, args.seed)
+
+
+async def run_uvicorn(args, recorder):
+    from storage import open_storage
+
+    seed_data(open_storage(), args.years, args.seed)
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=os.environ.copy()
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=httpx.Limits(max_connections=args.users)) as client:
+            for _ in range(300):
+                try:
+                    if (await client.get("/api")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise SystemExit("uvicorn did not start")
+            elapsed = await drive(client, recorder, args.users, args.duration, args.ramp_up, args.think_time, args.seed, sample_lag=False)
+            recorder.app_loop = await app_loop(client)
+            return elapsed
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def print_report(report, mode):
+    print(f"\n📊 {report['requests']} requests in {report['duration_s']}s - {report['throughput_rps']} req/s")
+    print(f"{'route':28} {'reqs':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>8} {'429s':>8}")
+    for route, stats in report["routes"].items():
+        print(f"{route:28} {stats['requests']:7} {stats['p50_ms']:7.1f}ms {stats['p95_ms']:7.1f}ms {stats['p99_ms']:7.1f}ms "
+              f"{stats['error_rate']:8.2%} {stats['rejected_rate']:8.2%}")
+    if mode == "inprocess":
+        print(f"\n⏱️  Event-loop lag (app loop): p99 {report['loop_lag_p99_ms']} ms, max {report['loop_lag_max_ms']} ms")
+        print("second  reqs  errors  429s  lag p50  lag max")
+        for bucket in report["timeline"]:
+            print(f"{bucket['second']:6} {bucket['requests']:5} {bucket['errors']:7} {bucket['rejected']:5} "
+                  f"{bucket['loop_lag_p50_ms'] or 0:8.1f} {bucket['loop_lag_max_ms'] or 0:8.1f}")
+        return
+    app = report["app_loop"]
+    print(f"\n⏱️  Event-loop lag (server watchdog): max {app['max_lag_ms']} ms, "
+          f"{app['stalls']} stalls over {app['stall_threshold_ms']:.0f} ms")
+    print("second  reqs  errors  429s")
+    for bucket in report["timeline"]:
+        print(f"{bucket['second']:6} {bucket['requests']:5} {bucket['errors']:7} {bucket['rejected']:5}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent end-to-end load test")
+    parser.add_argument("--engine", choices=["mongo", "sqlite"], default=os.getenv("STORAGE_BACKEND", "mongo"))
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--ramp-up", type=float, default=5, help="seconds to start all users")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean pause between a user's requests")
+    parser.add_argument("--years", type=int, default=1, help="years of synthetic history to load first (0 for none)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-rate-limits", action="store_true", help="raise admission limits so only capacity is measured")
+    parser.add_argument("--output", help="write the full report JSON here")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    auth_port = free_port()
+    configure(args, auth_port)
+    auth_stub = start_auth_stub(auth_port)
+
+    recorder = Recorder()
+    runner = run_inprocess if args.mode == "inprocess" else run_uvicorn
+    try:
+        elapsed = asyncio.run(runner(args, recorder))
+    finally:
+        auth_stub.should_exit = True
+        drop_data(args)
+
+    report = recorder.report(elapsed)
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ("output", "sqlite_dir")}
+    print_report(report, args.mode)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Report saved to: {args.output}")
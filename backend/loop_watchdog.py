@@ -0,0 +1,130 @@
+# Event-loop stall watchdog - a heartbeat task on the loop and a monitor thread.
+# When the heartbeat is late past the threshold the monitor captures the loop
+# thread's stack (the code that is blocking) and the route it is serving.
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from metrics import metrics, route_template
+
+WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "true").lower() == "true"
+STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "200"))
+HEARTBEAT_INTERVAL_MS = float(os.getenv("LOOP_HEARTBEAT_INTERVAL_MS", "50"))
+RECENT_STALLS = 20
+STACK_DEPTH = 25
+
+logger = logging.getLogger("loop_watchdog")
+
+
+def active_route(frame):
+    # A blocked coroutine chain is on the loop thread's stack; the innermost
+    # ASGI frame holding an http scope tells which request it belongs to
+    while frame is not None:
+        scope = frame.f_locals.get("scope")
+        if isinstance(scope, dict) and scope.get("type") == "http":
+            app = scope.get("app")
+            route = route_template(app, scope) if app is not None else scope.get("path")
+            return route, scope.get("method")
+        frame = frame.f_back
+    return "background", None
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms=STALL_THRESHOLD_MS, interval_ms=HEARTBEAT_INTERVAL_MS):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_thread_id = None
+        self._monitor = None
+        self._last_beat = time.monotonic()
+        self._pending = None
+        self.max_lag_ms = 0.0
+        self.stalls = deque(maxlen=RECENT_STALLS)
+
+    def ensure_running(self):
+        # Bound lazily on the first request - the loop only exists once serving
+        # starts, and test clients may run each request on a fresh loop
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        with self._lock:
+            self._loop = loop
+            self._loop_thread_id = threading.get_ident()
+            self._last_beat = time.monotonic()
+            self._pending = None
+        loop.create_task(self._heartbeat(loop))
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._monitor.start()
+
+    async def _heartbeat(self, loop):
+        while loop is self._loop:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag_ms = max(0.0, (now - expected) * 1000)
+            with self._lock:
+                self._last_beat = now
+                self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+                stall, self._pending = self._pending, None
+            if stall:
+                self._record(stall, lag_ms)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                loop, beat, pending = self._loop, self._last_beat, self._pending
+            if pending or loop is None or not loop.is_running():
+                continue
+            if time.monotonic() - beat - self.interval < self.threshold:
+                continue
+
+            # Still blocked - this is the stack of whatever is holding the loop
+            frame = sys._current_frames().get(self._loop_thread_id)
+            route, method = active_route(frame)
+            stall = {
+                "route": route,
+                "method": method,
+                "detected_at": time.time(),
+                "stack": traceback.format_stack(frame)[-STACK_DEPTH:] if frame else [],
+            }
+            with self._lock:
+                if self._last_beat == beat and self._loop is loop:
+                    self._pending = stall
+
+    def _record(self, stall, lag_ms):
+        stall["duration_ms"] = round(lag_ms, 1)
+        metrics.inc("loop_stalls", route=stall["route"])
+        metrics.inc("loop_stall_ms", int(lag_ms), route=stall["route"])
+        self.stalls.append(stall)
+        logger.warning(json.dumps({"event": "loop_stall", **stall}))
+
+    def snapshot(self):
+        with self._lock:
+            max_lag_ms = self.max_lag_ms
+        return {
+            "stall_threshold_ms": self.threshold * 1000,
+            "max_lag_ms": round(max_lag_ms, 1),
+            "recent_stalls": list(self.stalls),
+        }
+
+
+watchdog = LoopWatchdog()
+
+
+class LoopWatchdogMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if WATCHDOG_ENABLED and scope["type"] == "http":
+            watchdog.ensure_running()
+        await self.app(scope, receive, send)
@@ -0,0 +1,38 @@
+# In-process metrics registry - served as JSON from GET /api/metrics
+import threading
+from collections import defaultdict
+
+from starlette.routing import Match
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def snapshot(self):
+        with self._lock:
+            items = list(self._counters.items())
+
+        result = {}
+        for (name, labels), value in sorted(items):
+            result.setdefault(name, []).append({**dict(labels), "value": value})
+        return result
+
+
+metrics = Metrics()
+
+
+def route_template(app, scope):
+    # Label metrics by route template ("/api/sales/{sale_id}"), not raw path,
+    # so ids in the URL don't create one series per document
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
@@ -0,0 +1,88 @@
+# Online backfill of the native `date_at` field from the "YYYY-MM-DD" `date` string
+# on sales, expenses, partner payments and investments.
+#
+# Runs in small throttled batches so it can be run while the app is live:
+#   python migrate_dates.py --batch-size 500 --pause 0.2
+#
+# New writes already store date_at, so once every existing document has been
+# backfilled the migration is marked complete and reports switch to date_at.
+import argparse
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from storage import open_storage
+
+MIGRATION_ID = "date_at"
+DATED_COLLECTIONS = ["sales", "expenses", "partner_payments", "investments"]
+
+
+def to_date_at(date_str):
+    # "2025-03-14" -> 2025-03-14T00:00:00Z, None for anything unparsable
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill_collection(collection, batch_size, pause):
+    migrated = 0
+    invalid = 0
+    while True:
+        batch = list(collection.find({"date_at": {"$exists": False}}, {"date": 1}).limit(batch_size))
+        if not batch:
+            return migrated, invalid
+
+        operations = []
+        for doc in batch:
+            date_at = to_date_at(doc.get("date"))
+            if date_at is None:
+                # Stored as null so the document is not picked up again
+                invalid += 1
+            operations.append(UpdateOne(
+                {"_id": doc["_id"], "date_at": {"$exists": False}},
+                {"$set": {"date_at": date_at}}
+            ))
+        result = collection.bulk_write(operations, ordered=False)
+        migrated += result.modified_count
+
+        # Leave room for live traffic between batches
+        time.sleep(pause)
+
+
+def run(storage, batch_size=500, pause=0.2):
+    storage.collection("migrations").update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"status": "running", "started_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+    summary = {}
+    for name in DATED_COLLECTIONS:
+        collection = storage.collection(name)
+        collection.create_index("date_at")
+        migrated, invalid = backfill_collection(collection, batch_size, pause)
+        summary[name] = {"migrated": migrated, "invalid": invalid}
+        print(f"✅ {name}: {migrated} documents backfilled, {invalid} with invalid dates")
+
+    storage.collection("partner_payments").create_index([("partner_id", 1), ("date_at", 1)])
+
+    storage.collection("migrations").update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"status": "complete", "completed_at": datetime.now(timezone.utc), "summary": summary}}
+    )
+    print("✅ date_at migration complete - reports now query date_at")
+    return summary
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Backfill native date_at fields")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.2, help="seconds to sleep between batches")
+    args = parser.parse_args()
+
+    run(open_storage(), args.batch_size, args.pause)
@@ -0,0 +1,243 @@
+# On-demand per-request profiling. An authorized caller adds "X-Profile: 1" or
+# "?profile=1" and that one request runs under a deterministic profiler that
+# only follows frames running in the request's own context. The result holds
+# folded stacks (flamegraph.pl / speedscope input, weights in microseconds) and
+# every database command the request issued with its duration.
+#
+# Unprofiled requests pay a header check in the middleware and one context
+# variable lookup per database command.
+import contextvars
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+from pymongo import monitoring
+from starlette.requests import Request
+
+from metrics import route_template
+from tenancy import current_studio
+
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_MAX_COMMANDS = 500
+
+_current = contextvars.ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self, scope, user):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.route = route_template(scope["app"], scope) if "app" in scope else scope["path"]
+        self.user = user
+        # Set by the authorize step; owners only see their own studio's profiles
+        self.studio = current_studio.get()
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.status = None
+        self.folded = defaultdict(float)
+        self.stack = []
+        self.commands = []
+        self.pending_commands = {}
+
+    # Stack tracking - coroutine frames "call" on every resume and "return" on
+    # every suspend, so the stack only ever holds frames that are running
+    def on_event(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == "call":
+            code = frame.f_code
+            self.stack.append([f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})", now, 0.0])
+        elif event == "c_call":
+            self.stack.append([f"{getattr(arg, '__qualname__', None) or getattr(arg, '__name__', 'builtin')} (builtin)", now, 0.0])
+        elif event in ("return", "c_return", "c_exception"):
+            if not self.stack:
+                # Frames that were already running when profiling started
+                return
+            path = ";".join(entry[0] for entry in self.stack)
+            label, started, children = self.stack.pop()
+            elapsed = now - started
+            self.folded[path] += elapsed - children
+            if self.stack:
+                self.stack[-1][2] += elapsed
+
+    def command_started(self, key, name, target):
+        self.pending_commands[key] = (name, target, time.perf_counter())
+
+    def command_finished(self, key, ok, duration=None):
+        name, target, started = self.pending_commands.pop(key, (None, None, None))
+        if name is None or len(self.commands) >= PROFILE_MAX_COMMANDS:
+            return
+        self.commands.append({
+            "command": name,
+            "target": target,
+            "duration_ms": round((duration if duration is not None else time.perf_counter() - started) * 1000, 3),
+            "ok": ok,
+            "offset_ms": round((started - self.started) * 1000, 3),
+        })
+
+    def finish(self, status):
+        self.duration_ms = round((time.perf_counter() - self.started) * 1000, 3)
+        self.status = status
+
+    def folded_text(self):
+        return "".join(
+            f"{path} {int(seconds * 1_000_000)}\n"
+            for path, seconds in sorted(self.folded.items()) if seconds >= 0.000001
+        )
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "user": self.user,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "command_count": len(self.commands),
+            "command_time_ms": round(sum(command["duration_ms"] for command in self.commands), 3),
+        }
+
+    def to_dict(self):
+        return {**self.summary(), "commands": self.commands, "folded": self.folded_text()}
+
+
+class ProfileStore:
+    def __init__(self, keep=PROFILE_KEEP):
+        self._lock = threading.Lock()
+        self._profiles = deque(maxlen=keep)
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def get(self, profile_id, studio):
+        with self._lock:
+            return next((profile for profile in self._profiles if profile.id == profile_id and profile.studio == studio), None)
+
+    def list(self, studio):
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._profiles) if profile.studio == studio]
+
+
+profiles = ProfileStore()
+
+# sys.setprofile is per thread and holds one function; a single dispatcher is
+# installed while any profile is running and forwards to the profile (if any)
+# that owns the current context
+_active_lock = threading.Lock()
+_active_count = 0
+
+
+def profiling():
+    # Whether the current request is being profiled; the profiler only sees the
+    # thread it was installed on, so work handed to other threads goes unrecorded
+    return _current.get() is not None
+
+
+def _dispatch(frame, event, arg):
+    profile = _current.get()
+    if profile is not None:
+        profile.on_event(frame, event, arg)
+
+
+def _activate():
+    global _active_count
+    with _active_lock:
+        _active_count += 1
+        sys.setprofile(_dispatch)
+
+
+def _deactivate():
+    global _active_count
+    with _active_lock:
+        _active_count -= 1
+        if _active_count == 0:
+            sys.setprofile(None)
+
+
+# Database command capture
+
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        profile = _current.get()
+        if profile is not None:
+            target = event.command.get(event.command_name)
+            profile.command_started(
+                (event.request_id, event.connection_id), event.command_name,
+                f"{event.database_name}.{target}" if isinstance(target, str) else event.database_name
+            )
+
+    def succeeded(self, event):
+        profile = _current.get()
+        if profile is not None:
+            profile.command_finished((event.request_id, event.connection_id), True, event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        profile = _current.get()
+        if profile is not None:
+            profile.command_finished((event.request_id, event.connection_id), False, event.duration_micros / 1_000_000)
+
+
+# Must be registered before any MongoClient is created
+monitoring.register(MongoCommandListener())
+
+
+def record_sql(sql, seconds):
+    # SQLiteStorage.on_query hook
+    profile = _current.get()
+    if profile is not None:
+        key = object()
+        profile.command_started(key, sql.split(None, 1)[0].upper(), " ".join(sql.split())[:200])
+        profile.command_finished(key, True, seconds)
+
+
+def wants_profile(scope):
+    if (b"x-profile", b"1") in scope["headers"]:
+        return True
+    return b"profile=1" in scope.get("query_string", b"").split(b"&")
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, authorize):
+        self.app = app
+        # async (request) -> user label, or None when the caller may not profile
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        user = await self.authorize(Request(scope))
+        if user is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope, user)
+        status = {}
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode()),
+                    (b"x-profile-url", f"/api/profiles/{profile.id}".encode()),
+                ]
+            await send(message)
+
+        token = _current.set(profile)
+        _activate()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _deactivate()
+            _current.reset(token)
+            profile.finish(status.get("code"))
+            profiles.add(profile)
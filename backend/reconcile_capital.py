@@ -0,0 +1,83 @@
+# Recomputes every partner's capital from the investments ledger in one grouped
+# query, on top of the opening_capital partners were seeded with, and reports
+# partners whose capital_invested has drifted from it:
+#   python reconcile_capital.py          # report only
+#   python reconcile_capital.py --fix    # move capital_invested to the ledger total
+#
+# Fixes apply the difference with $inc, so investments recorded while the job
+# runs are not overwritten.
+import argparse
+import json
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from storage import open_storage
+
+TOLERANCE = 0.005
+
+
+def reconcile(storage, fix=False):
+    ledger = {
+        row["_id"]: (row["total"], row["count"])
+        for row in storage.collection("investments").aggregate([
+            {"$match": {"deleted": {"$ne": True}}},
+            {"$group": {"_id": "$partner_id", "total": {"$sum": "$amount_inr"}, "count": {"$sum": 1}}}
+        ])
+    }
+
+    partners = storage.collection("partners")
+    drift = []
+    checked = 0
+    for partner in partners.find():
+        checked += 1
+        investments_total, count = ledger.pop(partner["id"], (0.0, 0))
+        opening = partner.get("opening_capital", 0.0)
+        expected = opening + investments_total
+        recorded = partner.get("capital_invested", 0.0)
+        if abs(recorded - expected) > TOLERANCE:
+            drift.append({
+                "partner_id": partner["id"],
+                "partner_name": partner["name"],
+                "capital_invested": recorded,
+                "opening_capital": opening,
+                "investments_total": investments_total,
+                "investments_count": count,
+                "drift": round(recorded - expected, 2),
+            })
+
+    if fix and drift:
+        for row in drift:
+            partners.update_one({"id": row["partner_id"]}, {"$inc": {"capital_invested": -row["drift"]}})
+        storage.collection("collection_versions").update_one(
+            {"_id": "partners"},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    return {
+        "checked_at": datetime.now(timezone.utc).isoformat(),
+        "partners_checked": checked,
+        "drift": drift,
+        # Investments pointing at partners that no longer exist
+        "orphaned": [
+            {"partner_id": partner_id, "investments_total": total, "investments_count": count}
+            for partner_id, (total, count) in ledger.items()
+        ],
+        "fixed": bool(fix and drift),
+    }
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Reconcile partner capital with the investments ledger")
+    parser.add_argument("--fix", action="store_true", help="apply the drift back to capital_invested")
+    args = parser.parse_args()
+
+    report = reconcile(open_storage(), fix=args.fix)
+    print(json.dumps(report, indent=2, default=str))
+    if report["drift"]:
+        print(f"{'✅ Fixed' if report['fixed'] else '⚠️  Found'} drift for {len(report['drift'])} partner(s)")
+    else:
+        print(f"✅ Capital matches investments for all {report['partners_checked']} partners")
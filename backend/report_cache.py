@@ -0,0 +1,164 @@
+# Computed report cache with single-flight, and the scheduler that warms it.
+#
+# Results are keyed by studio, report and parameters, and stamped with the
+# collection versions they were computed at (the same versions behind ETags),
+# so a write makes the next request recompute instead of serving stale data.
+# Identical requests that arrive while a computation is running wait for it
+# instead of starting their own; computations run on a worker thread so the
+# event loop keeps serving meanwhile, except in profiled requests, which compute
+# on the loop thread so the profile includes them.
+#
+# On the 1st of the month everyone opens the dashboard for the month that just
+# ended. The scheduler notices the month change and precomputes the reports
+# every studio will ask for; bulk imports ask it to re-warm their studio.
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from metrics import metrics
+from profiler import profiling
+from tenancy import current_studio, use_studio
+
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+WARMUP_ENABLED = os.getenv("REPORT_WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_CHECK_SECONDS = float(os.getenv("REPORT_WARMUP_CHECK_SECONDS", "60"))
+# Batches at least this large count as imports and re-warm their studio
+WARMUP_IMPORT_OPERATIONS = int(os.getenv("REPORT_WARMUP_IMPORT_OPERATIONS", "50"))
+# Successive imports within this window are warmed once
+WARMUP_DEBOUNCE_SECONDS = 2.0
+
+
+class ReportCache:
+    def __init__(self, max_entries=REPORT_CACHE_SIZE):
+        self.max_entries = max_entries
+        # (studio, report, params) -> (versions stamp, result), least recently used first
+        self._results = OrderedDict()
+        # ((studio, report, params), stamp) -> future of the running computation
+        self._inflight = {}
+
+    async def get(self, report, params, versions, compute):
+        # compute() is a blocking function; versions is {collection: version}
+        key = (current_studio.get(), report, tuple(sorted(params.items())))
+        stamp = tuple(sorted(versions.items()))
+        cached = self._results.get(key)
+        if cached is not None and cached[0] == stamp:
+            self._results.move_to_end(key)
+            metrics.inc("report_cache", report=report, result="hit")
+            return cached[1]
+
+        flight = (key, stamp)
+        future = self._inflight.get(flight)
+        if future is None:
+            metrics.inc("report_cache", report=report, result="miss")
+            if profiling():
+                result = compute()
+                self._store(key, stamp, result)
+                return result
+            # to_thread copies the context, so the studio and read routing carry over
+            future = asyncio.ensure_future(asyncio.to_thread(compute))
+            self._inflight[flight] = future
+            future.add_done_callback(lambda done: self._finish(flight, done))
+        else:
+            metrics.inc("report_cache", report=report, result="coalesced")
+        # A waiter that goes away must not cancel the computation the others share
+        return await asyncio.shield(future)
+
+    def _finish(self, flight, future):
+        self._inflight.pop(flight, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._store(*flight, future.result())
+
+    def _store(self, key, stamp, result):
+        # A computation that started before a write can finish after the one
+        # that started after it; never replace a newer result with an older one
+        cached = self._results.get(key)
+        if cached is not None and any(new < old for (_, new), (_, old) in zip(stamp, cached[0])):
+            return
+        self._results[key] = (stamp, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        self._results.clear()
+
+
+class WarmupScheduler:
+    def __init__(self, warm, studios):
+        # warm(): coroutine warming the active studio's reports
+        # studios(): the studios this process has served
+        self.warm = warm
+        self.studios = studios
+        self._loop = None
+        self._lock = threading.Lock()
+        self._month = None
+        self._requested = {}
+        self.last_runs = {}
+
+    def ensure_running(self):
+        # Bound lazily on the first request, like the loop watchdog - the loop
+        # only exists once serving starts
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        with self._lock:
+            self._loop = loop
+            if self._month is None:
+                self._month = datetime.now().strftime("%Y-%m")
+        loop.create_task(self._watch_month(loop))
+
+    async def _watch_month(self, loop):
+        # Checks the local month (what the dashboard defaults from) periodically
+        # rather than sleeping until the 1st, so clock changes and suspends are safe
+        while loop is self._loop:
+            await asyncio.sleep(WARMUP_CHECK_SECONDS)
+            month = datetime.now().strftime("%Y-%m")
+            if month != self._month:
+                self._month = month
+                for studio in self.studios():
+                    await self._run(studio, "month_rollover")
+
+    def request(self, studio, reason):
+        # Warm one studio soon - after bulk imports
+        if self._loop is None:
+            return
+        with self._lock:
+            pending = self._requested.get(studio)
+            if pending is not None and not pending.done():
+                return
+            self._requested[studio] = self._loop.create_task(self._debounced(studio, reason))
+
+    async def _debounced(self, studio, reason):
+        await asyncio.sleep(WARMUP_DEBOUNCE_SECONDS)
+        await self._run(studio, reason)
+
+    async def _run(self, studio, reason):
+        started = time.perf_counter()
+        try:
+            with use_studio(studio):
+                await self.warm()
+            outcome = "ok"
+        except Exception as e:
+            outcome = f"error: {e}"[:200]
+        metrics.inc("report_warmups", reason=reason, outcome="ok" if outcome == "ok" else "error")
+        self.last_runs[studio] = {
+            "reason": reason,
+            "outcome": outcome,
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+
+class WarmupMiddleware:
+    def __init__(self, app, scheduler):
+        self.app = app
+        self.scheduler = scheduler
+
+    async def __call__(self, scope, receive, send):
+        if WARMUP_ENABLED and scope["type"] == "http":
+            self.scheduler.ensure_running()
+        await self.app(scope, receive, send)
@@ -0,0 +1,171 @@
+# Incrementally maintained rollups, so analytics read a few small documents
+# instead of scanning the ledgers:
+#   utilization_rollups - per month hours, shoots and revenue for each cameraman,
+#                         shoot type and city
+#   cash_rollups        - per month money received (sales) and paid (expenses)
+#                         by each person and payment mode
+#
+# Ledger writes apply their difference with $inc. Both are built on first start;
+# rebuild by hand after bulk data changes:
+#   python rollups.py
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from archive import ARCHIVED_COLLECTIONS, Archive
+from storage import open_storage
+
+UTILIZATION_COLLECTION = "utilization_rollups"
+CASH_COLLECTION = "cash_rollups"
+DIMENSIONS = ("cameraman", "shoot_type", "city")
+
+
+def rollup_id(*parts):
+    return "|".join("" if part is None else str(part) for part in parts)
+
+
+# Each function yields (rollup _id, identifying fields, increments) for one
+# ledger document; sign is -1 to take a document's contribution back out
+
+def utilization_rows(sale, sign):
+    month = sale["date"][:7]
+    for dimension in DIMENSIONS:
+        value = sale.get(dimension)
+        yield rollup_id(month, dimension, value), {"month": month, "dimension": dimension, "value": value}, {
+            "hours": sign * float(sale.get("total_time_hrs") or 0),
+            "shoots": sign,
+            "revenue": sign * float(sale.get("total_amount_inr") or 0),
+        }
+
+
+def cash_sale_rows(sale, sign):
+    month = sale["date"][:7]
+    holder, mode = sale.get("received_by"), sale.get("payment_mode")
+    yield rollup_id(month, holder, mode), {"month": month, "holder": holder, "payment_mode": mode}, {
+        "received": sign * float(sale.get("total_amount_inr") or 0),
+        "paid": 0.0,
+        "entries": sign,
+    }
+
+
+def cash_expense_rows(expense, sign):
+    month = expense["date"][:7]
+    holder, mode = expense.get("paid_by"), expense.get("payment_mode")
+    yield rollup_id(month, holder, mode), {"month": month, "holder": holder, "payment_mode": mode}, {
+        "received": 0.0,
+        "paid": sign * float(expense.get("amount_inr") or 0),
+        "entries": sign,
+    }
+
+
+def _merge(totals, rows):
+    for key, fields, increments in rows:
+        if key in totals:
+            current = totals[key][1]
+            for name, amount in increments.items():
+                current[name] += amount
+        else:
+            totals[key] = (fields, dict(increments))
+
+
+def _apply(collection, changes, session=None):
+    # changes: (rows_for, before, after) per document. Moves each document's
+    # contribution from its old values to its new ones in one bulk write;
+    # before=None for a create, after=None for a delete
+    totals = {}
+    for rows_for, before, after in changes:
+        for doc, sign in ((before, -1), (after, 1)):
+            if doc is not None:
+                _merge(totals, rows_for(doc, sign))
+
+    now = datetime.now(timezone.utc)
+    requests = [
+        UpdateOne(
+            {"_id": key},
+            {"$inc": increments, "$set": {"updated_at": now}, "$setOnInsert": fields},
+            upsert=True
+        )
+        for key, (fields, increments) in totals.items()
+        if any(increments.values())
+    ]
+    if requests:
+        collection.bulk_write(requests, ordered=False, session=session)
+
+
+def apply_changes(storage, sales=(), expenses=(), session=None):
+    # sales / expenses: (before, after) pairs
+    _apply(storage.collection(UTILIZATION_COLLECTION), [(utilization_rows, before, after) for before, after in sales], session)
+    _apply(
+        storage.collection(CASH_COLLECTION),
+        [(cash_sale_rows, before, after) for before, after in sales]
+        + [(cash_expense_rows, before, after) for before, after in expenses],
+        session
+    )
+
+
+def apply_sale_change(storage, before=None, after=None):
+    apply_changes(storage, sales=[(before, after)])
+
+
+def apply_expense_change(storage, before=None, after=None):
+    apply_changes(storage, expenses=[(before, after)])
+
+
+# Rebuilds stream each ledger once, archived years included, through the same
+# row functions, so a rebuilt rollup matches what incremental updates produced
+
+REBUILDS = {
+    UTILIZATION_COLLECTION: [("sales", utilization_rows)],
+    CASH_COLLECTION: [("sales", cash_sale_rows), ("expenses", cash_expense_rows)],
+}
+INDEXES = {
+    UTILIZATION_COLLECTION: [("dimension", 1), ("month", 1)],
+    CASH_COLLECTION: [("month", 1)],
+}
+
+
+def rebuild_one(storage, name):
+    totals = {}
+    archive = Archive(storage)
+    for ledger, rows_for in REBUILDS[name]:
+        for doc in storage.collection(ledger).find({"deleted": {"$ne": True}}):
+            _merge(totals, rows_for(doc, 1))
+        if ledger in ARCHIVED_COLLECTIONS:
+            for doc in archive.documents(ledger):
+                _merge(totals, rows_for(doc, 1))
+
+    now = datetime.now(timezone.utc)
+    collection = storage.collection(name)
+    collection.delete_many({})
+    documents = [{"_id": key, **fields, **increments, "updated_at": now} for key, (fields, increments) in totals.items()]
+    if documents:
+        collection.insert_many(documents)
+    collection.create_index(INDEXES[name])
+    storage.collection("migrations").update_one(
+        {"_id": name}, {"$set": {"status": "complete", "completed_at": now}}, upsert=True
+    )
+    # Incremental updates are covered by their ledger's version; a rebuild
+    # changes the rollup on its own, so its ETags must change too
+    storage.collection("collection_versions").update_one(
+        {"_id": name}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True
+    )
+    return len(documents)
+
+
+def rebuild(storage):
+    return {name: rebuild_one(storage, name) for name in REBUILDS}
+
+
+def ensure_built(storage):
+    for name in REBUILDS:
+        doc = storage.collection("migrations").find_one({"_id": name})
+        if not (doc and doc.get("status") == "complete"):
+            print(f"✅ {name} built ({rebuild_one(storage, name)} rows)")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    for name, count in rebuild(open_storage()).items():
+        print(f"✅ {name} rebuilt ({count} rows)")
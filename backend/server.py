@@ -1,22 +1,53 @@
-from fastapi import FastAPI, HTTPException, Header, Response, Cookie, Request
+from fastapi import FastAPI, HTTPException, Header, Response, Cookie, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List
-from datetime import datetime, timezone, timedelta
-from pymongo import MongoClient, DESCENDING
+from datetime import date, datetime, timezone, timedelta
+from pymongo import DESCENDING, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 import os
+import re
 from dotenv import load_dotenv
 import httpx
 import uuid
+import time
+import hashlib
+import json
+import asyncio
+from email.utils import format_datetime, parsedate_to_datetime
 
 load_dotenv()
 
+# Local modules read their settings from the environment at import time
+from metrics import metrics
+from admission import AdmissionMiddleware
+from loop_watchdog import LoopWatchdogMiddleware, watchdog
+from profiler import ProfilingMiddleware, profiles, record_sql
+from slow_queries import SlowQueryMiddleware, slow_log, SLOW_QUERY_LOG_ENABLED
+from report_cache import ReportCache, WarmupScheduler, WarmupMiddleware, WARMUP_IMPORT_OPERATIONS
+from migrate_dates import to_date_at, MIGRATION_ID as DATE_MIGRATION_ID
+from rollups import (
+    UTILIZATION_COLLECTION, CASH_COLLECTION, DIMENSIONS as UTILIZATION_DIMENSIONS,
+    apply_changes as apply_rollup_changes, apply_sale_change, apply_expense_change, ensure_built as ensure_rollups
+)
+from reconcile_capital import reconcile as reconcile_capital
+from archive import Archive, ARCHIVED_COLLECTIONS
+from storage import open_storage, DEFAULT_STUDIO
+from tenancy import TenantStorage, current_studio, studio_partners
+
 app = FastAPI()
 
 # Get APP_URL from environment - override with correct URL
 APP_URL = "https://photo-tracker-16.preview.emergentagent.com"
 
+# Emergent session lookup - overridable so load tests can point it at a local stub
+EMERGENT_SESSION_URL = os.getenv("EMERGENT_SESSION_URL", "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data")
+
+# Admission control - registered before CORS so 429 responses still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
+
 # CORS configuration - Allow all preview.emergentagent.com domains
 app.add_middleware(
     CORSMiddleware,
@@ -24,55 +55,393 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Archived-Years"],
 )
 
-# MongoDB setup
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/")
-DATABASE_NAME = os.getenv("DATABASE_NAME", "finance_tracker")
+# Per-request profiling - owners opt in with "X-Profile: 1" or "?profile=1".
+# The lambda defers the lookup because profile_user is defined further down.
+app.add_middleware(ProfilingMiddleware, authorize=lambda request: profile_user(request))
+
+# Slow-query log - tags recorded database commands with the route that issued them
+app.add_middleware(SlowQueryMiddleware)
+
+# Report cache - dashboard and report results are reused until their collections
+# change; the scheduler precomputes them at month rollover and after imports.
+# The lambdas defer the lookups because warm_reports and storage come further down.
+report_cache = ReportCache()
+warmup = WarmupScheduler(warm=lambda: warm_reports(), studios=lambda: storage.prepared_studios())
+app.add_middleware(WarmupMiddleware, scheduler=warmup)
+
+# Event-loop watchdog - outermost, so stalls anywhere in the stack are attributed
+app.add_middleware(LoopWatchdogMiddleware)
+
+# Storage setup - MongoDB by default, STORAGE_BACKEND=sqlite for an embedded database.
+# Each studio's data lives in its own database; requests use their user's studio
+storage = TenantStorage(open_storage(DEFAULT_STUDIO))
+if SLOW_QUERY_LOG_ENABLED:
+    slow_log.install(storage)
+if storage.name == "sqlite":
+    def on_sql_query(sql, seconds):
+        record_sql(sql, seconds)
+        slow_log.record_sql(sql, seconds)
+    storage.on_query = on_sql_query
+
+# Closed financial years moved to Arrow files by archive.py - reports merge them back in
+_archives = {}
 
-client = MongoClient(MONGO_URL)
-db = client[DATABASE_NAME]
+def studio_archive():
+    studio = current_studio.get()
+    if studio not in _archives:
+        _archives[studio] = Archive(storage.current())
+    return _archives[studio]
 
 # Collections
-users_collection = db["users"]
-partners_collection = db["partners"]
-sales_collection = db["sales"]
-expenses_collection = db["expenses"]
-partner_payments_collection = db["partner_payments"]
-investments_collection = db["investments"]
-sessions_collection = db["user_sessions"]
+users_collection = storage.collection("users")
+partners_collection = storage.collection("partners")
+sales_collection = storage.collection("sales")
+expenses_collection = storage.collection("expenses")
+partner_payments_collection = storage.collection("partner_payments")
+investments_collection = storage.collection("investments")
+sessions_collection = storage.collection("user_sessions")
+
+# Read routing - report and list reads may go to secondaries,
+# auth, sync and writes always use the primary collections above
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+# MongoDB rejects maxStalenessSeconds below 90
+MAX_STALENESS_SECONDS = max(int(os.getenv("MAX_STALENESS_SECONDS", "90")), 90)
+
+def build_read_preference(mode):
+    if mode not in READ_PREFERENCE_MODES:
+        raise ValueError(f"Unknown read preference: {mode}")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCE_MODES[mode](max_staleness=MAX_STALENESS_SECONDS)
+
+READ_PREFERENCES = {
+    "primary": Primary(),
+    "report": build_read_preference(os.getenv("REPORT_READ_PREFERENCE", "primary")),
+    "list": build_read_preference(os.getenv("LIST_READ_PREFERENCE", "primary")),
+}
+
+def read_collection(name, route_class, route):
+    read_preference = READ_PREFERENCES[route_class]
+    metrics.inc("routed_reads", route=route, read_preference=read_preference.name)
+    return storage.collection(name, read_preference=read_preference)
+
+# Change versions - every write bumps its collection's version so read endpoints
+# can answer conditional GETs without querying or serializing the data
+versions_collection = storage.collection("collection_versions")
+
+def bump_versions(*names):
+    now = datetime.now(timezone.utc)
+    for name in names:
+        versions_collection.update_one(
+            {"_id": name},
+            {"$inc": {"version": 1}, "$set": {"updated_at": now}},
+            upsert=True
+        )
+
+def read_versions(names, route_class, route):
+    # Versions are read with the same read preference as the data they describe,
+    # so an ETag is never newer than the body served with it
+    return {
+        doc["_id"]: doc
+        for doc in read_collection("collection_versions", route_class, route).find({"_id": {"$in": list(names)}})
+    }
+
+def version_numbers(versions, names):
+    return {name: versions.get(name, {}).get("version", 0) for name in names}
+
+def conditional_get(request, response, route_class, route, names, **params):
+    versions = read_versions(names, route_class, route)
+    # Kept for handlers that cache what they compute at these versions
+    request.state.versions = version_numbers(versions, names)
+    
+    tag_source = json.dumps({
+        "studio": current_studio.get(),
+        "route": route,
+        "query": sorted(request.query_params.multi_items()),
+        "params": params,
+        "versions": sorted(request.state.versions.items())
+    }, sort_keys=True, default=str)
+    etag = '"' + hashlib.sha1(tag_source.encode()).hexdigest() + '"'
+    
+    last_modified = None
+    for doc in versions.values():
+        updated_at = doc.get("updated_at")
+        if updated_at is None:
+            continue
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        if last_modified is None or updated_at > last_modified:
+            last_modified = updated_at
+    
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(microsecond=0), usegmt=True)
+    
+    not_modified = False
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        not_modified = etag in candidates or "*" in candidates
+    elif last_modified and request.headers.get("If-Modified-Since"):
+        # Last-Modified has whole seconds, so a write later in the same second
+        # carries the same date - only strictly older data counts as unchanged.
+        # The ETag above has no such gap, which is why it takes precedence
+        try:
+            not_modified = last_modified.replace(microsecond=0) < parsedate_to_datetime(request.headers["If-Modified-Since"])
+        except (TypeError, ValueError):
+            not_modified = False
+    
+    if not_modified:
+        metrics.inc("not_modified", route=route)
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
+    return None
+
+# Ledger documents are soft-deleted so offline clients can sync the deletion
+LEDGER_COLLECTIONS = {
+    "sales": sales_collection,
+    "expenses": expenses_collection,
+    "investments": investments_collection,
+    "partner_payments": partner_payments_collection,
+}
+
+def not_deleted(query=None):
+    return {**(query or {}), "deleted": {"$ne": True}}
+
+def init_indexes():
+    for name, collection in LEDGER_COLLECTIONS.items():
+        # Documents written before updated_at existed sync from their creation time
+        collection.update_many(
+            {"updated_at": {"$exists": False}},
+            [{"$set": {"updated_at": "$created_at"}}]
+        )
+        collection.create_index("id")
+        # Sync pages are sorted by (updated_at, _id) and read straight from this index
+        collection.create_index([("updated_at", 1), ("_id", 1)])
+        collection.create_index("date_at")
+    partner_payments_collection.create_index([("partner_id", 1), ("date_at", 1)])
+    sales_collection.create_index("shoot_id")
+    
+    # Lookups every authenticated request makes
+    sessions_collection.create_index("session_token")
+    users_collection.create_index("id")
+    users_collection.create_index("email")
+    partners_collection.create_index("id")
+
+def writable(name, query):
+    # Leaves out documents in years being or already archived - archive.py
+    # deletes their hot copies, so a write to one would be lost
+    locked = studio_archive().locked(name) if name in ARCHIVED_COLLECTIONS else []
+    if not locked:
+        return not_deleted(query)
+    return {"$and": [not_deleted(query)] + [{"$or": [{"date": {"$lt": start}}, {"date": {"$gte": end}}]} for start, end in locked]}
+
+def ledger_missing(name, doc_id, detail):
+    # For writes that matched nothing: 409 if the document is in an archived year
+    doc = LEDGER_COLLECTIONS[name].find_one(not_deleted({"id": doc_id}))
+    if doc and studio_archive().covers(name, doc["date"]):
+        raise HTTPException(status_code=409, detail=f"{doc['date']} is in an archived financial year")
+    raise HTTPException(status_code=404, detail=detail)
+
+def mark_archived(response, name):
+    # Lists and sync only return hot data - tell clients which financial years
+    # have moved to the archive so they can say those are not shown
+    years = studio_archive().fiscal_years(name)
+    if years:
+        response.headers["X-Archived-Years"] = ",".join(str(year) for year in years)
+
+def soft_delete(name, doc_id, session=None):
+    # Leaves a tombstone instead of removing the document. Callers bump the
+    # version once the delete has committed
+    now = datetime.now(timezone.utc)
+    return LEDGER_COLLECTIONS[name].find_one_and_update(
+        writable(name, {"id": doc_id}),
+        {"$set": {"deleted": True, "deleted_at": now, "updated_at": now}},
+        session=session
+    )
+
+# Native dates - reports query date_at once migrate_dates.py has backfilled it,
+# and keep using the "YYYY-MM-DD" string until then
+migrations_collection = storage.collection("migrations")
+DATE_MIGRATION_RECHECK_SECONDS = 60
+# {studio: {"complete", "checked_at"}} - each studio migrates on its own
+_date_migration = {}
+
+def dates_migrated():
+    state = _date_migration.setdefault(current_studio.get(), {"complete": False, "checked_at": None})
+    checked_at = state["checked_at"]
+    if not state["complete"] and (checked_at is None or time.monotonic() - checked_at > DATE_MIGRATION_RECHECK_SECONDS):
+        doc = migrations_collection.find_one({"_id": DATE_MIGRATION_ID})
+        state["complete"] = bool(doc and doc.get("status") == "complete")
+        state["checked_at"] = time.monotonic()
+    return state["complete"]
+
+def month_bounds(year, month):
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    if month == 12:
+        end = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    else:
+        end = datetime(year, month + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+# Month parameters are "YYYY-MM"; anything else is a 400 rather than a failed report
+MONTH_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+def check_month(value, name="month"):
+    if value is not None and (not MONTH_PATTERN.match(value) or not "0001" <= value[:4] <= "9998"):
+        raise HTTPException(status_code=400, detail=f"{name} must be a YYYY-MM month")
+    return value
+
+def date_range(start, end):
+    if dates_migrated():
+        return {"date_at": {"$gte": start, "$lt": end}}
+    return {"date": {"$gte": start.strftime("%Y-%m-%d"), "$lt": end.strftime("%Y-%m-%d")}}
+
+PERIOD_KEY_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+
+def period_totals(reader, amount_field, start, end, unit="month"):
+    # {"YYYY-MM" or "YYYY-MM-DD": (total, count)} from one grouped query per hot
+    # segment instead of fetching every document and summing in Python
+    key_length = len(PERIOD_KEY_FORMATS[unit]) + 2
+    if dates_migrated():
+        period_key = {"$dateToString": {"format": PERIOD_KEY_FORMATS[unit], "date": "$date_at"}}
+    else:
+        period_key = {"$substrCP": ["$date", 0, key_length]}
+    
+    hot, archived = studio_archive().split(reader.name, start, end)
+    totals = studio_archive().period_totals(archived, amount_field, start, end, key_length)
+    for segment_start, segment_end in hot:
+        for row in reader.aggregate([
+            {"$match": not_deleted(date_range(segment_start, segment_end))},
+            {"$group": {"_id": period_key, "total": {"$sum": f"${amount_field}"}, "count": {"$sum": 1}}}
+        ]):
+            total, count = totals.get(row["_id"], (0, 0))
+            totals[row["_id"]] = (total + row["total"], count + row["count"])
+    return totals
+
+def monthly_totals(reader, amount_field, start, end):
+    return period_totals(reader, amount_field, start, end, "month")
+
+def range_totals(reader, amount_field, start, end):
+    totals = monthly_totals(reader, amount_field, start, end).values()
+    return sum(total for total, _ in totals), sum(count for _, count in totals)
+
+def partner_totals(reader, start, end):
+    # {partner_id: amount paid} for every partner in one query per hot segment
+    hot, archived = studio_archive().split(reader.name, start, end)
+    totals = studio_archive().partner_totals(archived, start, end)
+    for segment_start, segment_end in hot:
+        for row in reader.aggregate([
+            {"$match": not_deleted(date_range(segment_start, segment_end))},
+            {"$group": {"_id": "$partner_id", "total": {"$sum": "$amount_inr"}}}
+        ]):
+            totals[row["_id"]] = totals.get(row["_id"], 0) + row["total"]
+    return totals
+
+# Range report buckets - quarters and years start in FISCAL_YEAR_START_MONTH
+# (April for the Indian financial year, 1 for calendar quarters)
+RANGE_GRANULARITIES = ("day", "week", "month", "quarter", "year")
+FISCAL_YEAR_START_MONTH = int(os.getenv("FISCAL_YEAR_START_MONTH", "4"))
+MAX_RANGE_BUCKETS = 1000
+
+def bucket_start(day, granularity):
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    months = 3 if granularity == "quarter" else 12
+    month_index = day.year * 12 + day.month - 1
+    month_index -= (day.month - FISCAL_YEAR_START_MONTH) % months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def next_bucket(start, granularity):
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(days=7)
+    month_index = start.year * 12 + start.month - 1 + {"month": 1, "quarter": 3, "year": 12}[granularity]
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def bucket_label(start, granularity):
+    if granularity == "day":
+        return start.isoformat()
+    if granularity == "week":
+        iso_year, iso_week, _ = start.isocalendar()
+        return f"{iso_year}-W{str(iso_week).zfill(2)}"
+    if granularity == "month":
+        return start.strftime("%Y-%m")
+    # Fiscal years are named by the year they start in: FY2025-26
+    fiscal_year = start.year if start.month >= FISCAL_YEAR_START_MONTH else start.year - 1
+    year_label = str(fiscal_year) if FISCAL_YEAR_START_MONTH == 1 else f"FY{fiscal_year}-{str(fiscal_year + 1)[2:]}"
+    if granularity == "year":
+        return year_label
+    quarter = (start.month - FISCAL_YEAR_START_MONTH) % 12 // 3 + 1
+    return f"{year_label} Q{quarter}"
+
+# Partners the default studio starts with; other studios bring theirs when
+# added with tenancy.py
+DEFAULT_PARTNERS = [
+    {"name": "Silar", "share_percentage": 75.0, "capital_invested": 6150000.0},
+    {"name": "Om", "share_percentage": 13.41, "capital_invested": 1100000.0},
+    {"name": "Anurag", "share_percentage": 6.10, "capital_invested": 500000.0},
+    {"name": "RK", "share_percentage": 3.66, "capital_invested": 300000.0},
+    {"name": "Vijay", "share_percentage": 1.83, "capital_invested": 150000.0},
+]
 
 # Initialize default partners if not exists
 def init_partners():
+    studio = current_studio.get()
+    seed_partners = DEFAULT_PARTNERS if studio == DEFAULT_STUDIO else studio_partners(storage, studio)
     if partners_collection.count_documents({}) == 0:
-        default_partners = [
-            {"id": str(uuid.uuid4()), "name": "Silar", "share_percentage": 75.0, "capital_invested": 6150000.0, "created_at": datetime.now(timezone.utc)},
-            {"id": str(uuid.uuid4()), "name": "Om", "share_percentage": 13.41, "capital_invested": 1100000.0, "created_at": datetime.now(timezone.utc)},
-            {"id": str(uuid.uuid4()), "name": "Anurag", "share_percentage": 6.10, "capital_invested": 500000.0, "created_at": datetime.now(timezone.utc)},
-            {"id": str(uuid.uuid4()), "name": "RK", "share_percentage": 3.66, "capital_invested": 300000.0, "created_at": datetime.now(timezone.utc)},
-            {"id": str(uuid.uuid4()), "name": "Vijay", "share_percentage": 1.83, "capital_invested": 150000.0, "created_at": datetime.now(timezone.utc)},
-        ]
-        partners_collection.insert_many(default_partners)
-        print("✅ Default partners initialized")
+        if seed_partners:
+            # Seeded capital has no investment records; opening_capital is the
+            # baseline reconciliation adds the investments ledger to
+            partners_collection.insert_many([
+                {"id": str(uuid.uuid4()), **partner, "opening_capital": partner["capital_invested"], "created_at": datetime.now(timezone.utc)}
+                for partner in seed_partners
+            ])
+            bump_versions("partners")
+            print(f"✅ Default partners initialized ({studio})")
     else:
         # Update existing partners with capital_invested if not present
+        capital_map = {partner["name"]: partner["capital_invested"] for partner in seed_partners}
         for partner in partners_collection.find():
             if "capital_invested" not in partner:
-                capital_map = {
-                    "Silar": 6150000.0,
-                    "Om": 1100000.0,
-                    "Anurag": 500000.0,
-                    "RK": 300000.0,
-                    "Vijay": 150000.0
-                }
                 capital = capital_map.get(partner["name"], 0.0)
                 partners_collection.update_one(
                     {"id": partner["id"]},
-                    {"$set": {"capital_invested": capital}}
+                    {"$set": {"capital_invested": capital, "opening_capital": capital}}
+                )
+                bump_versions("partners")
+            elif "opening_capital" not in partner and partner["name"] in capital_map:
+                # Partners seeded before opening_capital existed
+                partners_collection.update_one(
+                    {"id": partner["id"]},
+                    {"$set": {"opening_capital": capital_map[partner["name"]]}}
                 )
-        print("✅ Partners capital updated")
+                bump_versions("partners")
+        print(f"✅ Partners capital updated ({studio})")
 
-init_partners()
+def init_studio():
+    # Runs once per studio and process, the first time one of its users is seen
+    init_indexes()
+    init_partners()
+    ensure_rollups(storage)
+
+storage.prepare = init_studio
+storage.activate(DEFAULT_STUDIO)
 
 # Pydantic Models
 class User(BaseModel):
@@ -82,6 +451,7 @@ class User(BaseModel):
     picture: Optional[str] = None
     role: str = "EMPLOYEE"
     user_type: Optional[str] = "employee"
+    studio_id: str = DEFAULT_STUDIO
     created_at: datetime
 
     class Config:
@@ -165,9 +535,28 @@ async def get_current_user(request: Request):
     if not user_doc:
         raise HTTPException(status_code=404, detail="User not found")
     
+    # Every collection the request touches from here on is the user's studio's
+    storage.activate(user_doc.get("studio_id") or DEFAULT_STUDIO)
+    
     user_doc["_id"] = user_doc["id"]
     return User(**user_doc)
 
+def studio_users(query=None):
+    # Users from before studios existed (or added with mongosh) have no studio_id
+    # and belong to the default studio
+    studio = current_studio.get()
+    if studio == DEFAULT_STUDIO:
+        return {**(query or {}), "$or": [{"studio_id": studio}, {"studio_id": {"$exists": False}}]}
+    return {**(query or {}), "studio_id": studio}
+
+async def profile_user(request: Request):
+    # Only owners may profile requests; anyone else's flag is ignored
+    try:
+        user = await get_current_user(request)
+    except HTTPException:
+        return None
+    return user.email if user.role == "OWNER" else None
+
 # Routes
 @app.get("/")
 async def root():
@@ -195,7 +584,7 @@ async def create_session(session_id: str = Header(..., alias="X-Session-ID")):
     async with httpx.AsyncClient() as client:
         try:
             auth_response = await client.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
+                EMERGENT_SESSION_URL,
                 headers={"X-Session-ID": session_id}
             )
             auth_response.raise_for_status()
@@ -205,6 +594,7 @@ async def create_session(session_id: str = Header(..., alias="X-Session-ID")):
     
     # Check if user exists
     user = users_collection.find_one({"email": data["email"]})
+    storage.activate((user or {}).get("studio_id") or DEFAULT_STUDIO)
     
     if not user:
         # Create new user - check if it exists in admin-created users
@@ -229,9 +619,11 @@ async def create_session(session_id: str = Header(..., alias="X-Session-ID")):
                 "picture": data.get("picture"),
                 "role": "EMPLOYEE",
                 "user_type": "employee",
+                "studio_id": DEFAULT_STUDIO,
                 "created_at": datetime.now(timezone.utc)
             }
             users_collection.insert_one(user_doc)
+        bump_versions("users")
     else:
         user_id = user["id"]
         # Ensure existing users have a role
@@ -240,6 +632,7 @@ async def create_session(session_id: str = Header(..., alias="X-Session-ID")):
                 {"id": user_id},
                 {"$set": {"role": "EMPLOYEE", "user_type": "employee"}}
             )
+            bump_versions("users")
     
     # Store session
     session_token = data["session_token"]
@@ -268,10 +661,14 @@ async def create_session(session_id: str = Header(..., alias="X-Session-ID")):
 
 # Admin - Users endpoints
 @app.get("/api/admin/users")
-async def get_all_users(request: Request):
+async def get_all_users(request: Request, response: Response):
     await get_current_user(request)
     
-    users = list(users_collection.find().sort("created_at", DESCENDING))
+    not_modified = conditional_get(request, response, "list", "/api/admin/users", ["users"])
+    if not_modified:
+        return not_modified
+    
+    users = list(read_collection("users", "list", "/api/admin/users").find(studio_users()).sort("created_at", DESCENDING))
     for user in users:
         user["_id"] = str(user["_id"])
     return users
@@ -294,10 +691,12 @@ async def create_user(user_data: dict, request: Request):
         "role": user_data["role"],  # OWNER or EMPLOYEE
         "picture": None,
         "user_type": user_data["role"].lower(),
+        "studio_id": current_studio.get(),
         "created_at": datetime.now(timezone.utc)
     }
     
     users_collection.insert_one(user)
+    bump_versions("users")
     return {"status": "success", "user_id": user_id, "message": "User created successfully"}
 
 @app.put("/api/admin/users/{user_id}")
@@ -312,9 +711,10 @@ async def update_user(user_id: str, user_data: dict, request: Request):
         "user_type": user_data["role"].lower()
     }
     
-    result = users_collection.update_one({"id": user_id}, {"$set": update_data})
+    result = users_collection.update_one(studio_users({"id": user_id}), {"$set": update_data})
     
     if result.modified_count > 0:
+        bump_versions("users")
         return {"status": "success", "message": "User updated"}
     else:
         raise HTTPException(status_code=404, detail="User not found")
@@ -323,9 +723,10 @@ async def update_user(user_id: str, user_data: dict, request: Request):
 async def delete_user(user_id: str, request: Request):
     await get_current_user(request)
     
-    result = users_collection.delete_one({"id": user_id})
+    result = users_collection.delete_one(studio_users({"id": user_id}))
     
     if result.deleted_count > 0:
+        bump_versions("users")
         return {"status": "success", "message": "User deleted"}
     else:
         raise HTTPException(status_code=404, detail="User not found")
@@ -348,39 +749,24 @@ async def logout(request: Request, response: Response):
     return response
 
 # Dashboard
-@app.get("/api/dashboard/stats")
-async def get_dashboard_stats(request: Request, month: Optional[str] = None):
-    await get_current_user(request)
-    
-    # Default to last month if not specified
-    if not month:
-        today = datetime.now()
-        if today.month == 1:
-            month = f"{today.year - 1}-12"
-        else:
-            month = f"{today.year}-{str(today.month - 1).zfill(2)}"
-    
+DASHBOARD_VERSIONS = ["sales", "expenses", "archives"]
+
+def default_dashboard_month():
+    # Last month - what the dashboard opens on
+    today = datetime.now()
+    if today.month == 1:
+        return f"{today.year - 1}-12"
+    return f"{today.year}-{str(today.month - 1).zfill(2)}"
+
+def dashboard_stats(month):
     # Parse month
-    year, month_num = month.split("-")
-    start_date = f"{year}-{month_num}-01"
-    
-    # Calculate end date
-    if month_num == "12":
-        end_date = f"{int(year)+1}-01-01"
-    else:
-        end_date = f"{year}-{str(int(month_num)+1).zfill(2)}-01"
-    
-    # Get sales
-    sales = list(sales_collection.find({
-        "date": {"$gte": start_date, "$lt": end_date}
-    }))
-    total_revenue = sum(sale["total_amount_inr"] for sale in sales)
+    year, month_num = (int(part) for part in month.split("-"))
+    start, end = month_bounds(year, month_num)
     
-    # Get expenses
-    expenses = list(expenses_collection.find({
-        "date": {"$gte": start_date, "$lt": end_date}
-    }))
-    total_expenses = sum(expense["amount_inr"] for expense in expenses)
+    # Get sales and expenses totals
+    route = "/api/dashboard/stats"
+    total_revenue, _ = range_totals(read_collection("sales", "report", route), "total_amount_inr", start, end)
+    total_expenses, _ = range_totals(read_collection("expenses", "report", route), "amount_inr", start, end)
     
     # Calculate profit
     profit = total_revenue - total_expenses
@@ -392,39 +778,120 @@ async def get_dashboard_stats(request: Request, month: Optional[str] = None):
         "profit": profit
     }
 
+@app.get("/api/dashboard/stats")
+async def get_dashboard_stats(request: Request, response: Response, month: Optional[str] = None):
+    await get_current_user(request)
+    
+    # Default to last month if not specified
+    if not month:
+        month = default_dashboard_month()
+    check_month(month)
+    
+    # The resolved month is part of the ETag since the default moves with the calendar
+    not_modified = conditional_get(request, response, "report", "/api/dashboard/stats", DASHBOARD_VERSIONS, month=month)
+    if not_modified:
+        return not_modified
+    
+    return await report_cache.get("dashboard", {"month": month}, request.state.versions, lambda: dashboard_stats(month))
+
+# Ledger documents - the fields each write takes from the request body,
+# shared by the single-document endpoints and /api/batch
+def sale_fields(data):
+    return {
+        "date": data["date"],
+        "date_at": to_date_at(data["date"]),
+        "shoot_type": data["shoot_type"],
+        "total_time_hrs": data["total_time_hrs"],
+        "total_amount_inr": data["total_amount_inr"],
+        "received_by": data["received_by"],
+        "payment_mode": data["payment_mode"],
+        "cameraman": data.get("cameraman"),
+        "cameraman_mobile": data.get("cameraman_mobile"),
+        "customer_name": data.get("customer_name"),
+        "city": data.get("city")
+    }
+
+def expense_fields(data):
+    return {
+        "date": data["date"],
+        "date_at": to_date_at(data["date"]),
+        "expense_type": data["expense_type"],
+        "amount_inr": data["amount_inr"],
+        "description": data.get("description"),
+        "paid_by": data["paid_by"],
+        "payment_mode": data["payment_mode"]
+    }
+
+def partner_payment_fields(data):
+    return {
+        "date": data["date"],
+        "date_at": to_date_at(data["date"]),
+        "amount_inr": data["amount_inr"],
+        "month_year": data["month_year"],
+        "payment_mode": data["payment_mode"],
+        "description": data.get("description")
+    }
+
+def investment_fields(data):
+    return {
+        "date": data["date"],
+        "date_at": to_date_at(data["date"]),
+        "amount_inr": data["amount_inr"],
+        "description": data.get("description")
+    }
+
+LEDGER_FIELDS = {
+    "sales": sale_fields,
+    "expenses": expense_fields,
+    "partner_payments": partner_payment_fields,
+    "investments": investment_fields,
+}
+
+def ledger_fields(name, data):
+    fields = LEDGER_FIELDS[name](data)
+    # Archived years are read-only; restore them with archive.py to make corrections
+    if studio_archive().covers(name, fields["date"]):
+        raise HTTPException(status_code=409, detail=f"{fields['date']} is in an archived financial year")
+    return fields
+
+def new_ledger_doc(name, data, now):
+    doc = {"id": str(uuid.uuid4()), **ledger_fields(name, data)}
+    # Payments and investments name their partner once, at creation
+    if name in ("partner_payments", "investments"):
+        doc["partner_id"] = data["partner_id"]
+        doc["partner_name"] = data["partner_name"]
+    doc["created_at"] = now
+    doc["updated_at"] = now
+    return doc
+
+def next_shoot_id():
+    last_sale = sales_collection.find_one(sort=[("shoot_id", DESCENDING)])
+    return (last_sale["shoot_id"] + 1) if last_sale else 1
+
+
 # Sales endpoints
 @app.post("/api/sales")
 async def create_sale(sale_data: dict, request: Request):
     await get_current_user(request)
     
-    # Get next shoot_id
-    last_sale = sales_collection.find_one(sort=[("shoot_id", DESCENDING)])
-    next_shoot_id = (last_sale["shoot_id"] + 1) if last_sale else 1
-    
-    sale = {
-        "id": str(uuid.uuid4()),
-        "shoot_id": next_shoot_id,
-        "date": sale_data["date"],
-        "shoot_type": sale_data["shoot_type"],
-        "total_time_hrs": sale_data["total_time_hrs"],
-        "total_amount_inr": sale_data["total_amount_inr"],
-        "received_by": sale_data["received_by"],
-        "payment_mode": sale_data["payment_mode"],
-        "cameraman": sale_data.get("cameraman"),
-        "cameraman_mobile": sale_data.get("cameraman_mobile"),
-        "customer_name": sale_data.get("customer_name"),
-        "city": sale_data.get("city"),
-        "created_at": datetime.now(timezone.utc)
-    }
+    sale = new_ledger_doc("sales", sale_data, datetime.now(timezone.utc))
+    sale["shoot_id"] = next_shoot_id()
     
     sales_collection.insert_one(sale)
-    return {"status": "success", "shoot_id": next_shoot_id}
+    apply_sale_change(storage, after=sale)
+    bump_versions("sales")
+    return {"status": "success", "shoot_id": sale["shoot_id"]}
 
 @app.get("/api/sales")
-async def get_sales(request: Request):
+async def get_sales(request: Request, response: Response):
     await get_current_user(request)
     
-    sales = list(sales_collection.find().sort("date", DESCENDING))
+    not_modified = conditional_get(request, response, "list", "/api/sales", ["sales", "archives"])
+    if not_modified:
+        return not_modified
+    
+    mark_archived(response, "sales")
+    sales = list(read_collection("sales", "list", "/api/sales").find(not_deleted()).sort("date", DESCENDING))
     for sale in sales:
         sale["_id"] = str(sale["_id"])
     return sales
@@ -434,25 +901,29 @@ async def get_sales(request: Request):
 async def update_sale(sale_id: str, sale_data: dict, request: Request):
     await get_current_user(request)
     
-    update_data = {
-        "date": sale_data["date"],
-        "shoot_type": sale_data["shoot_type"],
-        "total_time_hrs": sale_data["total_time_hrs"],
-        "total_amount_inr": sale_data["total_amount_inr"],
-        "received_by": sale_data["received_by"],
-        "payment_mode": sale_data["payment_mode"],
-        "cameraman": sale_data.get("cameraman"),
-        "cameraman_mobile": sale_data.get("cameraman_mobile"),
-        "customer_name": sale_data.get("customer_name"),
-        "city": sale_data.get("city"),
-    }
+    update_data = {**ledger_fields("sales", sale_data), "updated_at": datetime.now(timezone.utc)}
     
-    result = sales_collection.update_one({"id": sale_id}, {"$set": update_data})
+    # The previous version is needed to move its amounts in the rollups
+    before = sales_collection.find_one_and_update(writable("sales", {"id": sale_id}), {"$set": update_data})
     
-    if result.modified_count > 0:
+    if before:
+        apply_sale_change(storage, before=before, after={**before, **update_data})
+        bump_versions("sales")
         return {"status": "success", "message": "Sale updated"}
     else:
-        raise HTTPException(status_code=404, detail="Sale not found")
+        ledger_missing("sales", sale_id, "Sale not found")
+
+@app.delete("/api/sales/{sale_id}")
+async def delete_sale(sale_id: str, request: Request):
+    await require_owner(request)
+    
+    doc = soft_delete("sales", sale_id)
+    if doc:
+        apply_sale_change(storage, before=doc)
+        bump_versions("sales")
+        return {"status": "success", "message": "Sale deleted"}
+    else:
+        ledger_missing("sales", sale_id, "Sale not found")
 
 
 # Expenses endpoints
@@ -460,25 +931,23 @@ async def update_sale(sale_id: str, sale_data: dict, request: Request):
 async def create_expense(expense_data: dict, request: Request):
     await get_current_user(request)
     
-    expense = {
-        "id": str(uuid.uuid4()),
-        "date": expense_data["date"],
-        "expense_type": expense_data["expense_type"],
-        "amount_inr": expense_data["amount_inr"],
-        "description": expense_data.get("description"),
-        "paid_by": expense_data["paid_by"],
-        "payment_mode": expense_data["payment_mode"],
-        "created_at": datetime.now(timezone.utc)
-    }
+    expense = new_ledger_doc("expenses", expense_data, datetime.now(timezone.utc))
     
     expenses_collection.insert_one(expense)
+    apply_expense_change(storage, after=expense)
+    bump_versions("expenses")
     return {"status": "success"}
 
 @app.get("/api/expenses")
-async def get_expenses(request: Request):
+async def get_expenses(request: Request, response: Response):
     await get_current_user(request)
     
-    expenses = list(expenses_collection.find().sort("date", DESCENDING))
+    not_modified = conditional_get(request, response, "list", "/api/expenses", ["expenses", "archives"])
+    if not_modified:
+        return not_modified
+    
+    mark_archived(response, "expenses")
+    expenses = list(read_collection("expenses", "list", "/api/expenses").find(not_deleted()).sort("date", DESCENDING))
     for expense in expenses:
         expense["_id"] = str(expense["_id"])
     return expenses
@@ -487,21 +956,29 @@ async def get_expenses(request: Request):
 async def update_expense(expense_id: str, expense_data: dict, request: Request):
     await get_current_user(request)
     
-    update_data = {
-        "date": expense_data["date"],
-        "expense_type": expense_data["expense_type"],
-        "amount_inr": expense_data["amount_inr"],
-        "description": expense_data.get("description"),
-        "paid_by": expense_data["paid_by"],
-        "payment_mode": expense_data["payment_mode"],
-    }
+    update_data = {**ledger_fields("expenses", expense_data), "updated_at": datetime.now(timezone.utc)}
     
-    result = expenses_collection.update_one({"id": expense_id}, {"$set": update_data})
+    # The previous version is needed to move its amount in the cash rollups
+    before = expenses_collection.find_one_and_update(writable("expenses", {"id": expense_id}), {"$set": update_data})
     
-    if result.modified_count > 0:
+    if before:
+        apply_expense_change(storage, before=before, after={**before, **update_data})
+        bump_versions("expenses")
         return {"status": "success", "message": "Expense updated"}
     else:
-        raise HTTPException(status_code=404, detail="Expense not found")
+        ledger_missing("expenses", expense_id, "Expense not found")
+
+@app.delete("/api/expenses/{expense_id}")
+async def delete_expense(expense_id: str, request: Request):
+    await require_owner(request)
+    
+    doc = soft_delete("expenses", expense_id)
+    if doc:
+        apply_expense_change(storage, before=doc)
+        bump_versions("expenses")
+        return {"status": "success", "message": "Expense deleted"}
+    else:
+        ledger_missing("expenses", expense_id, "Expense not found")
 
 # Partner Payments endpoints
 
@@ -510,45 +987,47 @@ async def update_expense(expense_id: str, expense_data: dict, request: Request):
 async def update_partner_payment(payment_id: str, payment_data: dict, request: Request):
     await get_current_user(request)
     
-    update_data = {
-        "date": payment_data["date"],
-        "amount_inr": payment_data["amount_inr"],
-        "month_year": payment_data["month_year"],
-        "payment_mode": payment_data["payment_mode"],
-        "description": payment_data.get("description"),
-    }
+    update_data = {**ledger_fields("partner_payments", payment_data), "updated_at": datetime.now(timezone.utc)}
     
-    result = partner_payments_collection.update_one({"id": payment_id}, {"$set": update_data})
+    result = partner_payments_collection.update_one(writable("partner_payments", {"id": payment_id}), {"$set": update_data})
     
     if result.modified_count > 0:
+        bump_versions("partner_payments")
         return {"status": "success", "message": "Partner payment updated"}
     else:
-        raise HTTPException(status_code=404, detail="Partner payment not found")
+        ledger_missing("partner_payments", payment_id, "Partner payment not found")
+
+@app.delete("/api/partner-payments/{payment_id}")
+async def delete_partner_payment(payment_id: str, request: Request):
+    await require_owner(request)
+    
+    doc = soft_delete("partner_payments", payment_id)
+    if doc:
+        bump_versions("partner_payments")
+        return {"status": "success", "message": "Partner payment deleted"}
+    else:
+        ledger_missing("partner_payments", payment_id, "Partner payment not found")
 
 @app.post("/api/partner-payments")
 async def create_partner_payment(payment_data: dict, request: Request):
     await get_current_user(request)
     
-    payment = {
-        "id": str(uuid.uuid4()),
-        "date": payment_data["date"],
-        "partner_id": payment_data["partner_id"],
-        "partner_name": payment_data["partner_name"],
-        "amount_inr": payment_data["amount_inr"],
-        "month_year": payment_data["month_year"],
-        "payment_mode": payment_data["payment_mode"],
-        "description": payment_data.get("description"),
-        "created_at": datetime.now(timezone.utc)
-    }
+    payment = new_ledger_doc("partner_payments", payment_data, datetime.now(timezone.utc))
     
     partner_payments_collection.insert_one(payment)
+    bump_versions("partner_payments")
     return {"status": "success"}
 
 @app.get("/api/partner-payments")
-async def get_partner_payments(request: Request):
+async def get_partner_payments(request: Request, response: Response):
     await get_current_user(request)
     
-    payments = list(partner_payments_collection.find().sort("date", DESCENDING))
+    not_modified = conditional_get(request, response, "list", "/api/partner-payments", ["partner_payments", "archives"])
+    if not_modified:
+        return not_modified
+    
+    mark_archived(response, "partner_payments")
+    payments = list(read_collection("partner_payments", "list", "/api/partner-payments").find(not_deleted()).sort("date", DESCENDING))
     for payment in payments:
         payment["_id"] = str(payment["_id"])
     return payments
@@ -558,45 +1037,39 @@ async def get_partner_payments(request: Request):
 async def create_investment(investment_data: dict, request: Request):
     await get_current_user(request)
     
-    investment = {
-        "id": str(uuid.uuid4()),
-        "date": investment_data["date"],
-        "partner_id": investment_data["partner_id"],
-        "partner_name": investment_data["partner_name"],
-        "amount_inr": investment_data["amount_inr"],
-        "description": investment_data.get("description"),
-        "created_at": datetime.now(timezone.utc)
-    }
+    now = datetime.now(timezone.utc)
+    investment = new_ledger_doc("investments", investment_data, now)
     
-    investments_collection.insert_one(investment)
-    
-    # Update partner's capital invested
-    partner = partners_collection.find_one({"id": investment_data["partner_id"]})
-    if partner:
-        # Existing partner - add to their capital
-        current_capital = partner.get("capital_invested", 0.0)
-        new_capital = current_capital + investment_data["amount_inr"]
+    # The investment and the capital change commit together where transactions exist
+    def record(session):
+        investments_collection.insert_one(investment, session=session)
+        
+        # Atomic increment of the partner's capital; a new partner is created
+        # with 0% share (to be updated manually)
         partners_collection.update_one(
             {"id": investment_data["partner_id"]},
-            {"$set": {"capital_invested": new_capital}}
+            {
+                "$inc": {"capital_invested": investment_data["amount_inr"]},
+                "$setOnInsert": {"name": investment_data["partner_name"], "share_percentage": 0.0, "created_at": now}
+            },
+            upsert=True,
+            session=session
         )
-    else:
-        # New partner - create entry with 0% share (to be updated manually)
-        partners_collection.insert_one({
-            "id": investment_data["partner_id"],
-            "name": investment_data["partner_name"],
-            "share_percentage": 0.0,
-            "capital_invested": investment_data["amount_inr"],
-            "created_at": datetime.now(timezone.utc)
-        })
     
+    storage.with_transaction(record)
+    
+    bump_versions("investments", "partners")
     return {"status": "success", "message": "Investment recorded and capital updated. Please update partner shares in Partners section."}
 
 @app.get("/api/investments")
-async def get_investments(request: Request):
+async def get_investments(request: Request, response: Response):
     await get_current_user(request)
     
-    investments = list(investments_collection.find().sort("date", DESCENDING))
+    not_modified = conditional_get(request, response, "list", "/api/investments", ["investments"])
+    if not_modified:
+        return not_modified
+    
+    investments = list(read_collection("investments", "list", "/api/investments").find(not_deleted()).sort("date", DESCENDING))
     for investment in investments:
         investment["_id"] = str(investment["_id"])
     return investments
@@ -606,26 +1079,243 @@ async def get_investments(request: Request):
 async def update_investment(investment_id: str, investment_data: dict, request: Request):
     await get_current_user(request)
     
-    update_data = {
-        "date": investment_data["date"],
-        "amount_inr": investment_data["amount_inr"],
-        "description": investment_data.get("description"),
-    }
+    update_data = {**investment_fields(investment_data), "updated_at": datetime.now(timezone.utc)}
+    
+    def update(session):
+        before = investments_collection.find_one_and_update(
+            not_deleted({"id": investment_id}), {"$set": update_data}, session=session
+        )
+        
+        # Move the partner's capital by the change in amount
+        if before and update_data["amount_inr"] != before["amount_inr"]:
+            partners_collection.update_one(
+                {"id": before["partner_id"]},
+                {"$inc": {"capital_invested": update_data["amount_inr"] - before["amount_inr"]}},
+                session=session
+            )
+        return before
     
-    result = investments_collection.update_one({"id": investment_id}, {"$set": update_data})
+    before = storage.with_transaction(update)
     
-    if result.modified_count > 0:
+    if before:
+        bump_versions("investments", "partners")
         return {"status": "success", "message": "Investment updated"}
     else:
         raise HTTPException(status_code=404, detail="Investment not found")
 
+@app.delete("/api/investments/{investment_id}")
+async def delete_investment(investment_id: str, request: Request):
+    await require_owner(request)
+    
+    def delete(session):
+        doc = soft_delete("investments", investment_id, session=session)
+        if doc:
+            # Take the deleted amount back out of the partner's capital
+            partners_collection.update_one(
+                {"id": doc["partner_id"]},
+                {"$inc": {"capital_invested": -doc["amount_inr"]}},
+                session=session
+            )
+        return doc
+    
+    doc = storage.with_transaction(delete)
+    
+    if doc:
+        bump_versions("investments", "partners")
+        return {"status": "success", "message": "Investment deleted"}
+    else:
+        raise HTTPException(status_code=404, detail="Investment not found")
+
+
+# Batch endpoint - a day's worth of entries in one request. Creates across the
+# ledgers are grouped into one bulk write per collection, updates are applied one
+# document at a time so their rollup and capital deltas come from the version
+# they replaced, and with "atomic": true they commit or roll back together
+MAX_BATCH_OPERATIONS = int(os.getenv("MAX_BATCH_OPERATIONS", "500"))
+
+@app.post("/api/batch")
+async def batch_write(batch_data: dict, request: Request):
+    await get_current_user(request)
+    
+    operations = batch_data.get("operations")
+    atomic = bool(batch_data.get("atomic", False))
+    if not isinstance(operations, list) or not operations:
+        raise HTTPException(status_code=400, detail="operations must be a non-empty list")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {MAX_BATCH_OPERATIONS} operations")
+    if atomic and not storage.supports_transactions():
+        raise HTTPException(status_code=400, detail="Atomic batches need MongoDB running as a replica set")
+    
+    # Build every document up front so bad input fails before anything is written
+    now = datetime.now(timezone.utc)
+    results = []
+    planned = {name: [] for name in LEDGER_COLLECTIONS}
+    # Updates are applied against the stored document, so one batch may touch
+    # each document once - a second update would take its old values out twice
+    updated_ids = set()
+    for index, operation in enumerate(operations):
+        name, kind = operation.get("collection"), operation.get("op")
+        result = {"index": index, "collection": name, "op": kind, "status": "pending"}
+        results.append(result)
+        try:
+            if name not in LEDGER_COLLECTIONS:
+                raise ValueError(f"collection must be one of: {', '.join(LEDGER_COLLECTIONS)}")
+            if kind == "create":
+                doc = new_ledger_doc(name, operation.get("data") or {}, now)
+                result["id"] = doc["id"]
+            elif kind == "update":
+                if not operation.get("id"):
+                    raise ValueError("update needs an id")
+                if (name, operation["id"]) in updated_ids:
+                    raise ValueError(f"{name} {operation['id']} is already updated by an earlier operation in this batch")
+                updated_ids.add((name, operation["id"]))
+                doc = {**ledger_fields(name, operation.get("data") or {}), "updated_at": now}
+                result["id"] = operation["id"]
+            else:
+                raise ValueError("op must be create or update")
+            planned[name].append((index, kind, result["id"], doc))
+        except KeyError as e:
+            result.update(status="error", error=f"Missing field: {e.args[0]}")
+        except (ValueError, TypeError) as e:
+            result.update(status="error", error=str(e))
+        except HTTPException as e:
+            result.update(status="error", error=e.detail)
+    
+    # Updated documents must exist outside archived years - one query per collection,
+    # so an atomic batch is rejected before anything is written
+    for name, ops in planned.items():
+        ids = [doc_id for _, kind, doc_id, _ in ops if kind == "update"]
+        if ids:
+            previous = {doc["id"]: doc for doc in LEDGER_COLLECTIONS[name].find(not_deleted({"id": {"$in": ids}}))}
+            for index, kind, doc_id, _ in ops:
+                if kind == "update" and doc_id not in previous:
+                    results[index].update(status="error", error="Not found")
+                elif kind == "update" and name in ARCHIVED_COLLECTIONS and studio_archive().covers(name, previous[doc_id]["date"]):
+                    results[index].update(status="error", error=f"{previous[doc_id]['date']} is in an archived financial year")
+    
+    if atomic and any(result["status"] == "error" for result in results):
+        for result in results:
+            if result["status"] == "pending":
+                result["status"] = "skipped"
+        raise HTTPException(status_code=400, detail={"message": "Batch rejected, nothing was written", "results": results})
+    
+    shoot_id = None
+    for index, kind, _, doc in planned["sales"]:
+        if kind == "create" and results[index]["status"] == "pending":
+            shoot_id = shoot_id + 1 if shoot_id else next_shoot_id()
+            doc["shoot_id"] = results[index]["shoot_id"] = shoot_id
+    
+    # Fixed before the first attempt - an atomic batch that hits a write conflict
+    # is run again from the start
+    pending = {index for index, result in enumerate(results) if result["status"] == "pending"}
+    
+    def execute(session):
+        rollup_changes = {"sales": [], "expenses": []}
+        capital = {}
+        touched = set()
+        for name, ops in planned.items():
+            ops = [op for op in ops if op[0] in pending]
+            if not ops:
+                continue
+            creates = [index for index, kind, _, _ in ops if kind == "create"]
+            failed = {}
+            if creates:
+                try:
+                    LEDGER_COLLECTIONS[name].bulk_write(
+                        [InsertOne(doc) for _, kind, _, doc in ops if kind == "create"], ordered=atomic, session=session
+                    )
+                except BulkWriteError as e:
+                    if atomic:
+                        raise
+                    failed = {creates[error["index"]]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+                except Exception as e:
+                    if atomic:
+                        raise
+                    failed = {index: str(e) for index in creates}
+            
+            for index, kind, doc_id, doc in ops:
+                if index in failed:
+                    results[index].update(status="error", error=failed[index])
+                    continue
+                before = None
+                if kind == "update":
+                    # Returns the version this update replaced, read in the same
+                    # write, so a concurrent change cannot skew the deltas below
+                    try:
+                        before = LEDGER_COLLECTIONS[name].find_one_and_update(
+                            writable(name, {"id": doc_id}), {"$set": doc}, session=session
+                        )
+                    except Exception as e:
+                        if atomic:
+                            raise
+                        results[index].update(status="error", error=str(e))
+                        continue
+                    if before is None:
+                        # Deleted, or its year locked for archiving, since the check above
+                        if atomic:
+                            raise RuntimeError(f"{name} {doc_id} changed during the batch")
+                        try:
+                            ledger_missing(name, doc_id, "Not found")
+                        except HTTPException as e:
+                            results[index].update(status="error", error=e.detail)
+                        continue
+                results[index]["status"] = "created" if kind == "create" else "updated"
+                touched.add(name)
+                after = doc if kind == "create" else {**before, **doc}
+                if name in rollup_changes:
+                    rollup_changes[name].append((before, after))
+                if name == "investments":
+                    partner_id = after["partner_id"]
+                    delta, insert_fields = capital.get(partner_id, (0, None))
+                    if kind == "create" and insert_fields is None:
+                        insert_fields = {"name": after["partner_name"], "share_percentage": 0.0, "created_at": now}
+                    capital[partner_id] = (delta + after["amount_inr"] - (before["amount_inr"] if before else 0), insert_fields)
+        
+        apply_rollup_changes(storage, sales=rollup_changes["sales"], expenses=rollup_changes["expenses"], session=session)
+        partner_requests = [
+            UpdateOne(
+                {"id": partner_id},
+                {"$inc": {"capital_invested": delta}, **({"$setOnInsert": insert_fields} if insert_fields else {})},
+                upsert=insert_fields is not None
+            )
+            for partner_id, (delta, insert_fields) in capital.items()
+            if delta or insert_fields
+        ]
+        if partner_requests:
+            partners_collection.bulk_write(partner_requests, ordered=atomic, session=session)
+            touched.add("partners")
+        return touched
+    
+    if atomic:
+        try:
+            touched = storage.with_transaction(execute)
+        except Exception as e:
+            for result in results:
+                result["status"] = "rolled_back"
+            raise HTTPException(status_code=409, detail={"message": f"Batch rolled back: {e}", "results": results})
+    else:
+        touched = execute(None)
+    
+    if touched:
+        bump_versions(*sorted(touched))
+        if len(operations) >= WARMUP_IMPORT_OPERATIONS:
+            warmup.request(current_studio.get(), "import")
+    return {
+        "status": "success" if all(result["status"] in ("created", "updated") for result in results) else "partial",
+        "atomic": atomic,
+        "results": results
+    }
 
 # Partners endpoints
 @app.get("/api/partners")
-async def get_partners(request: Request):
+async def get_partners(request: Request, response: Response):
     await get_current_user(request)
     
-    partners = list(partners_collection.find())
+    not_modified = conditional_get(request, response, "list", "/api/partners", ["partners"])
+    if not_modified:
+        return not_modified
+    
+    partners = list(read_collection("partners", "list", "/api/partners").find())
     for partner in partners:
         partner["_id"] = str(partner["_id"])
     return partners
@@ -645,23 +1335,37 @@ async def create_partner(partner_data: dict, request: Request):
         "created_at": datetime.now(timezone.utc)
     }
     
-    partners_collection.insert_one(partner)
-    
-    # If initial investment provided, create investment record
-    if partner_data.get("capital_invested", 0) > 0:
-        investment = {
-            "id": str(uuid.uuid4()),
-            "date": partner_data.get("date", datetime.now(timezone.utc).strftime("%Y-%m-%d")),
-            "partner_id": partner_id,
-            "partner_name": partner_data["name"],
-            "amount_inr": partner_data["capital_invested"],
-            "description": "Initial investment",
-            "created_at": datetime.now(timezone.utc)
-        }
-        investments_collection.insert_one(investment)
+    def create(session):
+        partners_collection.insert_one(partner, session=session)
+        
+        # If initial investment provided, create investment record
+        if partner_data.get("capital_invested", 0) > 0:
+            investment_date = partner_data.get("date", datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+            investment = {
+                "id": str(uuid.uuid4()),
+                "date": investment_date,
+                "date_at": to_date_at(investment_date),
+                "partner_id": partner_id,
+                "partner_name": partner_data["name"],
+                "amount_inr": partner_data["capital_invested"],
+                "description": "Initial investment",
+                "created_at": datetime.now(timezone.utc),
+                "updated_at": datetime.now(timezone.utc)
+            }
+            investments_collection.insert_one(investment, session=session)
     
+    storage.with_transaction(create)
+    
+    bump_versions("partners", "investments")
     return {"status": "success", "partner_id": partner_id, "message": "Partner added successfully"}
 
+@app.get("/api/partners/capital-reconciliation")
+async def get_capital_reconciliation(request: Request):
+    await require_owner(request)
+    
+    # Report only - run reconcile_capital.py --fix to correct drift
+    return reconcile_capital(storage)
+
 @app.put("/api/partners/shares")
 async def update_partner_shares(shares_data: UpdateSharesRequest, request: Request):
     await get_current_user(request)
@@ -677,41 +1381,29 @@ async def update_partner_shares(shares_data: UpdateSharesRequest, request: Reque
             {"id": share["partner_id"]},
             {"$set": {"share_percentage": share["share_percentage"], "last_updated": datetime.now(timezone.utc)}}
         )
+    bump_versions("partners")
     
     return {"status": "success", "message": "Partner shares updated"}
 
 # Reports
-@app.get("/api/reports/monthly")
-async def get_monthly_report(request: Request, month: str):
-    await get_current_user(request)
-    
+MONTHLY_REPORT_VERSIONS = ["sales", "expenses", "partners", "archives"]
+YEARLY_REPORT_VERSIONS = ["sales", "expenses", "partners", "partner_payments", "archives"]
+
+def monthly_report(month):
     # Parse month
-    year, month_num = month.split("-")
-    start_date = f"{year}-{month_num}-01"
-    
-    # Calculate end date
-    if month_num == "12":
-        end_date = f"{int(year)+1}-01-01"
-    else:
-        end_date = f"{year}-{str(int(month_num)+1).zfill(2)}-01"
+    year, month_num = (int(part) for part in month.split("-"))
+    start, end = month_bounds(year, month_num)
     
-    # Get sales
-    sales = list(sales_collection.find({
-        "date": {"$gte": start_date, "$lt": end_date}
-    }))
-    total_revenue = sum(sale["total_amount_inr"] for sale in sales)
-    
-    # Get expenses
-    expenses = list(expenses_collection.find({
-        "date": {"$gte": start_date, "$lt": end_date}
-    }))
-    total_expenses = sum(expense["amount_inr"] for expense in expenses)
+    # Get sales and expenses totals
+    route = "/api/reports/monthly"
+    total_revenue, sales_count = range_totals(read_collection("sales", "report", route), "total_amount_inr", start, end)
+    total_expenses, expenses_count = range_totals(read_collection("expenses", "report", route), "amount_inr", start, end)
     
     # Calculate profit
     profit = total_revenue - total_expenses
     
     # Get partners and calculate distribution
-    partners = list(partners_collection.find())
+    partners = list(read_collection("partners", "report", route).find())
     partner_distribution = []
     for partner in partners:
         share_amount = profit * (partner["share_percentage"] / 100)
@@ -727,33 +1419,39 @@ async def get_monthly_report(request: Request, month: str):
         "expenses": total_expenses,
         "profit": profit,
         "partner_distribution": partner_distribution,
-        "sales_count": len(sales),
-        "expenses_count": len(expenses)
+        "sales_count": sales_count,
+        "expenses_count": expenses_count
     }
 
-@app.get("/api/reports/yearly")
-async def get_yearly_report(request: Request, year: int, month: Optional[int] = None):
+@app.get("/api/reports/monthly")
+async def get_monthly_report(request: Request, response: Response, month: str):
     await get_current_user(request)
     
+    check_month(month)
+    
+    not_modified = conditional_get(request, response, "report", "/api/reports/monthly", MONTHLY_REPORT_VERSIONS)
+    if not_modified:
+        return not_modified
+    
+    return await report_cache.get("monthly", {"month": month}, request.state.versions, lambda: monthly_report(month))
+
+def yearly_report(year, month=None):
+    route = "/api/reports/yearly"
+    sales_reader = read_collection("sales", "report", route)
+    expenses_reader = read_collection("expenses", "report", route)
+    payments_reader = read_collection("partner_payments", "report", route)
+    
     # Get partners
-    partners = list(partners_collection.find())
+    partners = list(read_collection("partners", "report", route).find())
     
     if month:
         # Single month report
         month_str = f"{year}-{str(month).zfill(2)}"
-        start_date = f"{year}-{str(month).zfill(2)}-01"
-        
-        if month == 12:
-            end_date = f"{year+1}-01-01"
-        else:
-            end_date = f"{year}-{str(month+1).zfill(2)}-01"
-        
-        # Get sales and expenses for the month
-        sales = list(sales_collection.find({"date": {"$gte": start_date, "$lt": end_date}}))
-        expenses = list(expenses_collection.find({"date": {"$gte": start_date, "$lt": end_date}}))
+        start, end = month_bounds(year, month)
         
-        total_revenue = sum(sale["total_amount_inr"] for sale in sales)
-        total_expenses = sum(expense["amount_inr"] for expense in expenses)
+        # Get sales and expenses totals for the month
+        total_revenue, _ = range_totals(sales_reader, "total_amount_inr", start, end)
+        total_expenses, _ = range_totals(expenses_reader, "amount_inr", start, end)
         profit = total_revenue - total_expenses
         
         monthly_data = [{
@@ -764,17 +1462,14 @@ async def get_yearly_report(request: Request, year: int, month: Optional[int] =
         }]
         
         # Get partner payments for the specific month
+        payments_by_partner = partner_totals(payments_reader, start, end)
         partner_summary = []
         for partner in partners:
             # Calculate total share for the month
             total_share = profit * (partner["share_percentage"] / 100)
             
             # Get total paid to this partner in the month
-            payments = list(partner_payments_collection.find({
-                "partner_id": partner["id"],
-                "date": {"$gte": start_date, "$lt": end_date}
-            }))
-            total_paid = sum(payment["amount_inr"] for payment in payments)
+            total_paid = payments_by_partner.get(partner["id"], 0)
             
             # Calculate due
             total_due = total_share - total_paid
@@ -788,53 +1483,41 @@ async def get_yearly_report(request: Request, year: int, month: Optional[int] =
         
     else:
         # Full year report - all 12 months
-        monthly_data = []
+        year_start = datetime(year, 1, 1, tzinfo=timezone.utc)
+        year_end = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+        
+        # Get sales and expenses grouped by month
+        revenue_by_month = monthly_totals(sales_reader, "total_amount_inr", year_start, year_end)
+        expenses_by_month = monthly_totals(expenses_reader, "amount_inr", year_start, year_end)
         
+        monthly_data = []
         for m in range(1, 13):
-            start_date = f"{year}-{str(m).zfill(2)}-01"
-            if m == 12:
-                end_date = f"{year+1}-01-01"
-            else:
-                end_date = f"{year}-{str(m+1).zfill(2)}-01"
-            
-            # Get sales and expenses for each month
-            sales = list(sales_collection.find({"date": {"$gte": start_date, "$lt": end_date}}))
-            expenses = list(expenses_collection.find({"date": {"$gte": start_date, "$lt": end_date}}))
-            
-            total_revenue = sum(sale["total_amount_inr"] for sale in sales)
-            total_expenses = sum(expense["amount_inr"] for expense in expenses)
+            month_str = f"{year}-{str(m).zfill(2)}"
+            total_revenue = revenue_by_month.get(month_str, (0, 0))[0]
+            total_expenses = expenses_by_month.get(month_str, (0, 0))[0]
             profit = total_revenue - total_expenses
             
             monthly_data.append({
-                "month": f"{year}-{str(m).zfill(2)}",
+                "month": month_str,
                 "revenue": total_revenue,
                 "expenses": total_expenses,
                 "profit": profit
             })
         
-        # Get partner summary for the entire year
-        partner_summary = []
-        year_start = f"{year}-01-01"
-        year_end = f"{year+1}-01-01"
-        
         # Calculate total profit for the year
-        all_sales = list(sales_collection.find({"date": {"$gte": year_start, "$lt": year_end}}))
-        all_expenses = list(expenses_collection.find({"date": {"$gte": year_start, "$lt": year_end}}))
-        
-        yearly_revenue = sum(sale["total_amount_inr"] for sale in all_sales)
-        yearly_expenses = sum(expense["amount_inr"] for expense in all_expenses)
+        yearly_revenue = sum(row["revenue"] for row in monthly_data)
+        yearly_expenses = sum(row["expenses"] for row in monthly_data)
         yearly_profit = yearly_revenue - yearly_expenses
         
+        # Get partner summary for the entire year
+        payments_by_partner = partner_totals(payments_reader, year_start, year_end)
+        partner_summary = []
         for partner in partners:
             # Calculate total share for the year
             total_share = yearly_profit * (partner["share_percentage"] / 100)
             
             # Get total paid to this partner in the year
-            payments = list(partner_payments_collection.find({
-                "partner_id": partner["id"],
-                "date": {"$gte": year_start, "$lt": year_end}
-            }))
-            total_paid = sum(payment["amount_inr"] for payment in payments)
+            total_paid = payments_by_partner.get(partner["id"], 0)
             
             # Calculate due
             total_due = total_share - total_paid
@@ -853,13 +1536,414 @@ async def get_yearly_report(request: Request, year: int, month: Optional[int] =
         "partner_summary": partner_summary
     }
 
+@app.get("/api/reports/yearly")
+async def get_yearly_report(request: Request, response: Response, year: int, month: Optional[int] = None):
+    await get_current_user(request)
+    
+    if not 1 <= year <= 9998:
+        raise HTTPException(status_code=400, detail="year must be between 1 and 9998")
+    if month and not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="month must be between 1 and 12")
+    
+    not_modified = conditional_get(request, response, "report", "/api/reports/yearly", YEARLY_REPORT_VERSIONS)
+    if not_modified:
+        return not_modified
+    
+    return await report_cache.get(
+        "yearly", {"year": year, "month": month}, request.state.versions, lambda: yearly_report(year, month)
+    )
+
+
+# Warm-up - what a studio opens after a month rollover or an import: the
+# dashboard's default month, that month's report and this year's report
+async def warm_reports():
+    route = "report_warmup"
+    month = default_dashboard_month()
+    year = datetime.now().year
+    for report, names, params, compute in (
+        ("dashboard", DASHBOARD_VERSIONS, {"month": month}, lambda: dashboard_stats(month)),
+        ("monthly", MONTHLY_REPORT_VERSIONS, {"month": month}, lambda: monthly_report(month)),
+        ("yearly", YEARLY_REPORT_VERSIONS, {"year": year, "month": None}, lambda: yearly_report(year)),
+    ):
+        versions = await asyncio.to_thread(read_versions, names, "report", route)
+        await report_cache.get(report, params, version_numbers(versions, names), compute)
+
+
+@app.get("/api/reports/range")
+async def get_range_report(
+    request: Request,
+    response: Response,
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    granularity: str = "month"
+):
+    await get_current_user(request)
+    
+    # Validate the range before doing any work
+    try:
+        first_day = date.fromisoformat(from_date)
+        last_day = date.fromisoformat(to_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from and to must be YYYY-MM-DD dates")
+    if first_day > last_day:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    if granularity not in RANGE_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(RANGE_GRANULARITIES)}")
+    
+    buckets = []
+    start = bucket_start(first_day, granularity)
+    while start <= last_day:
+        end = next_bucket(start, granularity)
+        buckets.append((start, end))
+        if len(buckets) > MAX_RANGE_BUCKETS:
+            raise HTTPException(status_code=400, detail=f"Range has more than {MAX_RANGE_BUCKETS} {granularity} buckets")
+        start = end
+    
+    not_modified = conditional_get(request, response, "report", "/api/reports/range", ["sales", "expenses", "partners", "partner_payments", "archives"])
+    if not_modified:
+        return not_modified
+    
+    route = "/api/reports/range"
+    range_start = datetime(first_day.year, first_day.month, first_day.day, tzinfo=timezone.utc)
+    range_end = range_start + timedelta(days=(last_day - first_day).days + 1)
+    
+    # One grouped query per ledger - by day for day/week buckets, by month otherwise -
+    # then roll the periods up into buckets
+    unit = "day" if granularity in ("day", "week") else "month"
+    revenue_by_period = period_totals(read_collection("sales", "report", route), "total_amount_inr", range_start, range_end, unit)
+    expenses_by_period = period_totals(read_collection("expenses", "report", route), "amount_inr", range_start, range_end, unit)
+    payments_by_partner = partner_totals(read_collection("partner_payments", "report", route), range_start, range_end)
+    partners = list(read_collection("partners", "report", route).find())
+    
+    totals_by_bucket = {}
+    for field, periods in (("revenue", revenue_by_period), ("expenses", expenses_by_period)):
+        for period, (total, count) in periods.items():
+            day = date.fromisoformat(period if unit == "day" else f"{period}-01")
+            bucket = totals_by_bucket.setdefault(bucket_start(day, granularity), {})
+            bucket[field] = bucket.get(field, 0) + total
+            bucket[f"{field}_count"] = bucket.get(f"{field}_count", 0) + count
+    
+    bucket_data = []
+    for start, end in buckets:
+        totals = totals_by_bucket.get(start, {})
+        revenue = totals.get("revenue", 0)
+        expenses = totals.get("expenses", 0)
+        profit = revenue - expenses
+        bucket_data.append({
+            "label": bucket_label(start, granularity),
+            "start": max(start, first_day).isoformat(),
+            "end": min(end - timedelta(days=1), last_day).isoformat(),
+            "revenue": revenue,
+            "expenses": expenses,
+            "profit": profit,
+            "sales_count": totals.get("revenue_count", 0),
+            "expenses_count": totals.get("expenses_count", 0),
+            "partner_distribution": [{
+                "name": partner["name"],
+                "share_percentage": partner["share_percentage"],
+                "amount": profit * (partner["share_percentage"] / 100)
+            } for partner in partners]
+        })
+    
+    total_revenue = sum(bucket["revenue"] for bucket in bucket_data)
+    total_expenses = sum(bucket["expenses"] for bucket in bucket_data)
+    total_profit = total_revenue - total_expenses
+    
+    partner_summary = []
+    for partner in partners:
+        total_share = total_profit * (partner["share_percentage"] / 100)
+        total_paid = payments_by_partner.get(partner["id"], 0)
+        partner_summary.append({
+            "partner_name": partner["name"],
+            "total_share": total_share,
+            "total_paid": total_paid,
+            "total_due": total_share - total_paid
+        })
+    
+    return {
+        "from": first_day.isoformat(),
+        "to": last_day.isoformat(),
+        "granularity": granularity,
+        "fiscal_year_start_month": FISCAL_YEAR_START_MONTH,
+        "buckets": bucket_data,
+        "totals": {
+            "revenue": total_revenue,
+            "expenses": total_expenses,
+            "profit": total_profit,
+            "sales_count": sum(bucket["sales_count"] for bucket in bucket_data),
+            "expenses_count": sum(bucket["expenses_count"] for bucket in bucket_data)
+        },
+        "partner_summary": partner_summary
+    }
+
+
+@app.get("/api/reports/cash-position")
+async def get_cash_position(
+    request: Request,
+    response: Response,
+    from_month: Optional[str] = Query(None, alias="from"),
+    to_month: Optional[str] = Query(None, alias="to")
+):
+    await get_current_user(request)
+    
+    # Months are compared as strings below, so they must be exactly YYYY-MM
+    check_month(from_month, "from")
+    check_month(to_month, "to")
+    if from_month and to_month and from_month > to_month:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    
+    not_modified = conditional_get(request, response, "report", "/api/reports/cash-position", ["sales", "expenses", CASH_COLLECTION])
+    if not_modified:
+        return not_modified
+    
+    # Money held per person and payment mode: sales received minus expenses paid.
+    # One pass over the monthly cash rollups in month order - months before
+    # `from` only move the opening balances
+    query = {"month": {"$lte": to_month}} if to_month else {}
+    rows = read_collection(CASH_COLLECTION, "report", "/api/reports/cash-position").find(query).sort("month", 1)
+    
+    def new_series():
+        return {"opening": 0.0, "balance": 0.0, "months": []}
+    
+    series = {"holder": {}, "payment_mode": {}, "holder_and_mode": {}}
+    for row in rows:
+        net = row["received"] - row["paid"]
+        keys = {
+            "holder": row["holder"],
+            "payment_mode": row["payment_mode"],
+            "holder_and_mode": (row["holder"], row["payment_mode"]),
+        }
+        for kind, key in keys.items():
+            entry = series[kind].setdefault(key, new_series())
+            entry["balance"] += net
+            if from_month and row["month"] < from_month:
+                entry["opening"] += net
+                continue
+            if kind == "holder_and_mode":
+                continue
+            months = entry["months"]
+            if not months or months[-1]["month"] != row["month"]:
+                months.append({"month": row["month"], "received": 0.0, "paid": 0.0, "net": 0.0, "balance": 0.0})
+            month = months[-1]
+            month["received"] += row["received"]
+            month["paid"] += row["paid"]
+            month["net"] += net
+            month["balance"] = entry["balance"]
+    
+    def rounded(entry, **labels):
+        return {
+            **labels,
+            "opening_balance": round(entry["opening"], 2),
+            "closing_balance": round(entry["balance"], 2),
+            "months": [{name: round(value, 2) if isinstance(value, float) else value for name, value in month.items()} for month in entry["months"]]
+        }
+    
+    # Cash is what is physically held; every other mode sits in a bank account
+    holders = []
+    for holder, entry in sorted(series["holder"].items(), key=lambda item: item[0] or ""):
+        cash = sum(mode_entry["balance"] for (name, mode), mode_entry in series["holder_and_mode"].items() if name == holder and mode == "Cash")
+        holders.append({
+            **rounded(entry, holder=holder),
+            "cash": round(cash, 2),
+            "bank": round(entry["balance"] - cash, 2),
+            "by_payment_mode": {mode or "": round(mode_entry["balance"], 2) for (name, mode), mode_entry in series["holder_and_mode"].items() if name == holder}
+        })
+    
+    return {
+        "from": from_month,
+        "to": to_month,
+        "holders": holders,
+        "payment_modes": [rounded(entry, payment_mode=mode) for mode, entry in sorted(series["payment_mode"].items(), key=lambda item: item[0] or "")],
+        "totals": {
+            "cash": round(sum(holder["cash"] for holder in holders), 2),
+            "bank": round(sum(holder["bank"] for holder in holders), 2),
+            "balance": round(sum(holder["closing_balance"] for holder in holders), 2)
+        }
+    }
+
+
+# Analytics
+@app.get("/api/analytics/utilization")
+async def get_utilization(
+    request: Request,
+    response: Response,
+    from_month: Optional[str] = Query(None, alias="from"),
+    to_month: Optional[str] = Query(None, alias="to"),
+    dimension: Optional[str] = None
+):
+    await get_current_user(request)
+    
+    dimensions = [dimension] if dimension else list(UTILIZATION_DIMENSIONS)
+    if any(name not in UTILIZATION_DIMENSIONS for name in dimensions):
+        raise HTTPException(status_code=400, detail=f"dimension must be one of: {', '.join(UTILIZATION_DIMENSIONS)}")
+    
+    # Rollups only change when sales do
+    not_modified = conditional_get(request, response, "report", "/api/analytics/utilization", ["sales", UTILIZATION_COLLECTION])
+    if not_modified:
+        return not_modified
+    
+    query = {"dimension": {"$in": dimensions}, "shoots": {"$gt": 0}}
+    month_range = {}
+    if from_month:
+        month_range["$gte"] = from_month
+    if to_month:
+        month_range["$lte"] = to_month
+    if month_range:
+        query["month"] = month_range
+    
+    def utilization(hours, shoots, revenue):
+        return {
+            "hours": round(hours, 2),
+            "shoots": shoots,
+            "revenue": round(revenue, 2),
+            "revenue_per_hour": round(revenue / hours, 2) if hours else None
+        }
+    
+    result = {name: {"months": [], "totals": []} for name in dimensions}
+    totals = {}
+    rows = read_collection(UTILIZATION_COLLECTION, "report", "/api/analytics/utilization").find(query).sort([("month", 1), ("value", 1)])
+    for row in rows:
+        result[row["dimension"]]["months"].append({
+            "month": row["month"],
+            "value": row["value"],
+            **utilization(row["hours"], row["shoots"], row["revenue"])
+        })
+        key = (row["dimension"], row["value"])
+        hours, shoots, revenue = totals.get(key, (0.0, 0, 0.0))
+        totals[key] = (hours + row["hours"], shoots + row["shoots"], revenue + row["revenue"])
+    
+    for (name, value), (hours, shoots, revenue) in totals.items():
+        result[name]["totals"].append({"value": value, **utilization(hours, shoots, revenue)})
+    for name in dimensions:
+        result[name]["totals"].sort(key=lambda row: row["revenue"], reverse=True)
+    
+    return {"from": from_month, "to": to_month, "dimensions": result}
+
+
+# Sync
+# Writes that picked their updated_at just before a sync read may land after it,
+# so the watermark trails the clock by this many seconds
+SYNC_SAFETY_WINDOW_SECONDS = int(os.getenv("SYNC_SAFETY_WINDOW_SECONDS", "5"))
+
+@app.get("/api/sync")
+async def sync_changes(request: Request, since: Optional[str] = None, limit: int = 500):
+    await get_current_user(request)
+    
+    if since:
+        try:
+            since_dt = datetime.fromisoformat(since.replace("Z", "+00:00"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="since must be an ISO 8601 timestamp")
+        if since_dt.tzinfo is None:
+            since_dt = since_dt.replace(tzinfo=timezone.utc)
+    else:
+        since_dt = datetime.min.replace(tzinfo=timezone.utc)
+    
+    limit = max(1, min(limit, 5000))
+    until = datetime.now(timezone.utc) - timedelta(seconds=SYNC_SAFETY_WINDOW_SECONDS)
+    watermark = max(since_dt, until)
+    
+    changes = {}
+    has_more = False
+    for name in LEDGER_COLLECTIONS:
+        reader = read_collection(name, "primary", "/api/sync")
+        docs = list(reader.find(
+            {"updated_at": {"$gt": since_dt, "$lte": until}}
+        ).sort([("updated_at", 1), ("_id", 1)]).limit(limit + 1))
+        
+        if len(docs) > limit:
+            # Cut the page at the last returned timestamp, pulling in every
+            # document that shares it so the next call can resume with $gt
+            has_more = True
+            docs = docs[:limit]
+            last_updated = docs[-1]["updated_at"]
+            returned = [doc["_id"] for doc in docs if doc["updated_at"] == last_updated]
+            docs.extend(reader.find({"updated_at": last_updated, "_id": {"$nin": returned}}))
+            if last_updated.tzinfo is None:
+                last_updated = last_updated.replace(tzinfo=timezone.utc)
+            # Other collections may be re-sent from here; clients upsert by id
+            watermark = min(watermark, last_updated)
+        
+        for doc in docs:
+            doc["_id"] = str(doc["_id"])
+        changes[name] = docs
+    
+    # "Z" rather than "+00:00" so the watermark survives being pasted into a query string
+    return {
+        "since": since_dt.isoformat().replace("+00:00", "Z") if since else None,
+        "watermark": watermark.isoformat().replace("+00:00", "Z"),
+        "has_more": has_more,
+        "changes": changes,
+        # Financial years whose rows have moved to the archive and are not synced
+        "archived_years": {name: studio_archive().fiscal_years(name) for name in ARCHIVED_COLLECTIONS}
+    }
+
+
+# Metrics
+@app.get("/api/metrics")
+async def get_metrics(request: Request):
+    await get_current_user(request)
+    
+    return {
+        "read_preferences": {route_class: pref.document for route_class, pref in READ_PREFERENCES.items()},
+        "event_loop": watchdog.snapshot(),
+        "report_warmups": warmup.last_runs,
+        "counters": metrics.snapshot()
+    }
+
+
+# Slow-query log - the worst query shapes of the caller's studio, by total time
+@app.get("/api/admin/slow-queries")
+async def get_slow_queries(request: Request, hours: int = 24, limit: int = 20):
+    user = await require_owner(request)
+    
+    if not SLOW_QUERY_LOG_ENABLED:
+        raise HTTPException(status_code=404, detail="Slow-query log is disabled")
+    return slow_log.summary(user.studio_id, hours=hours, limit=min(limit, 100))
+
+# Profiles - results of the caller's studio's requests run with "X-Profile: 1", newest first
+async def require_owner(request: Request):
+    user = await get_current_user(request)
+    if user.role != "OWNER":
+        raise HTTPException(status_code=403, detail="Owner access required")
+    return user
+
+@app.get("/api/profiles")
+async def list_profiles(request: Request):
+    user = await require_owner(request)
+    
+    return profiles.list(user.studio_id)
+
+@app.get("/api/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    user = await require_owner(request)
+    
+    profile = profiles.get(profile_id, user.studio_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.to_dict()
+
+@app.get("/api/profiles/{profile_id}/folded")
+async def get_profile_folded(profile_id: str, request: Request):
+    user = await require_owner(request)
+    
+    profile = profiles.get(profile_id, user.studio_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    # Folded stacks for flamegraph.pl or speedscope, weights in microseconds
+    return Response(content=profile.folded_text(), media_type="text/plain")
+
 
 # Users endpoint
 @app.get("/api/users")
-async def get_users(request: Request):
+async def get_users(request: Request, response: Response):
     await get_current_user(request)
     
-    users = list(users_collection.find())
+    not_modified = conditional_get(request, response, "list", "/api/users", ["users"])
+    if not_modified:
+        return not_modified
+    
+    users = list(read_collection("users", "list", "/api/users").find(studio_users()))
     for user in users:
         user["_id"] = str(user["_id"])
     return users
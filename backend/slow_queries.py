@@ -0,0 +1,357 @@
+# Slow-operation log. Database commands slower than SLOW_QUERY_MS are recorded
+# with their filter, sort (or pipeline), the route that issued them, the
+# duration and the query plan, in the `slow_queries` collection of the shared
+# database (capped on MongoDB). GET /api/admin/slow-queries groups entries by
+# query shape - the command with its values blanked - so the worst unindexed
+# paths stand out.
+#
+# MongoDB commands come from a CommandListener. Plans are captured with
+# explain (queryPlanner) on a background thread, at most once per shape every
+# EXPLAIN_INTERVAL_SECONDS, and any COLLSCAN in the winning plan is flagged.
+# On SQLite the storage's on_query hook supplies the SQL and EXPLAIN QUERY PLAN
+# stands in; full table SCAN steps are flagged the same way.
+#
+# Fast commands pay one dict insert and pop in the listener.
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import json_util
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid
+
+from metrics import metrics, route_template
+from tenancy import SHARED_COLLECTIONS, current_studio
+
+SLOW_QUERY_LOG_ENABLED = os.getenv("SLOW_QUERY_LOG_ENABLED", "true").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_BYTES = int(os.getenv("SLOW_QUERY_LOG_BYTES", str(16 * 1024 * 1024)))
+# SQLite has no capped collections - entries past this many are trimmed instead
+SLOW_QUERY_KEEP = 5000
+EXPLAIN_INTERVAL_SECONDS = 300
+LOG_COLLECTION = "slow_queries"
+QUEUE_SIZE = 1000
+MAX_TEXT = 4000
+
+# Commands explain accepts, and where each keeps its filter and sort
+EXPLAINABLE = {
+    "find": lambda command: (command.get("filter"), command.get("sort")),
+    "aggregate": lambda command: (None, None),
+    "count": lambda command: (command.get("query"), None),
+    "distinct": lambda command: (command.get("query"), None),
+    "findAndModify": lambda command: (command.get("query"), command.get("sort")),
+    "update": lambda command: ((command.get("updates") or [{}])[0].get("q"), None),
+    "delete": lambda command: ((command.get("deletes") or [{}])[0].get("q"), None),
+}
+# Session and transaction fields explain rejects
+COMMAND_ENVELOPE = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+SQL_TABLE_PATTERN = re.compile(r'(?:FROM|INTO|UPDATE)\s+"([A-Za-z_][A-Za-z0-9_]*)"', re.IGNORECASE)
+
+logger = logging.getLogger("slow_queries")
+
+# The ASGI scope of the request being served, for the route label
+_scope = contextvars.ContextVar("slow_query_scope", default=None)
+# Set on the log's own thread so its explains and inserts are not recorded
+_local = threading.local()
+
+
+def shape(value):
+    # The value with every literal blanked; operators and $field paths are kept
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, dict) for item in value):
+            return [shape(item) for item in value]
+        return "?"
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+    return "?"
+
+
+def to_text(value):
+    if value is None:
+        return None
+    text = json_util.dumps(value)
+    return text if len(text) <= MAX_TEXT else text[:MAX_TEXT] + "..."
+
+
+def shape_id(*parts):
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:12]
+
+
+def mongo_plan(explain):
+    # {"collscan", "stages", "indexes"} from the winning plan(s) of an explain result
+    stages, indexes = [], []
+
+    def walk(node, in_plan):
+        if isinstance(node, dict):
+            if in_plan and "stage" in node:
+                stages.append(node["stage"])
+                if node.get("indexName"):
+                    indexes.append(node["indexName"])
+            for key, item in node.items():
+                walk(item, in_plan or key in ("winningPlan", "queryPlan"))
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, in_plan)
+
+    walk(explain, False)
+    return {"collscan": "COLLSCAN" in stages, "stages": stages, "indexes": sorted(set(indexes))}
+
+
+def sqlite_plan(rows):
+    # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail)
+    details = [row[3] for row in rows]
+    return {
+        "collscan": any(detail.startswith("SCAN ") and "INDEX" not in detail and "CONSTANT ROW" not in detail for detail in details),
+        "stages": details,
+        "indexes": sorted({match for detail in details for match in re.findall(r"INDEX (\S+)", detail)}),
+    }
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_MS):
+        self.threshold_ms = threshold_ms
+        self.storage = None
+        self.collection = None
+        self._pending = {}
+        self._plans = {}
+        self._inserted = 0
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.storage is not None
+
+    def install(self, storage):
+        # storage: the server's TenantStorage; the log lives in its shared database
+        self.storage = storage
+        shared = storage.shared
+        if shared.name == "mongo":
+            try:
+                shared.db.create_collection(LOG_COLLECTION, capped=True, size=SLOW_QUERY_LOG_BYTES)
+            except CollectionInvalid:
+                pass
+        self.collection = shared.collection(LOG_COLLECTION)
+        self.collection.create_index([("studio", 1), ("at", 1)])
+        self._thread = threading.Thread(target=self._run, name="slow-query-log", daemon=True)
+        self._thread.start()
+
+    def _quiet(self):
+        return not self.enabled or getattr(_local, "quiet", False)
+
+    def _submit(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            metrics.inc("slow_queries_dropped")
+
+    # Capture - runs on the thread that issued the command
+
+    def command_started(self, event):
+        if event.command_name in EXPLAINABLE and not self._quiet():
+            self._pending[(event.request_id, event.connection_id)] = (event.command, _scope.get(), current_studio.get())
+
+    def command_finished(self, event):
+        pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None or event.duration_micros < self.threshold_ms * 1000:
+            return
+        command, scope, studio = pending
+        if command.get(event.command_name) == LOG_COLLECTION:
+            return
+        self._submit({
+            "backend": "mongo",
+            "database": event.database_name,
+            "command_name": event.command_name,
+            "command": command,
+            "duration_ms": event.duration_micros / 1000,
+            "scope": scope,
+            "studio": studio,
+        })
+
+    def command_failed(self, event):
+        self._pending.pop((event.request_id, event.connection_id), None)
+
+    def record_sql(self, sql, seconds):
+        # SQLiteStorage.on_query hook
+        if seconds * 1000 < self.threshold_ms or self._quiet():
+            return
+        self._submit({
+            "backend": "sqlite",
+            "sql": " ".join(sql.split()),
+            "duration_ms": seconds * 1000,
+            "scope": _scope.get(),
+            "studio": current_studio.get(),
+        })
+
+    # Recording - runs on the log's own thread
+
+    def _run(self):
+        _local.quiet = True
+        while True:
+            item = self._queue.get()
+            try:
+                self._record(item)
+            except Exception:
+                logger.exception("Could not record slow query")
+
+    def _plan(self, key, explain):
+        # Re-explains a shape only every EXPLAIN_INTERVAL_SECONDS
+        cached = self._plans.get(key)
+        if cached and time.monotonic() - cached[0] < EXPLAIN_INTERVAL_SECONDS:
+            return {**cached[1], "cached": True}
+        try:
+            plan = explain()
+        except Exception as e:
+            plan = {"collscan": None, "stages": [], "indexes": [], "error": str(e)[:200]}
+        plan["explained_at"] = datetime.now(timezone.utc)
+        self._plans[key] = (time.monotonic(), plan)
+        return {**plan, "cached": False}
+
+    def _record(self, item):
+        scope = item["scope"]
+        route = route_template(scope["app"], scope) if scope and "app" in scope else "background"
+        entry = {
+            "at": datetime.now(timezone.utc),
+            "studio": item["studio"],
+            "backend": item["backend"],
+            "route": route,
+            "method": scope.get("method") if scope else None,
+            "duration_ms": round(item["duration_ms"], 3),
+        }
+
+        if item["backend"] == "mongo":
+            name, command = item["command_name"], item["command"]
+            filter, sort = EXPLAINABLE[name](command)
+            pipeline = command.get("pipeline")
+            key = shape_id(item["database"], name, command.get(name), shape(filter), shape(sort), shape(pipeline))
+            explain_command = {field: value for field, value in command.items() if not field.startswith("$") and field not in COMMAND_ENVELOPE}
+            client = self.storage.shared.client
+            entry.update(
+                database=item["database"],
+                collection=command.get(name),
+                command=name,
+                shape=to_text({"filter": shape(filter), "sort": sort, "pipeline": shape(pipeline)}),
+                filter=to_text(filter),
+                sort=to_text(sort),
+                pipeline=to_text(pipeline),
+                plan=self._plan(key, lambda: mongo_plan(
+                    client[item["database"]].command({"explain": explain_command, "verbosity": "queryPlanner"})
+                )),
+            )
+        else:
+            sql = item["sql"]
+            match = SQL_TABLE_PATTERN.search(sql)
+            table = match.group(1) if match else None
+            key = shape_id(item["studio"], sql)
+            target = self.storage.shared if table in SHARED_COLLECTIONS else self.storage.for_studio(item["studio"])
+            entry.update(
+                collection=table,
+                command=sql.split(None, 1)[0].upper(),
+                shape=sql[:MAX_TEXT],
+                filter=sql[:MAX_TEXT],
+                sort=None,
+                pipeline=None,
+                # Parameters are not passed to the hook; the plan does not depend on their values
+                plan=self._plan(key, lambda: sqlite_plan(target.fetch("EXPLAIN QUERY PLAN " + sql, [None] * sql.count("?")))),
+            )
+
+        entry["shape_id"] = key
+        self.collection.insert_one(entry)
+        metrics.inc("slow_queries", route=route, collection=entry["collection"] or "unknown")
+
+        if self.storage.shared.name == "sqlite":
+            self._inserted += 1
+            if self._inserted % 100 == 0:
+                self._trim()
+
+    def _trim(self):
+        excess = self.collection.count_documents({}) - SLOW_QUERY_KEEP
+        if excess > 0:
+            oldest = [doc["_id"] for doc in self.collection.find({}, {"_id": 1}).sort("at", 1).limit(excess)]
+            self.collection.delete_many({"_id": {"$in": oldest}})
+
+    # Reading
+
+    def summary(self, studio, hours=24, limit=20):
+        # Worst shapes first, by total time spent in them
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+        shapes = {}
+        for entry in self.collection.find({"studio": studio, "at": {"$gte": since}}).sort("at", 1):
+            group = shapes.get(entry["shape_id"])
+            if group is None:
+                group = shapes[entry["shape_id"]] = {
+                    "shape_id": entry["shape_id"],
+                    "collection": entry.get("collection"),
+                    "command": entry.get("command"),
+                    "shape": entry.get("shape"),
+                    "routes": [],
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                }
+            group["count"] += 1
+            group["total_ms"] += entry["duration_ms"]
+            group["max_ms"] = max(group["max_ms"], entry["duration_ms"])
+            if entry["route"] not in group["routes"]:
+                group["routes"].append(entry["route"])
+            # Entries are oldest first, so these end up as the latest
+            group["last_seen"] = entry["at"]
+            group["example"] = {"filter": entry.get("filter"), "sort": entry.get("sort"), "pipeline": entry.get("pipeline")}
+            group["plan"] = entry.get("plan")
+            group["collscan"] = bool((entry.get("plan") or {}).get("collscan"))
+
+        worst = sorted(shapes.values(), key=lambda group: group["total_ms"], reverse=True)[:limit]
+        for group in worst:
+            group["total_ms"] = round(group["total_ms"], 3)
+            group["avg_ms"] = round(group["total_ms"] / group["count"], 3)
+        return {
+            "threshold_ms": self.threshold_ms,
+            "since": since.isoformat(),
+            "shapes_seen": len(shapes),
+            "collscan_shapes": sum(1 for group in shapes.values() if group["collscan"]),
+            "shapes": worst,
+        }
+
+
+slow_log = SlowQueryLog()
+
+
+class SlowCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        slow_log.command_started(event)
+
+    def succeeded(self, event):
+        slow_log.command_finished(event)
+
+    def failed(self, event):
+        slow_log.command_failed(event)
+
+
+# Must be registered before any MongoClient is created
+if SLOW_QUERY_LOG_ENABLED:
+    monitoring.register(SlowCommandListener())
+
+
+class SlowQueryMiddleware:
+    # Remembers the request's scope so recorded commands carry their route
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _scope.reset(token)
@@ -0,0 +1,676 @@
+# Storage backends - server.py talks to collection objects with the pymongo
+# interface, and STORAGE_BACKEND picks which engine provides them:
+#   mongo  - MongoDB via pymongo (default)
+#   sqlite - an embedded SQLite file for tests and single-node installs
+#
+# Each studio keeps its data in its own database (see tenancy.py); the default
+# studio uses DATABASE_NAME itself. Scripts work on one studio's data when
+# STUDIO is set.
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+
+DEFAULT_STUDIO = os.getenv("DEFAULT_STUDIO", "default")
+# Studio ids become part of database and file names
+STUDIO_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+
+def check_studio(studio):
+    if not STUDIO_PATTERN.match(studio or ""):
+        raise ValueError(f"Invalid studio id: {studio!r}")
+    return studio
+
+
+def studio_database_name(database_name, studio):
+    if studio in (None, DEFAULT_STUDIO):
+        return database_name
+    return f"{database_name}_{check_studio(studio)}"
+
+
+def studio_sqlite_path(path, studio):
+    # A file next to the default studio's
+    if studio in (None, DEFAULT_STUDIO):
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}_{check_studio(studio)}{extension}"
+
+
+def studio_directory(directory, studio):
+    # Where a studio keeps files (archives, backups) under a shared directory
+    if studio in (None, DEFAULT_STUDIO):
+        return directory
+    return os.path.join(directory, "studios", check_studio(studio))
+
+
+class MongoStorage:
+    name = "mongo"
+
+    def __init__(self, url, database_name, studio=DEFAULT_STUDIO, client=None):
+        from pymongo import MongoClient
+
+        # Studios share one client, and so one connection pool per server
+        self.client = client or MongoClient(url)
+        self.database_name = database_name
+        self.studio = studio
+        self.db = self.client[studio_database_name(database_name, studio)]
+        self._supports_transactions = None
+
+    def for_studio(self, studio):
+        storage = MongoStorage(None, self.database_name, studio, client=self.client)
+        storage._supports_transactions = self._supports_transactions
+        return storage
+
+    def collection(self, name, read_preference=None):
+        if read_preference is None:
+            return self.db[name]
+        return self.db.get_collection(name, read_preference=read_preference)
+
+    def collection_names(self):
+        return sorted(name for name in self.db.list_collection_names() if not name.startswith("system."))
+
+    def supports_transactions(self):
+        # Multi-document transactions need a replica set or a sharded cluster
+        if self._supports_transactions is None:
+            hello = self.client.admin.command("hello")
+            self._supports_transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        return self._supports_transactions
+
+    def with_transaction(self, callback):
+        # Runs callback(session) in a transaction and returns its result. Concurrent
+        # writes to the same documents abort with TransientTransactionError, and a
+        # commit can end with UnknownTransactionCommitResult; pymongo's
+        # with_transaction retries both, so callback may run more than once. A
+        # standalone server has no transactions: callback gets None and each
+        # operation stands alone
+        if not self.supports_transactions():
+            return callback(None)
+        with self.client.start_session() as session:
+            return session.with_transaction(callback)
+
+
+# SQLite keeps each collection as a table of JSON documents. Datetimes are stored
+# as fixed-width UTC strings behind a prefix, so range filters and sorts on them
+# compare correctly as text and they decode back to datetimes.
+DATETIME_PREFIX = "$dt:"
+NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+PATH_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+DATE_FORMAT_LENGTHS = {"%Y": 4, "%Y-%m": 7, "%Y-%m-%d": 10}
+# One column of a CREATE INDEX statement written by create_index
+INDEX_COLUMN_PATTERN = re.compile(r"(?:json_extract\(doc, '\$\.([^']+)'\)|_id)( DESC)?")
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        # MongoDB keeps millisecond precision, so does this
+        return DATETIME_PREFIX + value.isoformat(timespec="milliseconds")
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+def _decode(value):
+    if isinstance(value, str) and value.startswith(DATETIME_PREFIX):
+        # Naive UTC, the same as pymongo returns
+        return datetime.fromisoformat(value[len(DATETIME_PREFIX):])
+    if isinstance(value, dict):
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _field(path):
+    if path == "_id":
+        return "_id"
+    if not PATH_PATTERN.match(path):
+        raise ValueError(f"Unsupported field path: {path}")
+    return f"json_extract(doc, '$.{path}')"
+
+
+def _compare(expr, op, value, params):
+    value = _encode(value)
+    if op == "$eq":
+        if value is None:
+            return f"{expr} IS NULL"
+        params.append(value)
+        return f"{expr} = ?"
+    if op == "$ne":
+        if value is None:
+            return f"{expr} IS NOT NULL"
+        params.append(value)
+        return f"({expr} IS NULL OR {expr} != ?)"
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        params.append(value)
+        return f"{expr} {({'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='})[op]} ?"
+    if op in ("$in", "$nin"):
+        values = list(value)
+        if not values:
+            return "0" if op == "$in" else "1"
+        params.extend(values)
+        placeholders = ", ".join("?" for _ in values)
+        if op == "$in":
+            return f"{expr} IN ({placeholders})"
+        return f"({expr} IS NULL OR {expr} NOT IN ({placeholders}))"
+    if op == "$exists":
+        if expr == "_id":
+            return "1" if value else "0"
+        path = expr[len("json_extract(doc, "):-1]
+        return f"json_type(doc, {path}) IS {'NOT ' if value else ''}NULL"
+    raise NotImplementedError(f"SQLite storage does not support the {op} query operator")
+
+
+def _where(query, params):
+    clauses = []
+    for key, condition in (query or {}).items():
+        if key in ("$and", "$or"):
+            parts = [_where(sub_query, params) for sub_query in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(parts or ["1"]) + ")")
+            continue
+        expr = _field(key)
+        if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            for op, value in condition.items():
+                clauses.append(_compare(expr, op, value, params))
+        elif isinstance(condition, (dict, list)):
+            raise NotImplementedError("SQLite storage only matches scalar values")
+        else:
+            clauses.append(_compare(expr, "$eq", condition, params))
+    return " AND ".join(clauses) or "1"
+
+
+def _get_path(doc, path, default=None):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return default
+        doc = doc[part]
+    return doc
+
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _apply_update(doc, update, inserting=False):
+    if isinstance(update, list):
+        # Update pipelines - only $set/$unset with plain "$field" references
+        for stage in update:
+            for op, spec in stage.items():
+                if op in ("$set", "$addFields"):
+                    for path, value in spec.items():
+                        if isinstance(value, str) and value.startswith("$"):
+                            value = _get_path(doc, value[1:])
+                        _set_path(doc, path, value)
+                elif op == "$unset":
+                    for path in ([spec] if isinstance(spec, str) else spec):
+                        _unset_path(doc, path)
+                else:
+                    raise NotImplementedError(f"SQLite storage does not support the {op} pipeline stage in updates")
+        return
+
+    for op, spec in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            for path, value in spec.items():
+                _set_path(doc, path, value)
+        elif op == "$setOnInsert":
+            continue
+        elif op == "$inc":
+            for path, amount in spec.items():
+                _set_path(doc, path, (_get_path(doc, path) or 0) + amount)
+        elif op == "$unset":
+            for path in spec:
+                _unset_path(doc, path)
+        elif op in ("$min", "$max"):
+            for path, value in spec.items():
+                current = _get_path(doc, path)
+                if current is None or (value < current if op == "$min" else value > current):
+                    _set_path(doc, path, value)
+        else:
+            raise NotImplementedError(f"SQLite storage does not support the {op} update operator")
+
+
+def _project(doc, projection):
+    if not projection:
+        return doc
+    included = {key for key, flag in projection.items() if flag}
+    if included:
+        result = {key: doc[key] for key in included if key in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {key: value for key, value in doc.items() if key not in projection}
+
+
+def _sort_spec(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return list(key_or_list)
+
+
+class SQLiteCursor:
+    def __init__(self, collection, query, projection=None, sort=None, limit=0, skip=0):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort = _sort_spec(sort) if sort else []
+        self._limit = limit
+        self._skip = skip
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _sort_spec(key_or_list, direction)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def batch_size(self, size):
+        # Rows come from a single fetch
+        return self
+
+    def __iter__(self):
+        params = []
+        sql = f'SELECT _id, doc FROM "{self.collection.name}" WHERE {_where(self.query, params)}'
+        if self._sort:
+            sql += " ORDER BY " + ", ".join(
+                f"{_field(path)} {'DESC' if direction == -1 else 'ASC'}" for path, direction in self._sort
+            )
+        if self._limit or self._skip:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([self._limit or -1, self._skip])
+        for row in self.collection.storage.fetch(sql, params):
+            yield _project(self.collection.load(row), self.projection)
+
+
+class SQLiteCollection:
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+
+    def load(self, row):
+        doc = _decode(json.loads(row[1]))
+        doc["_id"] = _decode(row[0])
+        return doc
+
+    def dump(self, doc):
+        body = {key: value for key, value in doc.items() if key != "_id"}
+        return json.dumps(_encode(body), separators=(",", ":"))
+
+    # Reads - session is accepted for pymongo compatibility; transactions come
+    # from SQLiteStorage.with_transaction()
+
+    def find(self, filter=None, projection=None, sort=None, limit=0, skip=0, session=None):
+        return SQLiteCursor(self, filter, projection, sort, limit, skip)
+
+    def find_one(self, filter=None, projection=None, sort=None, session=None):
+        for doc in self.find(filter, projection, sort, limit=1):
+            return doc
+        return None
+
+    def count_documents(self, filter, session=None):
+        params = []
+        sql = f'SELECT COUNT(*) FROM "{self.name}" WHERE {_where(filter, params)}'
+        return self.storage.fetch(sql, params)[0][0]
+
+    def estimated_document_count(self):
+        return self.count_documents({})
+
+    def distinct(self, key, filter=None):
+        params = []
+        sql = f'SELECT DISTINCT {_field(key)} FROM "{self.name}" WHERE {_where(filter, params)}'
+        return [_decode(row[0]) for row in self.storage.fetch(sql, params) if row[0] is not None]
+
+    def aggregate(self, pipeline, **kwargs):
+        return SQLiteAggregation(self, pipeline).run()
+
+    # Writes
+
+    def insert_one(self, document, session=None):
+        with self.storage.write():
+            self._insert(document)
+        return SimpleNamespace(inserted_id=document["_id"], acknowledged=True)
+
+    def insert_many(self, documents, ordered=True, session=None):
+        with self.storage.write():
+            for document in documents:
+                self._insert(document)
+        return SimpleNamespace(inserted_ids=[document["_id"] for document in documents], acknowledged=True)
+
+    def _insert(self, document):
+        # Like pymongo, fill in the caller's _id
+        if "_id" not in document:
+            document["_id"] = str(ObjectId())
+        self.storage.execute(
+            f'INSERT INTO "{self.name}" (_id, doc) VALUES (?, ?)',
+            [_encode(document["_id"]), self.dump(document)]
+        )
+
+    def _update(self, filter, update, upsert, many):
+        matched = 0
+        modified = 0
+        upserted_id = None
+        cursor = self.find(filter, limit=0 if many else 1)
+        for doc in list(cursor):
+            matched += 1
+            before = self.dump(doc)
+            _apply_update(doc, update)
+            after = self.dump(doc)
+            if after != before:
+                modified += 1
+                self.storage.execute(f'UPDATE "{self.name}" SET doc = ? WHERE _id = ?', [after, _encode(doc["_id"])])
+        if not matched and upsert:
+            doc = {
+                key: value for key, value in (filter or {}).items()
+                if not key.startswith("$") and not (isinstance(value, dict) and any(op.startswith("$") for op in value))
+            }
+            _apply_update(doc, update, inserting=True)
+            self._insert(doc)
+            upserted_id = doc["_id"]
+        return SimpleNamespace(matched_count=matched, modified_count=modified, upserted_id=upserted_id, acknowledged=True)
+
+    def update_one(self, filter, update, upsert=False, session=None):
+        with self.storage.write():
+            return self._update(filter, update, upsert, many=False)
+
+    def update_many(self, filter, update, upsert=False, session=None):
+        with self.storage.write():
+            return self._update(filter, update, upsert, many=True)
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False, return_document=False, session=None):
+        # return_document follows pymongo's ReturnDocument: False = BEFORE, True = AFTER
+        with self.storage.write():
+            doc = self.find_one(filter, sort=sort)
+            if doc is None:
+                if upsert:
+                    result = self._update(filter, update, upsert=True, many=False)
+                    if return_document:
+                        return _project(self.find_one({"_id": result.upserted_id}), projection)
+                return None
+            before = dict(doc)
+            self._update({"_id": doc["_id"]}, update, upsert=False, many=False)
+            if return_document:
+                return _project(self.find_one({"_id": doc["_id"]}), projection)
+            return _project(before, projection)
+
+    def _delete(self, filter, many):
+        params = []
+        sql = f'SELECT _id FROM "{self.name}" WHERE {_where(filter, params)}'
+        if not many:
+            sql += " LIMIT 1"
+        return self.storage.execute(f'DELETE FROM "{self.name}" WHERE _id IN ({sql})', params).rowcount
+
+    def delete_one(self, filter, session=None):
+        with self.storage.write():
+            return SimpleNamespace(deleted_count=self._delete(filter, many=False), acknowledged=True)
+
+    def delete_many(self, filter, session=None):
+        with self.storage.write():
+            return SimpleNamespace(deleted_count=self._delete(filter, many=True), acknowledged=True)
+
+    def bulk_write(self, requests, ordered=True, session=None):
+        # Accepts pymongo's InsertOne / UpdateOne / UpdateMany / DeleteOne / DeleteMany
+        result = SimpleNamespace(
+            inserted_count=0, matched_count=0, modified_count=0,
+            deleted_count=0, upserted_count=0, upserted_ids={}, acknowledged=True
+        )
+        with self.storage.write():
+            for index, request in enumerate(requests):
+                kind = type(request).__name__
+                if kind == "InsertOne":
+                    self._insert(request._doc)
+                    result.inserted_count += 1
+                elif kind in ("UpdateOne", "UpdateMany"):
+                    outcome = self._update(request._filter, request._doc, request._upsert, many=kind == "UpdateMany")
+                    result.matched_count += outcome.matched_count
+                    result.modified_count += outcome.modified_count
+                    if outcome.upserted_id is not None:
+                        result.upserted_count += 1
+                        result.upserted_ids[index] = outcome.upserted_id
+                elif kind in ("DeleteOne", "DeleteMany"):
+                    result.deleted_count += self._delete(request._filter, many=kind == "DeleteMany")
+                else:
+                    raise NotImplementedError(f"SQLite storage does not support {kind} in bulk_write")
+        return result
+
+    # Indexes
+
+    def create_index(self, keys, unique=False, **kwargs):
+        spec = _sort_spec(keys, 1)
+        name = kwargs.get("name") or f"ix_{self.name}_" + "_".join(path.replace(".", "_") for path, _ in spec)
+        columns = ", ".join(f"{_field(path)}{' DESC' if direction == -1 else ''}" for path, direction in spec)
+        with self.storage.write():
+            self.storage.execute(
+                f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{name}" ON "{self.name}" ({columns})'
+            )
+        return name
+
+    def index_information(self):
+        # Same shape as pymongo: {name: {"key": [(path, direction)], "unique": bool}}
+        indexes = {}
+        for name, sql in self.storage.fetch(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", [self.name]
+        ):
+            columns = sql[sql.index("(") + 1:sql.rindex(")")]
+            indexes[name] = {
+                "key": [
+                    (path or "_id", -1 if descending else 1)
+                    for path, descending in INDEX_COLUMN_PATTERN.findall(columns)
+                ],
+                "unique": sql.startswith("CREATE UNIQUE"),
+            }
+        return indexes
+
+    def drop(self):
+        # Removes the documents and every index, like pymongo's Collection.drop()
+        with self.storage.write():
+            self.storage.execute(f'DROP TABLE "{self.name}"')
+            self.storage.execute(f'CREATE TABLE "{self.name}" (_id TEXT PRIMARY KEY, doc TEXT NOT NULL)')
+
+
+class SQLiteAggregation:
+    # Runs the report pipelines as one SQL statement:
+    #   [$match] -> $group -> [$sort] -> [$limit]
+    def __init__(self, collection, pipeline):
+        self.collection = collection
+        self.pipeline = list(pipeline)
+
+    def expression(self, value):
+        if isinstance(value, str) and value.startswith("$"):
+            return _field(value[1:])
+        if isinstance(value, dict) and len(value) == 1:
+            op, args = next(iter(value.items()))
+            if op == "$dateToString":
+                length = DATE_FORMAT_LENGTHS.get(args.get("format"))
+                if length is None:
+                    raise NotImplementedError(f"SQLite storage does not support the date format {args.get('format')}")
+                return f"substr({self.expression(args['date'])}, {len(DATETIME_PREFIX) + 1}, {length})"
+            if op in ("$substr", "$substrBytes", "$substrCP"):
+                source, start, length = args
+                return f"substr({self.expression(source)}, {int(start) + 1}, {int(length)})"
+        if value is None or isinstance(value, (int, float)):
+            return "NULL" if value is None else repr(value)
+        raise NotImplementedError(f"SQLite storage does not support the expression {value}")
+
+    def accumulator(self, spec):
+        op, value = next(iter(spec.items()))
+        expr = self.expression(value)
+        if op == "$sum":
+            return f"COALESCE(SUM({expr}), 0)"
+        if op in ("$min", "$max", "$avg"):
+            return f"{op[1:].upper()}({expr})"
+        raise NotImplementedError(f"SQLite storage does not support the {op} accumulator")
+
+    def run(self):
+        stages = self.pipeline
+        params = []
+        where = "1"
+        if stages and "$match" in stages[0]:
+            where = _where(stages[0]["$match"], params)
+            stages = stages[1:]
+        if not stages or "$group" not in stages[0]:
+            raise NotImplementedError("SQLite storage only supports [$match] + $group pipelines")
+
+        group = dict(stages[0]["$group"])
+        group_id = group.pop("_id")
+        if isinstance(group_id, dict) and not any(key.startswith("$") for key in group_id):
+            key_names = list(group_id)
+            key_exprs = [self.expression(group_id[name]) for name in key_names]
+        else:
+            key_names = None
+            key_exprs = [self.expression(group_id)]
+
+        output_names = list(group)
+        select = [f"{expr} AS k{index}" for index, expr in enumerate(key_exprs)]
+        select += [f"{self.accumulator(group[name])} AS a{index}" for index, name in enumerate(output_names)]
+        sql = f'SELECT {", ".join(select)} FROM "{self.collection.name}" WHERE {where}'
+        grouped_keys = [f"k{index}" for index, expr in enumerate(key_exprs) if expr != "NULL"]
+        if grouped_keys:
+            sql += " GROUP BY " + ", ".join(grouped_keys)
+        else:
+            # MongoDB yields no group at all for an empty match
+            sql += " HAVING COUNT(*) > 0"
+
+        results = []
+        for row in self.collection.storage.fetch(sql, params):
+            keys = [_decode(value) for value in row[:len(key_exprs)]]
+            doc = {"_id": dict(zip(key_names, keys)) if key_names else keys[0]}
+            for index, name in enumerate(output_names):
+                doc[name] = _decode(row[len(key_exprs) + index])
+            results.append(doc)
+
+        for stage in stages[1:]:
+            if "$sort" in stage:
+                for path, direction in reversed(list(stage["$sort"].items())):
+                    results.sort(key=lambda doc: (_get_path(doc, path) is not None, _get_path(doc, path)), reverse=direction == -1)
+            elif "$limit" in stage:
+                results = results[:stage["$limit"]]
+            else:
+                raise NotImplementedError(f"SQLite storage does not support the {next(iter(stage))} stage after $group")
+        return iter(results)
+
+
+class SQLiteStorage:
+    name = "sqlite"
+
+    def __init__(self, path, studio=DEFAULT_STUDIO):
+        self.base_path = path
+        self.path = studio_sqlite_path(path, studio)
+        self.studio = studio
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        # One connection shared by every request; writes nest inside write()
+        self.lock = threading.RLock()
+        self.write_depth = 0
+        self.collections = {}
+        # Optional (sql, seconds) callback for per-request profiling
+        self.on_query = None
+
+    def collection(self, name, read_preference=None):
+        # Single node - read preferences do not apply
+        if name not in self.collections:
+            if not NAME_PATTERN.match(name):
+                raise ValueError(f"Invalid collection name: {name}")
+            with self.lock:
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (_id TEXT PRIMARY KEY, doc TEXT NOT NULL)')
+            self.collections[name] = SQLiteCollection(self, name)
+        return self.collections[name]
+
+    def for_studio(self, studio):
+        # Each studio's file has its own connection
+        storage = SQLiteStorage(self.base_path, studio)
+        storage.on_query = self.on_query
+        return storage
+
+    def collection_names(self):
+        rows = self.fetch("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")
+        return [row[0] for row in rows]
+
+    @contextmanager
+    def write(self):
+        with self.lock:
+            outermost = self.write_depth == 0
+            if outermost:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self.write_depth += 1
+            try:
+                yield
+            except BaseException:
+                self.write_depth -= 1
+                if outermost:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self.write_depth -= 1
+            if outermost:
+                self.conn.execute("COMMIT")
+
+    def supports_transactions(self):
+        return True
+
+    def with_transaction(self, callback):
+        # Same interface as MongoStorage.with_transaction(). Writes are serialized
+        # by the lock, so there are no conflicts to retry and no session object
+        with self.write():
+            return callback(None)
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            if self.on_query is None:
+                return self.conn.execute(sql, params)
+            started = time.perf_counter()
+            try:
+                return self.conn.execute(sql, params)
+            finally:
+                self.on_query(sql, time.perf_counter() - started)
+
+    def fetch(self, sql, params=()):
+        with self.lock:
+            if self.on_query is None:
+                return self.conn.execute(sql, params).fetchall()
+            started = time.perf_counter()
+            try:
+                return self.conn.execute(sql, params).fetchall()
+            finally:
+                self.on_query(sql, time.perf_counter() - started)
+
+
+def open_storage(studio=None):
+    backend = os.getenv("STORAGE_BACKEND", "mongo")
+    database_name = os.getenv("DATABASE_NAME", "finance_tracker")
+    studio = studio or os.getenv("STUDIO") or DEFAULT_STUDIO
+    if backend == "mongo":
+        return MongoStorage(os.getenv("MONGO_URL", "mongodb://localhost:27017/"), database_name, check_studio(studio))
+    if backend == "sqlite":
+        return SQLiteStorage(os.getenv("SQLITE_PATH", f"{database_name}.sqlite3"), check_studio(studio))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,131 @@
+# Deterministic synthetic ledgers for benchmarks and load tests.
+#
+# The same (years, partners, sales_per_month, seed) always produces the same
+# documents, so timings from different runs are comparable.
+import random
+import uuid
+from datetime import date, datetime, timezone
+
+from migrate_dates import to_date_at, MIGRATION_ID as DATE_MIGRATION_ID
+import rollups
+
+SHOOT_TYPES = ["Pre-Wedding", "Baby", "Half-Saree", "Maternity", "Post-Wedding", "Model", "Family"]
+EXPENSE_TYPES = ["ADVANCE/SALARY", "EQUIPMENT", "FOOD", "FUEL", "POWER BILL", "PROPS", "REPAIR & MAINTENANCE", "TRANSPORT", "WI-FI"]
+CAMERAMEN = ["Ravi", "Kiran", "Suresh", "Mahesh", "Praveen", "Naveen"]
+CITIES = ["Hyderabad", "Vijayawada", "Warangal", "Guntur", "Visakhapatnam"]
+STAFF = ["Silar", "Om", "Anurag", "RK", "Vijay"]
+PAYMENT_MODES = ["Cash", "UPI", "Online"]
+
+LEDGER_NAMES = ["sales", "expenses", "partner_payments", "investments"]
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _timestamp(date_str, rng):
+    day = datetime.strptime(date_str, "%Y-%m-%d")
+    return day.replace(hour=rng.randrange(9, 21), minute=rng.randrange(60), tzinfo=timezone.utc)
+
+
+def _month_days(year, month):
+    if month == 12:
+        return (date(year + 1, 1, 1) - date(year, 12, 1)).days
+    return (date(year, month + 1, 1) - date(year, month, 1)).days
+
+
+def generate(years=1, partners=5, sales_per_month=40, end_year=None, seed=42):
+    rng = random.Random(seed)
+    end_year = end_year or datetime.now().year
+    first_year = end_year - years + 1
+
+    # Decreasing shares that add up to exactly 100
+    weights = [1 / (index + 1) ** 1.5 for index in range(partners)]
+    shares = [round(100 * weight / sum(weights), 2) for weight in weights]
+    shares[0] = round(100 - sum(shares[1:]), 2)
+    partner_docs = [{
+        "id": _uuid(rng),
+        "name": STAFF[index] if index < len(STAFF) else f"Partner {index + 1}",
+        "share_percentage": shares[index],
+        "capital_invested": 0.0,
+        "created_at": datetime(first_year, 1, 1, tzinfo=timezone.utc),
+    } for index in range(partners)]
+
+    dataset = {"partners": partner_docs, "sales": [], "expenses": [], "partner_payments": [], "investments": []}
+
+    for partner in partner_docs:
+        amount = float(rng.randrange(100, 5000) * 1000)
+        partner["capital_invested"] = amount
+        date_str = f"{first_year}-01-01"
+        created_at = _timestamp(date_str, rng)
+        dataset["investments"].append({
+            "id": _uuid(rng), "date": date_str, "date_at": to_date_at(date_str),
+            "partner_id": partner["id"], "partner_name": partner["name"], "amount_inr": amount,
+            "description": "Initial investment", "created_at": created_at, "updated_at": created_at,
+        })
+
+    shoot_id = 0
+    for year in range(first_year, end_year + 1):
+        for month in range(1, 13):
+            days = _month_days(year, month)
+
+            for _ in range(rng.randint(sales_per_month // 2, sales_per_month * 3 // 2)):
+                shoot_id += 1
+                date_str = f"{year}-{str(month).zfill(2)}-{str(rng.randint(1, days)).zfill(2)}"
+                hours = rng.choice([1, 1.5, 2, 3, 4, 6, 8])
+                created_at = _timestamp(date_str, rng)
+                dataset["sales"].append({
+                    "id": _uuid(rng), "shoot_id": shoot_id, "date": date_str, "date_at": to_date_at(date_str),
+                    "shoot_type": rng.choice(SHOOT_TYPES), "total_time_hrs": hours,
+                    "total_amount_inr": float(int(hours * rng.randrange(2000, 6000))),
+                    "received_by": rng.choice(STAFF), "payment_mode": rng.choice(PAYMENT_MODES),
+                    "cameraman": rng.choice(CAMERAMEN), "cameraman_mobile": f"9{rng.randrange(10**8, 10**9)}",
+                    "customer_name": f"Customer {rng.randrange(10000)}", "city": rng.choice(CITIES),
+                    "created_at": created_at, "updated_at": created_at,
+                })
+
+            for _ in range(rng.randint(sales_per_month // 4, sales_per_month * 3 // 4)):
+                date_str = f"{year}-{str(month).zfill(2)}-{str(rng.randint(1, days)).zfill(2)}"
+                created_at = _timestamp(date_str, rng)
+                dataset["expenses"].append({
+                    "id": _uuid(rng), "date": date_str, "date_at": to_date_at(date_str),
+                    "expense_type": rng.choice(EXPENSE_TYPES), "amount_inr": float(rng.randrange(200, 30000)),
+                    "description": None, "paid_by": rng.choice(STAFF), "payment_mode": rng.choice(PAYMENT_MODES),
+                    "created_at": created_at, "updated_at": created_at,
+                })
+
+            for partner in partner_docs:
+                date_str = f"{year}-{str(month).zfill(2)}-{str(min(days, 5)).zfill(2)}"
+                created_at = _timestamp(date_str, rng)
+                dataset["partner_payments"].append({
+                    "id": _uuid(rng), "date": date_str, "date_at": to_date_at(date_str),
+                    "partner_id": partner["id"], "partner_name": partner["name"],
+                    "amount_inr": float(rng.randrange(1000, 20000) * partner["share_percentage"] // 10),
+                    "month_year": f"{year}-{str(month).zfill(2)}", "payment_mode": rng.choice(PAYMENT_MODES),
+                    "description": None, "created_at": created_at, "updated_at": created_at,
+                })
+
+    return dataset
+
+
+def load(storage, dataset, batch_size=1000):
+    # Replaces partners and ledgers with the dataset, marks dates as migrated
+    # and rebuilds the rollups
+    for name in ["partners"] + LEDGER_NAMES:
+        collection = storage.collection(name)
+        collection.delete_many({})
+        documents = [dict(doc) for doc in dataset[name]]
+        for start in range(0, len(documents), batch_size):
+            collection.insert_many(documents[start:start + batch_size])
+
+    storage.collection("migrations").update_one(
+        {"_id": DATE_MIGRATION_ID}, {"$set": {"status": "complete"}}, upsert=True
+    )
+    rollups.rebuild(storage)
+    versions = storage.collection("collection_versions")
+    for name in ["partners"] + LEDGER_NAMES:
+        versions.update_one({"_id": name}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def summary(dataset):
+    return {name: len(documents) for name, documents in dataset.items()}
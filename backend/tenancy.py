@@ -0,0 +1,182 @@
+# Multi-studio tenancy - one deployment serves several studios. Users, their
+# sessions and the studio registry live in the shared (default studio's)
+# database; every other collection is partitioned into a database per studio
+# (DATABASE_NAME_<studio>, or a sibling SQLite file), so queries and indexes
+# need no tenant key and one studio's load never scans another's data.
+#
+# get_current_user resolves the studio from the session's user and activates it
+# for the rest of the request. Collections handed out by TenantStorage look up
+# the active studio on every call, so module-level collections in server.py and
+# helper modules that take a storage work unchanged.
+#
+#   python tenancy.py list
+#   python tenancy.py add north --name "North Studio" --owner owner@north.example \
+#       --partner "Asha:60:500000" --partner "Ravi:40:300000"
+import argparse
+import contextvars
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from storage import DEFAULT_STUDIO, check_studio, open_storage
+
+STUDIOS_COLLECTION = "studios"
+SHARED_COLLECTIONS = {"users", "user_sessions", STUDIOS_COLLECTION}
+
+current_studio = contextvars.ContextVar("studio", default=DEFAULT_STUDIO)
+
+
+@contextmanager
+def use_studio(studio):
+    token = current_studio.set(check_studio(studio))
+    try:
+        yield
+    finally:
+        current_studio.reset(token)
+
+
+class StudioCollection:
+    # Stands in for a collection and forwards each call to the active studio's copy
+    def __init__(self, tenants, name, read_preference=None):
+        self.tenants = tenants
+        self.name = name
+        self.read_preference = read_preference
+
+    def __getattr__(self, attribute):
+        return getattr(self.tenants.resolve(self.name, self.read_preference), attribute)
+
+
+class TenantStorage:
+    def __init__(self, shared):
+        self.shared = shared
+        self.name = shared.name
+        self._lock = threading.Lock()
+        # Opened on first use; MongoDB studios share the shared storage's client
+        # and connection pool, SQLite studios each get a connection to their file
+        self._studios = {shared.studio: shared}
+        self._prepared = set()
+        # Called once per studio and process, with the studio active - creates
+        # indexes and seeds partners for studios added since the last start
+        self.prepare = None
+
+    @property
+    def studio(self):
+        return current_studio.get()
+
+    @property
+    def on_query(self):
+        return self.shared.on_query
+
+    @on_query.setter
+    def on_query(self, callback):
+        with self._lock:
+            for storage in self._studios.values():
+                storage.on_query = callback
+
+    def for_studio(self, studio):
+        with self._lock:
+            if studio not in self._studios:
+                self._studios[studio] = self.shared.for_studio(studio)
+            return self._studios[studio]
+
+    def current(self):
+        return self.for_studio(current_studio.get())
+
+    def activate(self, studio):
+        current_studio.set(check_studio(studio))
+        with self._lock:
+            first_use = studio not in self._prepared
+            self._prepared.add(studio)
+        if first_use and self.prepare:
+            try:
+                self.prepare()
+            except Exception:
+                self._prepared.discard(studio)
+                raise
+
+    def prepared_studios(self):
+        # Studios this process has served since it started
+        with self._lock:
+            return sorted(self._prepared)
+
+    # Storage interface
+
+    def collection(self, name, read_preference=None):
+        return StudioCollection(self, name, read_preference)
+
+    def resolve(self, name, read_preference=None):
+        storage = self.shared if name in SHARED_COLLECTIONS else self.current()
+        return storage.collection(name, read_preference=read_preference)
+
+    def collection_names(self):
+        return self.current().collection_names()
+
+    def supports_transactions(self):
+        return self.current().supports_transactions()
+
+    def with_transaction(self, callback):
+        return self.current().with_transaction(callback)
+
+
+def studio_partners(storage, studio):
+    # Partners a new studio starts with, from its registry entry
+    doc = storage.collection(STUDIOS_COLLECTION).find_one({"_id": studio})
+    return (doc or {}).get("partners", [])
+
+
+def parse_partner(value):
+    # "Name:share_percentage:capital_invested"
+    name, share, capital = value.rsplit(":", 2)
+    return {"name": name, "share_percentage": float(share), "capital_invested": float(capital)}
+
+
+def add_studio(storage, studio, name, owner_email=None, partners=()):
+    check_studio(studio)
+    studios = storage.collection(STUDIOS_COLLECTION)
+    if studio == DEFAULT_STUDIO or studios.find_one({"_id": studio}):
+        raise ValueError(f"Studio {studio} already exists")
+    users = storage.collection("users")
+    if owner_email and users.find_one({"email": owner_email}):
+        raise ValueError(f"{owner_email} already belongs to a studio")
+
+    now = datetime.now(timezone.utc)
+    studios.insert_one({"_id": studio, "name": name, "partners": list(partners), "created_at": now})
+    if owner_email:
+        users.insert_one({
+            "id": str(uuid.uuid4()),
+            "email": owner_email,
+            "name": owner_email.split("@")[0],
+            "picture": None,
+            "role": "OWNER",
+            "user_type": "owner",
+            "studio_id": studio,
+            "created_at": now,
+        })
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Manage studios")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("list")
+    add = subcommands.add_parser("add")
+    add.add_argument("studio", help="id used in database names: lowercase letters, digits, - and _")
+    add.add_argument("--name", required=True)
+    add.add_argument("--owner", help="email of the studio's first owner")
+    add.add_argument("--partner", action="append", type=parse_partner, default=[], help="NAME:SHARE:CAPITAL, repeatable")
+    args = parser.parse_args()
+
+    storage = open_storage(DEFAULT_STUDIO)
+    if args.command == "list":
+        users = storage.collection("users")
+        default_users = users.count_documents({"$or": [{"studio_id": DEFAULT_STUDIO}, {"studio_id": {"$exists": False}}]})
+        print(f"{DEFAULT_STUDIO:20} {'(default)':30} {default_users:5} users")
+        for doc in storage.collection(STUDIOS_COLLECTION).find().sort("_id", 1):
+            print(f"{doc['_id']:20} {doc['name']:30} {users.count_documents({'studio_id': doc['_id']}):5} users")
+    else:
+        add_studio(storage, args.studio, args.name, args.owner, args.partner)
+        print(f"✅ Studio {args.studio} added - its database is created on first sign-in")
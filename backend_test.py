@@ -6,12 +6,13 @@ Tests the critical authentication endpoints after the role field fix.
 
 import requests
 import json
+import os
 import sys
 from datetime import datetime, timezone
 import uuid
 
-# Backend URL from environment
-BACKEND_URL = "https://photo-tracker-16.preview.emergentagent.com"
+# Backend URL from environment - point at a local server to test either storage backend
+BACKEND_URL = os.getenv("BACKEND_URL", "https://photo-tracker-16.preview.emergentagent.com")
 
 class AuthenticationTester:
     def __init__(self):
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Storage Backend Conformance Testing for Photography Studio Finance Tracker
+Runs the same collection operations the server relies on against every
+storage backend (embedded SQLite always, MongoDB when MONGO_URL is reachable).
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from pymongo import DESCENDING, UpdateOne, InsertOne, ReturnDocument
+from storage import MongoStorage, SQLiteStorage
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/")
+TEST_DATABASE = "finance_tracker_storage_test"
+
+
+def day(date_str):
+    return datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+class StorageTester:
+    def __init__(self, storage):
+        self.storage = storage
+        self.test_results = []
+
+    def log_test(self, test_name, success, details):
+        """Log test results"""
+        self.test_results.append({"backend": self.storage.name, "test": test_name, "success": success, "details": details})
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status} [{self.storage.name}] {test_name}: {details}")
+
+    def check(self, test_name, actual, expected):
+        if actual == expected:
+            self.log_test(test_name, True, f"{actual!r}")
+        else:
+            self.log_test(test_name, False, f"expected {expected!r}, got {actual!r}")
+
+    def seed_sales(self):
+        sales = self.storage.collection("sales")
+        sales.delete_many({})
+        now = datetime.now(timezone.utc)
+        for shoot_id, (date_str, amount, deleted) in enumerate([
+            ("2025-01-15", 1000, False),
+            ("2025-01-31", 2500, False),
+            ("2025-02-01", 400, False),
+            ("2025-02-10", 9999, True),
+            ("2025-12-31", 700, False),
+            ("2026-01-01", 50, False),
+        ], start=1):
+            doc = {
+                "id": f"sale-{shoot_id}",
+                "shoot_id": shoot_id,
+                "date": date_str,
+                "date_at": day(date_str),
+                "total_amount_inr": amount,
+                "created_at": now,
+                "updated_at": now + timedelta(seconds=shoot_id)
+            }
+            if deleted:
+                doc["deleted"] = True
+            sales.insert_one(doc)
+        return sales
+
+    def test_find(self):
+        sales = self.seed_sales()
+        live = {"deleted": {"$ne": True}}
+
+        self.check("Find all live", len(list(sales.find(live))), 5)
+        self.check("Sort descending", [s["shoot_id"] for s in sales.find(live).sort("date", DESCENDING).limit(2)], [6, 5])
+        self.check("find_one with sort", sales.find_one(sort=[("shoot_id", DESCENDING)])["shoot_id"], 6)
+        self.check("String range", len(list(sales.find({**live, "date": {"$gte": "2025-01-01", "$lt": "2025-02-01"}}))), 2)
+        self.check("Datetime range", len(list(sales.find({**live, "date_at": {"$gte": day("2025-02-01"), "$lt": day("2026-01-01")}}))), 2)
+        self.check("$in / $nin", len(list(sales.find({"shoot_id": {"$in": [1, 2, 3]}, "id": {"$nin": ["sale-1"]}}))), 2)
+        self.check("$exists", sales.count_documents({"deleted": {"$exists": True}}), 1)
+        self.check("Datetime round trip", type(sales.find_one({"id": "sale-1"})["date_at"]).__name__, "datetime")
+        self.check("Projection", sorted(sales.find_one({"id": "sale-1"}, {"date": 1}).keys()), ["_id", "date"])
+
+    def test_updates(self):
+        sales = self.seed_sales()
+
+        result = sales.update_one({"id": "sale-1"}, {"$set": {"total_amount_inr": 1100}})
+        self.check("update_one $set", (result.matched_count, result.modified_count), (1, 1))
+        self.check("update_one unchanged", sales.update_one({"id": "sale-1"}, {"$set": {"total_amount_inr": 1100}}).modified_count, 0)
+
+        partners = self.storage.collection("partners")
+        partners.delete_many({})
+        partners.insert_one({"id": "p1", "capital_invested": 100.0})
+        partners.update_one({"id": "p1"}, {"$inc": {"capital_invested": 50.0}})
+        self.check("$inc", partners.find_one({"id": "p1"})["capital_invested"], 150.0)
+
+        versions = self.storage.collection("collection_versions")
+        versions.delete_many({})
+        for _ in range(2):
+            versions.update_one({"_id": "sales"}, {"$inc": {"version": 1}}, upsert=True)
+        self.check("Upsert with $inc", versions.find_one({"_id": "sales"})["version"], 2)
+
+        sales.update_many({}, {"$unset": {"updated_at": ""}})
+        sales.update_many({"updated_at": {"$exists": False}}, [{"$set": {"updated_at": "$created_at"}}])
+        self.check("Pipeline update", sales.count_documents({"updated_at": {"$exists": False}}), 0)
+
+        before = sales.find_one_and_update({"id": "sale-2", "deleted": {"$ne": True}}, {"$set": {"deleted": True}})
+        self.check("find_one_and_update returns before", before.get("deleted"), None)
+        after = sales.find_one_and_update({"id": "sale-3"}, {"$set": {"deleted": True}}, return_document=ReturnDocument.AFTER)
+        self.check("find_one_and_update returns after", after.get("deleted"), True)
+
+        result = sales.bulk_write([
+            InsertOne({"id": "sale-7", "shoot_id": 7, "date": "2025-03-01", "total_amount_inr": 10}),
+            UpdateOne({"id": "sale-7"}, {"$set": {"total_amount_inr": 20}}),
+        ])
+        self.check("bulk_write", (result.inserted_count, result.modified_count), (1, 1))
+
+        self.check("delete_one", sales.delete_one({"id": "sale-7"}).deleted_count, 1)
+
+    def test_aggregates(self):
+        sales = self.seed_sales()
+        live = {"deleted": {"$ne": True}}
+
+        by_month = {
+            row["_id"]: (row["total"], row["count"])
+            for row in sales.aggregate([
+                {"$match": {**live, "date_at": {"$gte": day("2025-01-01"), "$lt": day("2026-01-01")}}},
+                {"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m", "date": "$date_at"}},
+                    "total": {"$sum": "$total_amount_inr"},
+                    "count": {"$sum": 1}
+                }}
+            ])
+        }
+        self.check("Group by month (date_at)", by_month, {"2025-01": (3500, 2), "2025-02": (400, 1), "2025-12": (700, 1)})
+
+        by_string = {
+            row["_id"]: row["total"]
+            for row in sales.aggregate([
+                {"$match": {**live, "date": {"$gte": "2025-01-01", "$lt": "2026-01-01"}}},
+                {"$group": {"_id": {"$substrCP": ["$date", 0, 7]}, "total": {"$sum": "$total_amount_inr"}}}
+            ])
+        }
+        self.check("Group by month (date string)", by_string, {"2025-01": 3500, "2025-02": 400, "2025-12": 700})
+
+        empty = list(sales.aggregate([
+            {"$match": {"date": {"$gte": "2030-01-01"}}},
+            {"$group": {"_id": None, "total": {"$sum": "$total_amount_inr"}}}
+        ]))
+        self.check("Empty range", empty, [])
+
+    def run_all_tests(self):
+        self.test_find()
+        self.test_updates()
+        self.test_aggregates()
+        return all(result["success"] for result in self.test_results)
+
+
+def backends():
+    path = os.path.join(tempfile.mkdtemp(), "storage_test.sqlite3")
+    yield SQLiteStorage(path)
+
+    mongo = MongoStorage(MONGO_URL, TEST_DATABASE)
+    try:
+        mongo.client.admin.command("ping")
+    except Exception as e:
+        print(f"⚠️  Skipping MongoDB backend ({MONGO_URL}): {e}")
+        return
+    mongo.client.drop_database(TEST_DATABASE)
+    try:
+        yield mongo
+    finally:
+        mongo.client.drop_database(TEST_DATABASE)
+
+
+def main():
+    """Main test execution"""
+    print("🚀 Starting Storage Backend Tests")
+    print("=" * 60)
+
+    results = []
+    for storage in backends():
+        tester = StorageTester(storage)
+        tester.run_all_tests()
+        results.extend(tester.test_results)
+
+    passed = sum(1 for result in results if result["success"])
+    print("\n" + "=" * 60)
+    print(f"Total Tests: {len(results)}")
+    print(f"Passed: {passed}")
+    print(f"Failed: {len(results) - passed}")
+    print(f"\n🎯 Overall Status: {'✅ ALL TESTS PASSED' if passed == len(results) else '❌ SOME TESTS FAILED'}")
+
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/bin/bash
+
+# Starts a local three-member replica set, runs the backend with report reads
+# routed to secondaries and list reads kept on the primary, and checks the
+# routing recorded in /api/metrics.
+
+RS_DIR=${RS_DIR:-/tmp/finance_rs}
+RS_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+
+echo "=== Finance Tracker Replica Set Test ==="
+echo ""
+
+# Step 1: Start three mongod members
+echo "1. Starting replica set members..."
+for port in 27017 27018 27019; do
+    mkdir -p "$RS_DIR/$port"
+    mongod --replSet rs0 --port $port --dbpath "$RS_DIR/$port" \
+        --bind_ip localhost --fork --logpath "$RS_DIR/$port.log"
+done
+echo ""
+
+# Step 2: Initiate the replica set
+echo "2. Initiating rs0..."
+mongosh --port 27017 --quiet --eval "
+try {
+    rs.status();
+    print('Replica set already initiated');
+} catch (e) {
+    rs.initiate({
+        _id: 'rs0',
+        members: [
+            {_id: 0, host: 'localhost:27017', priority: 2},
+            {_id: 1, host: 'localhost:27018'},
+            {_id: 2, host: 'localhost:27019'}
+        ]
+    });
+    print('Replica set initiated');
+}
+"
+sleep 10
+echo ""
+
+# Step 3: Start the backend with secondary reads for reports
+echo "3. Starting backend against rs0..."
+cd backend
+MONGO_URL="$RS_URL" \
+REPORT_READ_PREFERENCE=secondaryPreferred \
+LIST_READ_PREFERENCE=primary \
+MAX_STALENESS_SECONDS=90 \
+python server.py &
+SERVER_PID=$!
+cd ..
+sleep 5
+echo ""
+
+# Step 4: Create a test session on the primary
+echo "4. Creating test session..."
+TOKEN=$(mongosh "$RS_URL" --quiet --eval "
+var token = 'test_session_' + Date.now();
+db = db.getSiblingDB('finance_tracker');
+db.users.updateOne(
+    {id: 'test-user-123'},
+    {\$setOnInsert: {id: 'test-user-123', email: 'test@example.com', name: 'Test User', role: 'OWNER', user_type: 'owner', created_at: new Date()}},
+    {upsert: true}
+);
+db.user_sessions.insertOne({
+    user_id: 'test-user-123',
+    session_token: token,
+    expires_at: new Date(Date.now() + 7*24*60*60*1000),
+    created_at: new Date()
+});
+print(token);
+" | tail -1)
+echo "Test session token: $TOKEN"
+echo ""
+
+# Step 5: Read reports and lists, write a sale, then check the routing metrics
+echo "5. Reading reports and lists, writing a sale..."
+curl -s -H "Authorization: Bearer $TOKEN" "http://localhost:8001/api/reports/yearly?year=$(date +%Y)" > /dev/null
+curl -s -H "Authorization: Bearer $TOKEN" http://localhost:8001/api/dashboard/stats > /dev/null
+curl -s -H "Authorization: Bearer $TOKEN" http://localhost:8001/api/sales > /dev/null
+curl -s -H "Authorization: Bearer $TOKEN" -H "Content-Type: application/json" -X POST http://localhost:8001/api/sales \
+    -d "{\"date\": \"$(date +%Y-%m-%d)\", \"shoot_type\": \"Test\", \"total_time_hrs\": 1, \"total_amount_inr\": 100, \"received_by\": \"Test\", \"payment_mode\": \"Cash\"}" > /dev/null
+curl -s -H "Authorization: Bearer $TOKEN" http://localhost:8001/api/sync > /dev/null
+curl -s -H "Authorization: Bearer $TOKEN" http://localhost:8001/api/metrics > "$RS_DIR/metrics.json"
+echo ""
+
+# Step 6: Reports must have read with the secondary preference, lists, sync and
+# writes from the primary
+echo "6. Checking routed reads..."
+python3 - "$RS_DIR/metrics.json" <<'PY'
+import json, sys
+
+reads = json.load(open(sys.argv[1]))["counters"].get("routed_reads", [])
+expected = {
+    "/api/reports/yearly": "secondaryPreferred",
+    "/api/dashboard/stats": "secondaryPreferred",
+    "/api/sales": "primary",
+    "/api/sync": "primary",
+}
+failures = 0
+for route, preference in expected.items():
+    seen = {row["read_preference"] for row in reads if row["route"] == route}
+    ok = seen == {preference}
+    failures += not ok
+    print(f"{'✅ PASS' if ok else '❌ FAIL'} {route}: expected {preference}, got {sorted(seen) or 'no reads'}")
+sys.exit(1 if failures else 0)
+PY
+STATUS=$?
+echo ""
+
+kill $SERVER_PID
+echo "=== Test Complete ==="
+[ $STATUS -eq 0 ] && echo "✅ Read routing as configured" || echo "❌ Read routing does not match the configuration"
+echo "Stop the members with: mongosh --port 27017 --eval 'db.getSiblingDB(\"admin\").shutdownServer()' (repeat for 27018, 27019)"
+exit $STATUS